@@ -0,0 +1,46 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:21
+
+from django.db import migrations, models
+
+
+def number_attempts(apps, schema_editor):
+    # Retries used to add logs for the same campaign and contact, number
+    # them in creation order so the unique constraint holds
+    EmailLog = apps.get_model('analytics', 'EmailLog')
+
+    duplicates = (
+        EmailLog.objects
+        .values('campaign_id', 'contact_id')
+        .annotate(logs=models.Count('id'))
+        .filter(logs__gt=1, campaign_id__isnull=False)
+    )
+    for pair in duplicates.iterator():
+        logs = EmailLog.objects.filter(
+            campaign_id=pair['campaign_id'],
+            contact_id=pair['contact_id']
+        ).order_by('created_at', 'id')
+        for attempt, email_log in enumerate(logs, start=1):
+            if email_log.attempt != attempt:
+                EmailLog.objects.filter(id=email_log.id).update(attempt=attempt)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('campaigns', '0008_campaign_transport'),
+        ('contacts', '0002_contact_last_engaged_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emaillog',
+            name='attempt',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Send attempt of this campaign to this contact'),
+        ),
+        migrations.RunPython(number_attempts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='emaillog',
+            constraint=models.UniqueConstraint(fields=('campaign', 'contact', 'attempt'), name='unique_email_log_attempt'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_emaillog_attempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emaillog',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='When the next attempt of a failed send is due', null=True),
+        ),
+    ]
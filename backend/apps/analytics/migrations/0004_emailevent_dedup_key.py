@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_emaillog_next_retry_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailevent',
+            name='dedup_key',
+            field=models.CharField(blank=True, help_text='SNS MessageId (or SES event identity), one event per notification', max_length=64, null=True, unique=True),
+        ),
+    ]
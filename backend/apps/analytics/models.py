@@ -34,6 +34,10 @@ class EmailLog(models.Model):
         db_index=True,
         help_text="SES message ID"
     )
+    attempt = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Send attempt of this campaign to this contact"
+    )
     subject = models.CharField(max_length=500)
     from_email = models.EmailField()
     to_email = models.EmailField(db_index=True)
@@ -45,6 +49,12 @@ class EmailLog(models.Model):
     )
     error_message = models.TextField(blank=True, null=True)
     sent_at = models.DateTimeField(null=True, blank=True)
+    next_retry_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="When the next attempt of a failed send is due"
+    )
     delivered_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -58,6 +68,13 @@ class EmailLog(models.Model):
             models.Index(fields=['to_email']),
             models.Index(fields=['created_at']),
         ]
+        constraints = [
+            # One log per send attempt, a duplicate send of an attempt fails here
+            models.UniqueConstraint(
+                fields=['campaign', 'contact', 'attempt'],
+                name='unique_email_log_attempt'
+            ),
+        ]
 
     def __str__(self):
         return f"Email to {self.to_email} - {self.status}"
@@ -103,6 +120,13 @@ class EmailEvent(models.Model):
         blank=True,
         help_text="Additional data from SES"
     )
+    dedup_key = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="SNS MessageId (or SES event identity), one event per notification"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
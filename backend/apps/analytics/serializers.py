@@ -21,7 +21,7 @@ class EmailLogSerializer(serializers.ModelSerializer):
         model = EmailLog
         fields = [
             'id', 'campaign', 'campaign_name', 'contact', 'contact_email',
-            'message_id', 'subject', 'from_email', 'to_email', 'status',
+            'message_id', 'attempt', 'subject', 'from_email', 'to_email', 'status',
             'error_message', 'sent_at', 'delivered_at', 'events',
             'created_at', 'updated_at'
         ]
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import EmailLogViewSet, EmailEventViewSet, dashboard_metrics, campaign_analytics
+from .views import EmailLogViewSet, EmailEventViewSet, dashboard_metrics, campaign_analytics, queue_metrics
 
 router = DefaultRouter()
 router.register(r'email-logs', EmailLogViewSet, basename='emaillog')
@@ -10,4 +10,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('analytics/dashboard/', dashboard_metrics, name='dashboard-metrics'),
     path('analytics/campaign/<int:campaign_id>/', campaign_analytics, name='campaign-analytics'),
+    path('analytics/queues/', queue_metrics, name='queue-metrics'),
 ]
@@ -1,6 +1,7 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.conf import settings
 from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
@@ -180,6 +181,7 @@ def campaign_analytics(request, campaign_id):
         'metrics': {
             'total_recipients': campaign.total_recipients,
             'sent_count': campaign.sent_count,
+            'failed_count': campaign.failed_count,
             'delivered_count': campaign.delivered_count,
             'bounce_count': campaign.bounce_count,
             'open_count': campaign.open_count,
@@ -192,3 +194,37 @@ def campaign_analytics(request, campaign_id):
         'events_breakdown': list(events_breakdown),
         'timeline': timeline_data
     })
+
+
+@api_view(['GET'])
+def queue_metrics(request):
+    """Broker queue depth, dispatcher state of the sending campaigns, domain lanes, SES shards and notification backlog"""
+    from apps.core.services import campaign_progress, domain_lanes, sender_pool, ses_notifications
+    from apps.core.services.broker_queues import queue_depths
+
+    sending = Campaign.objects.filter(status='sending').only('id', 'name', 'dispatch_cursor')
+
+    campaigns_data = [{
+        'id': c.id,
+        'name': c.name,
+        'dispatch_cursor': c.dispatch_cursor,
+        'inflight_batches': len(campaign_progress.inflight_batches(c.id)),
+        'remaining_recipients': campaign_progress.remaining(c.id),
+    } for c in sending]
+
+    return Response({
+        'queues': queue_depths(settings.BROKER_MONITORED_QUEUES),
+        'limits': {
+            'send_queue': settings.CAMPAIGN_SEND_QUEUE,
+            'max_queue_depth': settings.CAMPAIGN_DISPATCH_MAX_QUEUE_DEPTH,
+            'lookahead_batches': settings.CAMPAIGN_DISPATCH_LOOKAHEAD,
+            'batch_size': settings.CAMPAIGN_SEND_BATCH_SIZE,
+        },
+        'campaigns': campaigns_data,
+        'lanes': {
+            lane: {**domain_lanes.lane_config(lane), 'active_batches': domain_lanes.active_slots(lane)}
+            for lane in domain_lanes.lanes()
+        },
+        'shards': sender_pool.status(),
+        'ses_notifications': ses_notifications.backlog(),
+    })
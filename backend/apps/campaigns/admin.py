@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Campaign, ScheduledCampaign
+from .models import Campaign, ScheduledCampaign, WarmupPlan
 
 
 @admin.register(Campaign)
@@ -8,7 +8,7 @@ class CampaignAdmin(admin.ModelAdmin):
     list_filter = ['status', 'created_at']
     search_fields = ['name', 'subject']
     readonly_fields = [
-        'sent_count', 'delivered_count', 'bounce_count', 'complaint_count',
+        'sent_count', 'failed_count', 'delivered_count', 'bounce_count', 'complaint_count',
         'open_count', 'click_count', 'started_at', 'completed_at',
         'created_at', 'updated_at'
     ]
@@ -20,3 +20,11 @@ class ScheduledCampaignAdmin(admin.ModelAdmin):
     list_filter = ['is_recurring', 'scheduled_at']
     search_fields = ['campaign__name']
     readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(WarmupPlan)
+class WarmupPlanAdmin(admin.ModelAdmin):
+    list_display = ['domain', 'start_date', 'initial_daily_volume', 'target_daily_volume', 'ramp_days', 'is_active']
+    list_filter = ['is_active']
+    search_fields = ['domain']
+    readonly_fields = ['created_at', 'updated_at']
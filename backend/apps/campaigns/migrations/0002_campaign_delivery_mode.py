@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-16 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='delivery_mode',
+            field=models.CharField(choices=[('individual', 'Individual'), ('bulk_template', 'SES Bulk Template')], default='individual', help_text='bulk_template sends through SES stored templates, 50 recipients per call', max_length=20),
+        ),
+    ]
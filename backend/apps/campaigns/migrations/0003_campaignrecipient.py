@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-16 23:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0002_campaign_delivery_mode'),
+        ('contacts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignRecipient',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('state', models.PositiveSmallIntegerField(choices=[(0, 'Pending'), (1, 'Sent'), (2, 'Failed'), (3, 'Skipped')], default=0)),
+                ('batch', models.PositiveIntegerField(help_text='Batch the recipient is sent in')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='campaigns.campaign')),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='campaign_recipients', to='contacts.contact')),
+            ],
+            options={
+                'db_table': 'campaign_recipients',
+                'indexes': [models.Index(fields=['campaign', 'state', 'batch'], name='campaign_re_campaig_bff8c8_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='campaignrecipient',
+            constraint=models.UniqueConstraint(fields=('campaign', 'contact'), name='unique_campaign_recipient'),
+        ),
+    ]
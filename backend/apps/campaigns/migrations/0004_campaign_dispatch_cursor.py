@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0003_campaignrecipient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='dispatch_cursor',
+            field=models.PositiveIntegerField(default=0, help_text='Next recipient batch to dispatch'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0004_campaign_dispatch_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='max_send_rate',
+            field=models.FloatField(blank=True, help_text='Emails per second this campaign may use at most (empty = no cap)', null=True),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='priority',
+            field=models.CharField(choices=[('low', 'Low'), ('normal', 'Normal'), ('high', 'High')], default='normal', help_text='Share of the send rate when several campaigns send at once', max_length=10),
+        ),
+    ]
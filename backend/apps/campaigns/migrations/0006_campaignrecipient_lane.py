@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0005_campaign_priority_max_send_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaignrecipient',
+            name='lane',
+            field=models.CharField(default='other', help_text='Recipient domain lane', max_length=50),
+        ),
+    ]
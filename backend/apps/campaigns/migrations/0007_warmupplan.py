@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0006_campaignrecipient_lane'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WarmupPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(help_text="Domain of the campaigns' from_email the plan applies to", max_length=255, unique=True)),
+                ('start_date', models.DateField()),
+                ('initial_daily_volume', models.PositiveIntegerField(default=1000)),
+                ('target_daily_volume', models.PositiveIntegerField(default=500000)),
+                ('ramp_days', models.PositiveIntegerField(default=30, help_text='Days to grow from the initial to the target daily volume')),
+                ('sending_hours', models.PositiveSmallIntegerField(default=24, help_text="The day's volume is spread over this many hours (caps each hour)")),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'warmup_plans',
+                'ordering': ['domain'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0007_warmupplan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='transport',
+            field=models.CharField(blank=True, choices=[('ses', 'Amazon SES'), ('smtp', 'SMTP'), ('maildir', 'Maildir (file)'), ('null', 'Null (load testing)')], default='', help_text='Email transport of this campaign (empty = EMAIL_TRANSPORT setting)', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0008_campaign_transport'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='campaignrecipient',
+            name='state',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Pending'), (1, 'Sent'), (2, 'Failed'), (3, 'Skipped'), (4, 'Sending')], default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0009_campaignrecipient_sending_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='failed_count',
+            field=models.IntegerField(default=0, help_text='Recipients whose send failed and was not retried successfully'),
+        ),
+    ]
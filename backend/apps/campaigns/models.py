@@ -1,6 +1,7 @@
 from django.db import models
 from apps.emails.models import EmailTemplate
-from apps.contacts.models import ContactList
+from apps.contacts.models import Contact, ContactList
+from apps.core.services.transports import TRANSPORT_CHOICES
 
 
 class Campaign(models.Model):
@@ -15,6 +16,17 @@ class Campaign(models.Model):
         ('failed', 'Failed'),
     ]
 
+    PRIORITY_CHOICES = [
+        ('low', 'Low'),
+        ('normal', 'Normal'),
+        ('high', 'High'),
+    ]
+
+    DELIVERY_MODE_CHOICES = [
+        ('individual', 'Individual'),
+        ('bulk_template', 'SES Bulk Template'),
+    ]
+
     name = models.CharField(max_length=255)
     subject = models.CharField(max_length=500)
     from_email = models.EmailField()
@@ -35,6 +47,34 @@ class Campaign(models.Model):
         default='draft',
         db_index=True
     )
+    delivery_mode = models.CharField(
+        max_length=20,
+        choices=DELIVERY_MODE_CHOICES,
+        default='individual',
+        help_text="bulk_template sends through SES stored templates, 50 recipients per call"
+    )
+    transport = models.CharField(
+        max_length=20,
+        choices=TRANSPORT_CHOICES,
+        blank=True,
+        default='',
+        help_text="Email transport of this campaign (empty = EMAIL_TRANSPORT setting)"
+    )
+    priority = models.CharField(
+        max_length=10,
+        choices=PRIORITY_CHOICES,
+        default='normal',
+        help_text="Share of the send rate when several campaigns send at once"
+    )
+    max_send_rate = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Emails per second this campaign may use at most (empty = no cap)"
+    )
+    dispatch_cursor = models.PositiveIntegerField(
+        default=0,
+        help_text="Next recipient batch to dispatch"
+    )
     scheduled_at = models.DateTimeField(null=True, blank=True)
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -42,6 +82,7 @@ class Campaign(models.Model):
     # Metrics
     total_recipients = models.IntegerField(default=0)
     sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0, help_text="Recipients whose send failed and was not retried successfully")
     delivered_count = models.IntegerField(default=0)
     bounce_count = models.IntegerField(default=0)
     complaint_count = models.IntegerField(default=0)
@@ -87,6 +128,51 @@ class Campaign(models.Model):
         return (self.bounce_count / self.sent_count) * 100
 
 
+class CampaignRecipient(models.Model):
+    """Recipient snapshot taken when a campaign starts sending"""
+
+    STATE_PENDING = 0
+    STATE_SENT = 1
+    STATE_FAILED = 2
+    STATE_SKIPPED = 3
+    STATE_SENDING = 4
+
+    STATE_CHOICES = [
+        (STATE_PENDING, 'Pending'),
+        (STATE_SENT, 'Sent'),
+        (STATE_FAILED, 'Failed'),
+        (STATE_SKIPPED, 'Skipped'),
+        (STATE_SENDING, 'Sending'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    campaign = models.ForeignKey(
+        Campaign,
+        on_delete=models.CASCADE,
+        related_name='recipients'
+    )
+    contact = models.ForeignKey(
+        Contact,
+        on_delete=models.CASCADE,
+        related_name='campaign_recipients'
+    )
+    state = models.PositiveSmallIntegerField(choices=STATE_CHOICES, default=STATE_PENDING)
+    batch = models.PositiveIntegerField(help_text="Batch the recipient is sent in")
+    lane = models.CharField(max_length=50, default='other', help_text="Recipient domain lane")
+
+    class Meta:
+        db_table = 'campaign_recipients'
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'contact'], name='unique_campaign_recipient'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'state', 'batch']),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign_id}/{self.contact_id} - {self.get_state_display()}"
+
+
 class ScheduledCampaign(models.Model):
     """Scheduled campaign settings"""
 
@@ -114,3 +200,56 @@ class ScheduledCampaign(models.Model):
 
     def __str__(self):
         return f"Schedule for {self.campaign.name}"
+
+
+class WarmupPlan(models.Model):
+    """Warm-up ramp of a new sender domain"""
+
+    domain = models.CharField(
+        max_length=255,
+        unique=True,
+        help_text="Domain of the campaigns' from_email the plan applies to"
+    )
+    start_date = models.DateField()
+    initial_daily_volume = models.PositiveIntegerField(default=1000)
+    target_daily_volume = models.PositiveIntegerField(default=500000)
+    ramp_days = models.PositiveIntegerField(
+        default=30,
+        help_text="Days to grow from the initial to the target daily volume"
+    )
+    sending_hours = models.PositiveSmallIntegerField(
+        default=24,
+        help_text="The day's volume is spread over this many hours (caps each hour)"
+    )
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'warmup_plans'
+        ordering = ['domain']
+
+    def __str__(self):
+        return f"{self.domain} - {self.initial_daily_volume} to {self.target_daily_volume}/day"
+
+    def daily_limit(self, day):
+        """
+        Emails the domain may send on a given date
+
+        Grows geometrically from initial_daily_volume on start_date to
+        target_daily_volume on the last ramp day, and stays there.
+        Nothing is sent before start_date.
+        """
+        elapsed = (day - self.start_date).days
+        if elapsed < 0:
+            return 0
+        if self.ramp_days <= 1 or elapsed >= self.ramp_days - 1:
+            return self.target_daily_volume
+
+        initial = max(self.initial_daily_volume, 1)
+        growth = (self.target_daily_volume / initial) ** (elapsed / (self.ramp_days - 1))
+        return int(initial * growth)
+
+    def hourly_limit(self, day):
+        """Emails the domain may send in one hour of a given date"""
+        return -(-self.daily_limit(day) // max(self.sending_hours, 1))
@@ -1,5 +1,6 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Campaign, ScheduledCampaign
+from .models import Campaign, ScheduledCampaign, WarmupPlan
 from apps.emails.serializers import EmailTemplateSerializer
 from apps.contacts.serializers import ContactListSerializer
 
@@ -17,15 +18,15 @@ class CampaignSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'subject', 'from_email', 'from_name',
             'template', 'template_data', 'contact_list', 'contact_list_data',
-            'status', 'scheduled_at', 'started_at', 'completed_at',
-            'total_recipients', 'sent_count', 'delivered_count',
+            'status', 'delivery_mode', 'transport', 'priority', 'max_send_rate', 'scheduled_at', 'started_at', 'completed_at',
+            'total_recipients', 'sent_count', 'failed_count', 'delivered_count',
             'bounce_count', 'complaint_count', 'open_count', 'click_count',
             'delivery_rate', 'open_rate', 'click_rate', 'bounce_rate',
             'created_at', 'updated_at'
         ]
         read_only_fields = [
             'status', 'started_at', 'completed_at', 'total_recipients',
-            'sent_count', 'delivered_count', 'bounce_count', 'complaint_count',
+            'sent_count', 'failed_count', 'delivered_count', 'bounce_count', 'complaint_count',
             'open_count', 'click_count', 'created_at', 'updated_at'
         ]
 
@@ -49,3 +50,22 @@ class CampaignScheduleSerializer(serializers.Serializer):
     timezone = serializers.CharField(default='UTC')
     is_recurring = serializers.BooleanField(default=False)
     recurrence_rule = serializers.CharField(required=False, allow_blank=True)
+
+
+class WarmupPlanSerializer(serializers.ModelSerializer):
+    today_limit = serializers.SerializerMethodField()
+
+    class Meta:
+        model = WarmupPlan
+        fields = [
+            'id', 'domain', 'start_date', 'initial_daily_volume',
+            'target_daily_volume', 'ramp_days', 'sending_hours',
+            'is_active', 'today_limit', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['created_at', 'updated_at']
+
+    def get_today_limit(self, obj):
+        return obj.daily_limit(timezone.localdate())
+
+    def validate_domain(self, value):
+        return value.strip().lower()
@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CampaignViewSet, ScheduledCampaignViewSet
+from .views import CampaignViewSet, ScheduledCampaignViewSet, WarmupPlanViewSet
 
 router = DefaultRouter()
 router.register(r'campaigns', CampaignViewSet, basename='campaign')
 router.register(r'scheduled-campaigns', ScheduledCampaignViewSet, basename='scheduledcampaign')
+router.register(r'warmup-plans', WarmupPlanViewSet, basename='warmupplan')
 
 urlpatterns = [
     path('', include(router.urls)),
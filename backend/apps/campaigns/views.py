@@ -3,10 +3,12 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db import transaction
 from django.utils import timezone
-from .models import Campaign, ScheduledCampaign
+from apps.core.services import campaign_counters, campaign_progress, send_scheduler, warmup
+from apps.core.services.recipient_snapshot import next_pending_batch, pending_count
+from .models import Campaign, ScheduledCampaign, WarmupPlan
 from .serializers import (
     CampaignSerializer, ScheduledCampaignSerializer,
-    CampaignScheduleSerializer
+    CampaignScheduleSerializer, WarmupPlanSerializer
 )
 
 
@@ -21,9 +23,9 @@ class CampaignViewSet(viewsets.ModelViewSet):
         """Send campaign immediately"""
         campaign = self.get_object()
 
-        if campaign.status not in ['draft', 'paused']:
+        if campaign.status != 'draft':
             return Response(
-                {'error': 'Campaign can only be sent from draft or paused status'},
+                {'error': 'Campaign can only be sent from draft status (use resume for paused campaigns)'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
@@ -116,25 +118,65 @@ class CampaignViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        campaign.status = 'paused'
-        campaign.save()
+        # Only the status column, a concurrent save must not undo the pause
+        Campaign.objects.filter(id=campaign.id, status='sending').update(
+            status='paused',
+            updated_at=timezone.now()
+        )
 
         return Response({
             'message': 'Campaign paused',
             'campaign_id': campaign.id
         })
 
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """Resume a paused campaign from where it stopped"""
+        campaign = self.get_object()
+
+        if campaign.status != 'paused':
+            return Response(
+                {'error': 'Only paused campaigns can be resumed'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Batches dispatched before the pause may not have been sent
+        cursor = next_pending_batch(campaign.id)
+
+        resumed = Campaign.objects.filter(id=campaign.id, status='paused').update(
+            status='sending',
+            dispatch_cursor=cursor or 0,
+            updated_at=timezone.now()
+        )
+
+        if resumed:
+            from tasks.email_tasks import send_campaign_task
+            send_campaign_task.delay(campaign.id)
+
+        return Response({
+            'message': 'Campaign resumed',
+            'campaign_id': campaign.id,
+            'pending_recipients': pending_count(campaign.id)
+        })
+
     @action(detail=True, methods=['get'])
     def metrics(self, request, pk=None):
         """Get campaign metrics"""
         campaign = self.get_object()
 
+        # Include increments not flushed to the database yet
+        for field, delta in campaign_counters.pending(campaign.id).items():
+            setattr(campaign, field, getattr(campaign, field) + delta)
+
+        plan = warmup.plan_for_sender(campaign.from_email)
+
         return Response({
             'campaign_id': campaign.id,
             'name': campaign.name,
             'status': campaign.status,
             'total_recipients': campaign.total_recipients,
             'sent_count': campaign.sent_count,
+            'failed_count': campaign.failed_count,
             'delivered_count': campaign.delivered_count,
             'bounce_count': campaign.bounce_count,
             'complaint_count': campaign.complaint_count,
@@ -146,6 +188,15 @@ class CampaignViewSet(viewsets.ModelViewSet):
             'bounce_rate': campaign.bounce_rate,
             'started_at': campaign.started_at,
             'completed_at': campaign.completed_at,
+            'scheduling': {
+                'priority': campaign.priority,
+                'weight': send_scheduler.weight(campaign),
+                'max_send_rate': campaign.max_send_rate,
+                'dispatch_cursor': campaign.dispatch_cursor,
+                'inflight_batches': len(campaign_progress.inflight_batches(campaign.id)),
+                **send_scheduler.throughput(campaign.id),
+                'warmup': warmup.allowance(plan) if plan else None,
+            },
         })
 
 
@@ -154,3 +205,15 @@ class ScheduledCampaignViewSet(viewsets.ReadOnlyModelViewSet):
 
     queryset = ScheduledCampaign.objects.select_related('campaign').all()
     serializer_class = ScheduledCampaignSerializer
+
+
+class WarmupPlanViewSet(viewsets.ModelViewSet):
+    """ViewSet for WarmupPlan"""
+
+    queryset = WarmupPlan.objects.all()
+    serializer_class = WarmupPlanSerializer
+
+    @action(detail=True, methods=['get'])
+    def usage(self, request, pk=None):
+        """Today's and this hour's volume of the plan"""
+        return Response(warmup.allowance(self.get_object()))
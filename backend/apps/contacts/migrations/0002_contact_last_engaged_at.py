@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='last_engaged_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Last open or click, recently engaged contacts are sent first during warm-up', null=True),
+        ),
+    ]
@@ -33,6 +33,12 @@ class Contact(models.Model):
         help_text="Suppressed due to bounces or complaints"
     )
     suppression_reason = models.CharField(max_length=100, blank=True, null=True)
+    last_engaged_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Last open or click, recently engaged contacts are sent first during warm-up"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
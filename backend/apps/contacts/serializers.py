@@ -18,9 +18,9 @@ class ContactSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'email', 'first_name', 'last_name', 'full_name',
             'custom_fields', 'lists', 'lists_data', 'is_subscribed',
-            'is_suppressed', 'suppression_reason', 'created_at', 'updated_at'
+            'is_suppressed', 'suppression_reason', 'last_engaged_at', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['last_engaged_at', 'created_at', 'updated_at']
 
 
 class BulkContactUploadSerializer(serializers.Serializer):
@@ -0,0 +1,330 @@
+"""
+Management command to benchmark a campaign send end to end
+"""
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from apps.analytics.models import EmailLog
+from apps.campaigns.models import Campaign
+from apps.core.services import ses_service
+from apps.core.services.ses_stub import SESStubServer
+from apps.emails.models import EmailTemplate
+from .seed_data import Command as SeedCommand
+
+# Results compared by --compare, and whether higher is better
+COMPARED_RESULTS = [
+    ('emails_per_second', True),
+    ('send_latency_p50_ms', False),
+    ('send_latency_p99_ms', False),
+    ('db_queries_per_email', False),
+    ('redis_ops_per_email', False),
+    ('peak_rss_mb', False),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed N contacts, send a campaign to them through send_campaign_task against a '
+        'local SES stub (or the null transport) and report throughput as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contacts', type=int, default=10000, help='Recipients (seeded with seed_data --scale)')
+        parser.add_argument(
+            '--mode',
+            choices=['eager', 'workers'],
+            default='eager',
+            help=(
+                'eager runs every task in this process; workers queues the campaign to running '
+                'Celery workers and waits for it to complete'
+            )
+        )
+        parser.add_argument('--delivery-mode', choices=['individual', 'bulk_template'], default='individual')
+        parser.add_argument(
+            '--transport',
+            choices=['ses', 'null'],
+            default='ses',
+            help='ses sends to a local SES stub started by this command'
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='CAMPAIGN_SEND_BATCH_SIZE (eager only)')
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=10000.0,
+            help='Local send rate limit (eager only), high so the pipeline is measured rather than the limiter'
+        )
+        parser.add_argument('--stub-port', type=int, default=0, help='Port of the SES stub (workers need a fixed one)')
+        parser.add_argument('--stub-latency-ms', type=float, default=0.0, help='Artificial latency per SES call')
+        parser.add_argument('--timeout', type=int, default=3600, help='Seconds to wait for the workers')
+        parser.add_argument('--output', help='JSON file to write (default benchmarks/campaign-<N>-<mode>-<time>.json)')
+        parser.add_argument('--compare', help='Earlier result JSON to compare against')
+
+    def handle(self, *args, **options):
+        count = options['contacts']
+        eager = options['mode'] == 'eager'
+
+        contact_list = SeedCommand(stdout=self.stdout, stderr=self.stderr).seed_scale(count)
+        template, _ = EmailTemplate.objects.get_or_create(
+            name='Benchmark',
+            defaults={
+                'subject_template': 'Benchmark for $name',
+                'html_content': '<html><body><h1>Hi $first_name</h1><p>Sent to $email</p></body></html>',
+                'plain_text_content': 'Hi $first_name, sent to $email',
+            }
+        )
+
+        stub = None
+        if options['transport'] == 'ses':
+            stub = self._start_stub(options)
+
+        if eager:
+            self._configure_eager(options)
+
+        campaign = Campaign.objects.create(
+            name=f"Benchmark {count} ({options['mode']}, {timezone.now():%Y-%m-%d %H:%M:%S})",
+            subject='Benchmark for $first_name',
+            from_email='benchmark@example.com',
+            from_name='Benchmark',
+            template=template,
+            contact_list=contact_list,
+            status='sending',
+            started_at=timezone.now(),
+            total_recipients=contact_list.total_contacts,
+            delivery_mode=options['delivery_mode'],
+            transport=options['transport'],
+        )
+
+        self.stdout.write(f"Sending campaign {campaign.id} to {contact_list.total_contacts} contacts...")
+        redis_before = self._redis_ops()
+
+        if eager:
+            elapsed, queries, latencies = self._run_eager(campaign)
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        else:
+            elapsed = self._run_workers(campaign, options['timeout'])
+            queries, latencies = None, []
+            peak_rss = self._worker_peak_rss()
+
+        redis_after = self._redis_ops()
+        campaign.refresh_from_db()
+
+        sent = EmailLog.objects.filter(campaign=campaign, status='sent').count()
+        failed = EmailLog.objects.filter(campaign=campaign, status='failed').count()
+        emails = sent + failed
+
+        latencies.sort()
+        result = {
+            'benchmark': 'campaign',
+            'timestamp': timezone.now().isoformat(),
+            'git_commit': self._git_commit(),
+            'config': {
+                'contacts': count,
+                'mode': options['mode'],
+                'delivery_mode': options['delivery_mode'],
+                'transport': options['transport'],
+                'batch_size': settings.CAMPAIGN_SEND_BATCH_SIZE,
+                'rate_limit': settings.SES_RATE_LIMIT_PER_SECOND,
+                'stub_latency_ms': options['stub_latency_ms'],
+            },
+            'results': {
+                'campaign_status': campaign.status,
+                'sent': sent,
+                'failed': failed,
+                'elapsed_seconds': round(elapsed, 3),
+                'emails_per_second': round(emails / elapsed, 1) if elapsed else None,
+                'send_latency_p50_ms': _percentile(latencies, 50),
+                'send_latency_p99_ms': _percentile(latencies, 99),
+                'completion_p50_seconds': self._completion_percentile(campaign, 50),
+                'completion_p99_seconds': self._completion_percentile(campaign, 99),
+                'db_queries_per_email': round(queries / emails, 3) if queries is not None and emails else None,
+                'redis_ops_per_email': (
+                    round((redis_after - redis_before) / emails, 3)
+                    if redis_before is not None and redis_after is not None and emails else None
+                ),
+                'peak_rss_mb': round(peak_rss, 1) if peak_rss else None,
+            },
+        }
+        if stub:
+            result['stub'] = stub.stats
+            stub.shutdown()
+            stub.server_close()
+
+        self._write(result, options['output'])
+
+        if options['compare']:
+            self._compare(result, options['compare'])
+
+    def _start_stub(self, options):
+        stub = SESStubServer(('127.0.0.1', options['stub_port']), latency=options['stub_latency_ms'] / 1000)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+        url = f"http://127.0.0.1:{stub.server_address[1]}"
+        self.stdout.write(f"SES stub listening on {url}")
+        if options['mode'] == 'workers':
+            self.stdout.write(f"Workers must run with AWS_SES_ENDPOINT_URL={url} and no SES_SENDER_SHARDS")
+
+        settings.AWS_SES_ENDPOINT_URL = url
+        settings.AWS_ACCESS_KEY_ID = settings.AWS_ACCESS_KEY_ID or 'benchmark'
+        settings.AWS_SECRET_ACCESS_KEY = settings.AWS_SECRET_ACCESS_KEY or 'benchmark'
+        return stub
+
+    def _configure_eager(self, options):
+        from config.celery import app
+
+        # Send through the stub only, at a rate that doesn't hide the pipeline cost
+        settings.SES_SENDER_SHARDS = []
+        settings.SES_ADAPTIVE_RATE_ENABLED = False
+        settings.SES_RATE_LIMIT_PER_SECOND = options['rate']
+        settings.SES_RATE_LIMIT_BURST = options['rate']
+        if options['batch_size']:
+            settings.CAMPAIGN_SEND_BATCH_SIZE = options['batch_size']
+
+        ses_service.init_process_clients()
+        ses_service.get_redis_client().delete('ses_rate_limit:bucket')
+
+        app.conf.task_always_eager = True
+        app.conf.task_eager_propagates = True
+
+    def _run_eager(self, campaign):
+        from apps.core.services.ses_service import SESService
+        from tasks.email_tasks import send_campaign_task
+
+        latencies = []
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        send_email = SESService.send_email
+        send_bulk_group = SESService._send_bulk_group
+
+        def timed_send_email(service, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return send_email(service, *args, **kwargs)
+            finally:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        def timed_send_bulk_group(service, source, template_name, default_data, group):
+            start = time.perf_counter()
+            try:
+                return send_bulk_group(service, source, template_name, default_data, group)
+            finally:
+                per_email = (time.perf_counter() - start) * 1000 / max(len(group), 1)
+                latencies.extend([per_email] * len(group))
+
+        SESService.send_email = timed_send_email
+        SESService._send_bulk_group = timed_send_bulk_group
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_queries):
+                send_campaign_task.apply(args=(campaign.id,))
+        finally:
+            SESService.send_email = send_email
+            SESService._send_bulk_group = send_bulk_group
+
+        return time.perf_counter() - start, queries[0], latencies
+
+    def _run_workers(self, campaign, timeout):
+        from tasks.email_tasks import send_campaign_task
+
+        start = time.perf_counter()
+        send_campaign_task.delay(campaign.id)
+
+        while time.perf_counter() - start < timeout:
+            time.sleep(1)
+            status = Campaign.objects.filter(id=campaign.id).values_list('status', flat=True).first()
+            if status != 'sending':
+                break
+        else:
+            raise CommandError(f"Campaign {campaign.id} still sending after {timeout}s")
+
+        return time.perf_counter() - start
+
+    def _redis_ops(self):
+        """Commands processed by the Redis server so far, None if unknown"""
+        try:
+            return ses_service.get_redis_client().info('stats')['total_commands_processed']
+        except (redis.RedisError, KeyError):
+            return None
+
+    def _worker_peak_rss(self):
+        """Highest peak RSS of the local Celery pool processes, in MB"""
+        from config.celery import app
+
+        stats = app.control.inspect(timeout=2).stats() or {}
+        peak = 0
+        for worker in stats.values():
+            for pid in worker.get('pool', {}).get('processes', []):
+                try:
+                    with open(f"/proc/{pid}/status") as status:
+                        for line in status:
+                            if line.startswith('VmHWM:'):
+                                peak = max(peak, int(line.split()[1]) / 1024)
+                except OSError:
+                    continue
+            peak = max(peak, worker.get('rusage', {}).get('maxrss', 0) / 1024)
+        return peak or None
+
+    def _completion_percentile(self, campaign, percentile):
+        """Seconds from the campaign start until the given share of its emails were sent"""
+        logs = EmailLog.objects.filter(campaign=campaign, sent_at__isnull=False).order_by('sent_at')
+        total = logs.count()
+        if not total:
+            return None
+        sent_at = logs.values_list('sent_at', flat=True)[min(total - 1, total * percentile // 100)]
+        return round((sent_at - campaign.started_at).total_seconds(), 3)
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _write(self, result, output):
+        if not output:
+            directory = settings.BASE_DIR / 'benchmarks'
+            os.makedirs(directory, exist_ok=True)
+            config = result['config']
+            output = directory / f"campaign-{config['contacts']}-{config['mode']}-{timezone.now():%Y%m%d-%H%M%S}.json"
+
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+        self.stdout.write(json.dumps(result['results'], indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    def _compare(self, result, path):
+        with open(path) as f:
+            previous = json.load(f)['results']
+
+        for name, higher_is_better in COMPARED_RESULTS:
+            before, after = previous.get(name), result['results'].get(name)
+            if not before or after is None:
+                continue
+
+            change = (after - before) / before * 100
+            regression = change < 0 if higher_is_better else change > 0
+            line = f"{name:>22}: {before} -> {after} ({change:+.1f}%)"
+            self.stdout.write(self.style.ERROR(line) if regression and abs(change) >= 5 else line)
+
+
+def _percentile(values, percentile):
+    """Percentile of sorted values, rounded to 3 decimals"""
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, len(values) * percentile // 100)], 3)
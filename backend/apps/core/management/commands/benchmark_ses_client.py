@@ -0,0 +1,79 @@
+"""
+Management command to measure per-email SES client overhead
+"""
+import cProfile
+import io
+import pstats
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.core.services import ses_service
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare building a new SES client and Redis connection per email '
+        'with reusing the per-process ones'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument(
+            '--send',
+            action='store_true',
+            help=(
+                'Also make one SES call (GetSendQuota) and one Redis PING per email; '
+                'point AWS_SES_ENDPOINT_URL at ses_stub to avoid real AWS calls'
+            )
+        )
+        parser.add_argument('--profile', action='store_true', help='Print the top cProfile entries of each mode')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        def per_email_clients():
+            # What every send_single_email_task used to do
+            client = ses_service.create_ses_client()
+            redis_client = redis.from_url(settings.REDIS_URL)
+            if options['send']:
+                client.get_send_quota()
+                redis_client.ping()
+
+        def shared_clients():
+            client = ses_service.get_ses_client()
+            redis_client = ses_service.get_redis_client()
+            if options['send']:
+                client.get_send_quota()
+                redis_client.ping()
+
+        ses_service.init_process_clients()
+
+        results = {}
+        for name, func in [('per-email', per_email_clients), ('shared', shared_clients)]:
+            profiler = cProfile.Profile() if options['profile'] else None
+            func()  # warm up imports and the shared connection
+
+            start = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            for _ in range(iterations):
+                func()
+            if profiler:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+
+            results[name] = elapsed / iterations * 1000
+            self.stdout.write(f"{name:>10}: {results[name]:.3f} ms per email ({iterations} iterations)")
+
+            if profiler:
+                stream = io.StringIO()
+                pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(15)
+                self.stdout.write(stream.getvalue())
+
+        saved = results['per-email'] - results['shared']
+        self.stdout.write(self.style.SUCCESS(
+            f"Overhead saved: {saved:.3f} ms per email "
+            f"({saved * 1000000 / 60000:.1f} worker-minutes per million emails)"
+        ))
@@ -0,0 +1,194 @@
+"""
+Management command to load test the SES webhook
+"""
+import http.client
+import json
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from apps.core.services import ses_notifications
+from apps.core.services.ses_service import get_redis_client
+
+# Stream the in-process run writes to, so consumers never see its messages
+BENCHMARK_STREAM_KEY = 'ses_notifications:benchmark'
+
+
+def sns_delivery_message():
+    """An SNS envelope around an SES Delivery notification, like SNS posts them"""
+    message_id = f"bench-{uuid.uuid4().hex}"
+    notification = {
+        'notificationType': 'Delivery',
+        'mail': {
+            'timestamp': '2024-01-01T12:00:00.000Z',
+            'source': 'Benchmark <benchmark@example.com>',
+            'sourceArn': 'arn:aws:ses:us-east-1:123456789012:identity/example.com',
+            'sendingAccountId': '123456789012',
+            'messageId': message_id,
+            'destination': ['recipient@example.com'],
+        },
+        'delivery': {
+            'timestamp': '2024-01-01T12:00:01.000Z',
+            'processingTimeMillis': 812,
+            'recipients': ['recipient@example.com'],
+            'smtpResponse': '250 2.0.0 OK',
+            'reportingMTA': 'a8-50.smtp-out.amazonses.com',
+        },
+    }
+    return json.dumps({
+        'Type': 'Notification',
+        'MessageId': str(uuid.uuid4()),
+        'TopicArn': 'arn:aws:sns:us-east-1:123456789012:ses-notifications',
+        'Message': json.dumps(notification),
+        'Timestamp': '2024-01-01T12:00:01.500Z',
+        'SignatureVersion': '1',
+        'Signature': 'x' * 344,
+        'SigningCertURL': 'https://sns.us-east-1.amazonaws.com/SimpleNotificationService.pem',
+        'UnsubscribeURL': 'https://sns.us-east-1.amazonaws.com/?Action=Unsubscribe',
+    }).encode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Post SNS delivery notifications to the SES webhook and report requests/sec, '
+        'requests per CPU core and p50/p99 latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument(
+            '--url',
+            help=(
+                'Webhook URL of a running server (e.g. http://localhost:8000/api/webhooks/ses/); '
+                'by default requests go through the Django stack in this process'
+            )
+        )
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads (--url only)')
+        parser.add_argument('--server-cores', type=int, help='CPU cores of the server, for requests per core (--url only)')
+        parser.add_argument('--output', help='JSON file to write the results to')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        bodies = [sns_delivery_message() for _ in range(min(count, 1000))]
+
+        if options['url']:
+            result = self._run_http(options['url'], bodies, count, options['concurrency'])
+            if options['server_cores']:
+                result['requests_per_core'] = round(result['requests_per_second'] / options['server_cores'], 1)
+        else:
+            result = self._run_in_process(bodies, count)
+
+        self.stdout.write(json.dumps(result, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _run_in_process(self, bodies, count):
+        """Full request/response cycle (middleware included) on one core"""
+        stream_key = ses_notifications.STREAM_KEY
+        ses_notifications.STREAM_KEY = BENCHMARK_STREAM_KEY
+        client = Client()
+        latencies = []
+
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                client.post('/api/webhooks/ses/', bodies[0], content_type='text/plain')  # warm up
+
+                start, cpu_start = time.perf_counter(), time.process_time()
+                for i in range(count):
+                    sent = time.perf_counter()
+                    response = client.post('/api/webhooks/ses/', bodies[i % len(bodies)], content_type='text/plain')
+                    latencies.append(time.perf_counter() - sent)
+                    if response.status_code != 200:
+                        raise CommandError(f"Webhook answered {response.status_code}: {response.content[:200]}")
+                elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+        finally:
+            ses_notifications.STREAM_KEY = stream_key
+            get_redis_client().delete(BENCHMARK_STREAM_KEY)
+
+        return {
+            'mode': 'in-process',
+            'requests': count,
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(count / elapsed, 1),
+            # One thread, so this is what one core of the web server can take
+            'requests_per_core': round(count / cpu, 1),
+            **_latency_percentiles(latencies),
+        }
+
+    def _run_http(self, url, bodies, count, concurrency):
+        """Keep-alive clients against a running server"""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise CommandError(f"Unsupported URL: {url}")
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        remaining = [count]
+
+        def worker():
+            connection = connection_class(parts.netloc, timeout=30)
+            local = []
+            while True:
+                with lock:
+                    if not remaining[0]:
+                        break
+                    remaining[0] -= 1
+                    index = remaining[0]
+
+                sent = time.perf_counter()
+                try:
+                    connection.request('POST', parts.path or '/', bodies[index % len(bodies)], {
+                        'Content-Type': 'text/plain; charset=UTF-8',
+                        'x-amz-sns-message-type': 'Notification',
+                    })
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        errors.append(response.status)
+                except (OSError, http.client.HTTPException) as e:
+                    errors.append(str(e))
+                    connection.close()
+                    connection = connection_class(parts.netloc, timeout=30)
+                local.append(time.perf_counter() - sent)
+
+            connection.close()
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'mode': 'http',
+            'url': url,
+            'requests': count,
+            'concurrency': concurrency,
+            'errors': len(errors),
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(count / elapsed, 1),
+            **_latency_percentiles(latencies),
+        }
+
+
+def _latency_percentiles(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+    return {
+        'latency_p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'latency_p99_ms': round(latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000, 3),
+    }
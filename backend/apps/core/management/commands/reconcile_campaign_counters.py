@@ -0,0 +1,36 @@
+"""
+Management command to recompute campaign counters from the email logs
+"""
+from django.core.management.base import BaseCommand
+from apps.campaigns.models import Campaign
+from apps.core.services import campaign_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute campaign counters from EmailLog and EmailEvent'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_ids', nargs='*', type=int, help='Campaigns to fix (default: all)')
+        parser.add_argument('--flush', action='store_true', help='Flush buffered counters instead of recomputing')
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            flushed = campaign_counters.flush()
+            self.stdout.write(self.style.SUCCESS(f"Flushed counters of {flushed} campaigns"))
+            return
+
+        campaigns = Campaign.objects.all()
+        if options['campaign_ids']:
+            campaigns = campaigns.filter(id__in=options['campaign_ids'])
+
+        fixed = 0
+        for campaign in campaigns.iterator():
+            changes = campaign_counters.reconcile(campaign)
+            if not changes:
+                continue
+
+            fixed += 1
+            details = ', '.join(f"{field} {old} -> {new}" for field, (old, new) in changes.items())
+            self.stdout.write(f"Campaign {campaign.id} ({campaign.name}): {details}")
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} campaigns"))
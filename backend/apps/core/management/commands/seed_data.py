@@ -1,17 +1,43 @@
 """
 Management command to populate database with sample data
 """
+import time
+
 from django.core.management.base import BaseCommand
 from apps.emails.models import EmailTemplate
 from apps.contacts.models import ContactList, Contact
 from apps.campaigns.models import Campaign
 from django.db import transaction
 
+# Recipient domains of the --scale contacts, spread like a typical B2C list
+SCALE_DOMAINS = [
+    ('gmail.com', 45),
+    ('hotmail.com', 15),
+    ('outlook.com', 10),
+    ('yahoo.com', 10),
+    ('uol.com.br', 5),
+    ('example.com', 15),
+]
+
+SCALE_CHUNK_SIZE = 5000
+
 
 class Command(BaseCommand):
     help = 'Populate database with sample data'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=int,
+            default=None,
+            help='Instead of the sample data, seed this many contacts into a "Benchmark <N>" list'
+        )
+
     def handle(self, *args, **options):
+        if options['scale']:
+            self.seed_scale(options['scale'])
+            return
+
         self.stdout.write('Starting data seeding...')
 
         with transaction.atomic():
@@ -33,6 +59,53 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS('Data seeding completed successfully!'))
 
+    def seed_scale(self, count):
+        """
+        Seed count contacts into the "Benchmark <count>" list
+
+        Contacts and list memberships are inserted with bulk_create in
+        chunks, and contacts that already exist are reused, so a larger
+        run can be built on a smaller one.
+
+        Returns:
+            ContactList
+        """
+        contact_list, _ = ContactList.objects.get_or_create(
+            name=f'Benchmark {count}',
+            defaults={'description': f'{count} generated contacts for benchmarks'}
+        )
+        Membership = Contact.lists.through
+
+        domains = [domain for domain, share in SCALE_DOMAINS for _ in range(share)]
+        start = time.perf_counter()
+
+        for offset in range(0, count, SCALE_CHUNK_SIZE):
+            contacts = [
+                Contact(email=f'bench{i}@{domains[i % len(domains)]}', first_name=f'Bench{i}', last_name='Test')
+                for i in range(offset, min(offset + SCALE_CHUNK_SIZE, count))
+            ]
+            emails = [contact.email for contact in contacts]
+
+            with transaction.atomic():
+                Contact.objects.bulk_create(contacts, ignore_conflicts=True)
+                contact_ids = Contact.objects.filter(email__in=emails).values_list('id', flat=True)
+                Membership.objects.bulk_create(
+                    [Membership(contact_id=contact_id, contactlist_id=contact_list.id) for contact_id in contact_ids],
+                    ignore_conflicts=True
+                )
+
+            done = offset + len(emails)
+            if done % (SCALE_CHUNK_SIZE * 20) == 0 or done == count:
+                self.stdout.write(f'{done}/{count} contacts ({time.perf_counter() - start:.1f}s)')
+
+        contact_list.total_contacts = contact_list.contacts.count()
+        contact_list.save(update_fields=['total_contacts', 'updated_at'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'List "{contact_list.name}" (id {contact_list.id}) has {contact_list.total_contacts} contacts'
+        ))
+        return contact_list
+
     def _create_templates(self):
         templates = []
 
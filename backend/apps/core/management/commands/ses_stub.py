@@ -0,0 +1,36 @@
+"""
+Management command to run a local SES stub endpoint
+"""
+from django.core.management.base import BaseCommand
+from apps.core.services.ses_stub import SESStubServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local stub of the AWS SES API (set AWS_SES_ENDPOINT_URL to use it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9001)
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='Artificial latency per request')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of recipients rejected')
+        parser.add_argument('--max-send-rate', type=float, default=None, help='Recipients per second before Throttling')
+
+    def handle(self, *args, **options):
+        server = SESStubServer(
+            (options['host'], options['port']),
+            latency=options['latency_ms'] / 1000,
+            error_rate=options['error_rate'],
+            max_send_rate=options['max_send_rate'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"SES stub listening on http://{options['host']}:{options['port']}"
+        ))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stats: {server.stats}")
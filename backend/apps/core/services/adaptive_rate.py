@@ -0,0 +1,172 @@
+"""
+Adaptive SES send rate (AIMD) driven by the account quota and throttling
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# KEYS[1] = controller state hash, KEYS[2] = token bucket hash
+# ARGV[1] = 'success' or 'throttle', ARGV[2] = emails sent (success only)
+# ARGV[3] = additive step, ARGV[4] = multiplicative factor,
+# ARGV[5] = min rate, ARGV[6] = decrease cooldown, ARGV[7] = burst seconds
+#
+# The new rate is written straight into the token bucket so every worker
+# picks it up on its next reservation.
+AIMD_SCRIPT = """
+local state_key = KEYS[1]
+local bucket_key = KEYS[2]
+local event = ARGV[1]
+
+local state = redis.call('HMGET', state_key, 'rate', 'ceiling', 'last_decrease')
+local rate = tonumber(state[1])
+local ceiling = tonumber(state[2])
+if rate == nil or ceiling == nil then
+    return nil
+end
+
+local min_rate = tonumber(ARGV[5])
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+
+if event == 'success' then
+    local sent = tonumber(ARGV[2])
+    redis.call('HINCRBY', state_key, 'sent_since_refresh', sent)
+    -- Roughly +step emails/second for every second of successful sending
+    rate = math.min(ceiling, rate + tonumber(ARGV[3]) * sent / rate)
+else
+    -- Throttling reported by many workers at once only counts once
+    local last_decrease = tonumber(state[3]) or 0
+    if now - last_decrease < tonumber(ARGV[6]) then
+        return tostring(rate)
+    end
+    rate = math.max(min_rate, rate * tonumber(ARGV[4]))
+    redis.call('HSET', state_key, 'last_decrease', tostring(now))
+end
+
+redis.call('HSET', state_key, 'rate', tostring(rate))
+redis.call('HSET', bucket_key, 'rate', tostring(rate), 'capacity', tostring(math.max(1, rate * tonumber(ARGV[7]))))
+redis.call('EXPIRE', bucket_key, 3600)
+
+return tostring(rate)
+"""
+
+
+class AdaptiveRateController:
+    """
+    AIMD controller for the shared SES token bucket
+
+    The ceiling comes from get_send_quota (MaxSendRate). Successful sends
+    ramp the rate up additively, Throttling errors cut it multiplicatively.
+
+    Args:
+        redis_client: Redis connection
+        bucket: TokenBucket whose rate is being controlled
+        key: Redis key of the controller state
+        increase_step: Additive increase, emails/second per second of success
+        decrease_factor: Multiplicative decrease applied on Throttling
+        min_rate: Lowest rate the controller will go down to
+        utilization: Fraction of MaxSendRate / Max24HourSend we allow ourselves
+        decrease_cooldown: Seconds during which further throttles are ignored
+        flush_every: Successes buffered locally before updating Redis
+    """
+
+    def __init__(self, redis_client, bucket, key='ses_adaptive_rate', increase_step=2.0,
+                 decrease_factor=0.5, min_rate=1.0, utilization=0.95, decrease_cooldown=1.0,
+                 flush_every=10):
+        self.redis_client = redis_client
+        self.bucket = bucket
+        self.key = key
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.min_rate = min_rate
+        self.utilization = utilization
+        self.decrease_cooldown = decrease_cooldown
+        self.flush_every = flush_every
+        self.burst_seconds = bucket.capacity / bucket.rate
+        self._pending_successes = 0
+        self._script = redis_client.register_script(AIMD_SCRIPT)
+
+    def refresh(self, quota):
+        """
+        Update the rate ceiling and the 24h quota from get_send_quota
+
+        Args:
+            quota: Result of SESService.get_send_quota
+
+        Returns:
+            float: Rate now applied to the token bucket, None if unavailable
+        """
+        if not quota.get('success'):
+            logger.warning(f"Send quota unavailable, keeping current rate: {quota.get('error')}")
+            return None
+
+        ceiling = max(self.min_rate, quota['max_send_rate'] * self.utilization)
+        current = self.redis_client.hget(self.key, 'rate')
+        rate = min(float(current), ceiling) if current is not None else ceiling
+
+        self.redis_client.hset(self.key, mapping={
+            'rate': rate,
+            'ceiling': ceiling,
+            'max_24_hour_send': quota['max_24_hour_send'],
+            'sent_last_24_hours': quota['sent_last_24_hours'],
+            'sent_since_refresh': 0,
+            'refreshed_at': time.time(),
+        })
+        self.bucket.set_rate(rate, max(1, rate * self.burst_seconds))
+
+        logger.info(f"SES quota refreshed: ceiling {ceiling:.2f}/s, rate {rate:.2f}/s")
+        return rate
+
+    def record_success(self, count=1):
+        """Report successfully sent emails (additive increase)"""
+        self._pending_successes += count
+
+        if self._pending_successes >= self.flush_every:
+            sent, self._pending_successes = self._pending_successes, 0
+            return self._apply('success', sent)
+
+        return None
+
+    def record_throttle(self):
+        """Report an SES Throttling error (multiplicative decrease)"""
+        rate = self._apply('throttle', 0)
+        if rate is not None:
+            logger.warning(f"SES throttling, send rate now {rate:.2f}/s")
+        return rate
+
+    def quota_remaining(self):
+        """
+        Emails that can still be sent within the 24h quota
+
+        Returns:
+            float: Remaining emails (inf if unknown or unlimited)
+        """
+        max_send, sent_last_24h, sent_since_refresh = self.redis_client.hmget(
+            self.key, 'max_24_hour_send', 'sent_last_24_hours', 'sent_since_refresh'
+        )
+
+        # Max24HourSend is -1 for unlimited accounts
+        if max_send is None or float(max_send) < 0:
+            return float('inf')
+
+        return (
+            float(max_send) * self.utilization
+            - float(sent_last_24h or 0)
+            - float(sent_since_refresh or 0)
+        )
+
+    def has_quota(self, count=1):
+        """Whether count more emails fit in the 24h quota"""
+        return self.quota_remaining() >= count
+
+    def _apply(self, event, sent):
+        rate = self._script(
+            keys=[self.key, self.bucket.key],
+            args=[
+                event, sent, self.increase_step, self.decrease_factor,
+                self.min_rate, self.decrease_cooldown, self.burst_seconds,
+            ]
+        )
+        return float(rate) if rate is not None else None
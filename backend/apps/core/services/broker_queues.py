@@ -0,0 +1,63 @@
+"""
+Celery broker queue depth (Redis transport)
+"""
+import logging
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Kombu keeps messages with a non-default priority in sibling lists
+# named queue + separator + priority
+PRIORITY_SEPARATOR = '\x06\x16'
+PRIORITY_STEPS = (3, 6, 9)
+
+_broker_pool = None
+
+
+def get_broker_client():
+    """Redis client on the Celery broker, shared by the process"""
+    global _broker_pool
+    if _broker_pool is None:
+        _broker_pool = redis.ConnectionPool.from_url(
+            settings.CELERY_BROKER_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+    return redis.Redis(connection_pool=_broker_pool)
+
+
+def queue_depths(queues):
+    """
+    Messages waiting in each queue (not counting ones reserved by workers)
+
+    Args:
+        queues: Queue names
+
+    Returns:
+        dict: {queue: depth}, None for a queue whose depth couldn't be read
+    """
+    keys = []
+    for queue in queues:
+        keys.append(queue)
+        keys.extend(f"{queue}{PRIORITY_SEPARATOR}{step}" for step in PRIORITY_STEPS)
+
+    try:
+        pipe = get_broker_client().pipeline(transaction=False)
+        for key in keys:
+            pipe.llen(key)
+        lengths = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not read broker queue depth: {str(e)}")
+        return {queue: None for queue in queues}
+
+    per_key = len(PRIORITY_STEPS) + 1
+    return {
+        queue: sum(lengths[i * per_key:(i + 1) * per_key])
+        for i, queue in enumerate(queues)
+    }
+
+
+def queue_depth(queue):
+    """Messages waiting in one queue, None if unknown"""
+    return queue_depths([queue])[queue]
@@ -0,0 +1,241 @@
+"""
+Buffered campaign counters
+
+Workers and webhook handlers add to per-campaign Redis hashes (HINCRBY)
+instead of rewriting the campaigns row for every email or event. A beat
+task flushes the buffers as single UPDATE ... SET x = x + delta
+statements, so concurrent increments can't be lost and the row is only
+locked once per campaign per flush.
+"""
+import logging
+
+import redis
+from django.db.models import Count, F
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = (
+    'sent_count',
+    'failed_count',
+    'delivered_count',
+    'bounce_count',
+    'complaint_count',
+    'open_count',
+    'click_count',
+)
+
+# EmailEvent types behind each event counter
+EVENT_COUNTERS = {
+    'delivery': 'delivered_count',
+    'bounce': 'bounce_count',
+    'complaint': 'complaint_count',
+    'open': 'open_count',
+    'click': 'click_count',
+}
+
+DIRTY_KEY = 'campaign_counters:dirty'
+
+# KEYS[1] = campaign buffer hash, KEYS[2] = dirty set, ARGV[1] = campaign id
+#
+# Read and delete in one step, so increments made while the flush runs
+# land in a fresh buffer and mark the campaign dirty again.
+TAKE_SCRIPT = """
+local values = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+redis.call('SREM', KEYS[2], ARGV[1])
+return values
+"""
+
+
+def _buffer_key(campaign_id):
+    return f"campaign_counters:{campaign_id}"
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def increment(campaign_id, field, amount=1):
+    """
+    Add to a campaign counter
+
+    Falls back to a direct F() update when Redis is unavailable, so a
+    counter is never dropped.
+
+    Args:
+        campaign_id: ID of the campaign (None is ignored)
+        field: One of COUNTER_FIELDS
+        amount: Value to add
+    """
+    if campaign_id is None or not amount:
+        return
+
+    if field not in COUNTER_FIELDS:
+        raise ValueError(f"Unknown campaign counter: {field}")
+
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.hincrby(_buffer_key(campaign_id), field, amount)
+        pipe.sadd(DIRTY_KEY, campaign_id)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Counter buffer unavailable, updating campaign {campaign_id} directly: {str(e)}")
+        _apply(campaign_id, {field: amount})
+
+
+def increment_many(deltas):
+    """
+    Add to many counters in one round trip
+
+    Args:
+        deltas: {campaign_id: {field: amount}}
+    """
+    deltas = {
+        campaign_id: {field: amount for field, amount in fields.items() if amount}
+        for campaign_id, fields in deltas.items()
+        if campaign_id is not None
+    }
+    deltas = {campaign_id: fields for campaign_id, fields in deltas.items() if fields}
+    if not deltas:
+        return
+
+    for fields in deltas.values():
+        for field in fields:
+            if field not in COUNTER_FIELDS:
+                raise ValueError(f"Unknown campaign counter: {field}")
+
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for campaign_id, fields in deltas.items():
+            for field, amount in fields.items():
+                pipe.hincrby(_buffer_key(campaign_id), field, amount)
+            pipe.sadd(DIRTY_KEY, campaign_id)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Counter buffer unavailable, updating {len(deltas)} campaigns directly: {str(e)}")
+        for campaign_id, fields in deltas.items():
+            _apply(campaign_id, fields)
+
+
+def pending(campaign_id):
+    """
+    Increments buffered for a campaign but not flushed yet
+
+    Returns:
+        dict: {field: delta}, empty if nothing is buffered
+    """
+    try:
+        values = _redis().hgetall(_buffer_key(campaign_id))
+    except redis.RedisError:
+        return {}
+
+    return {_decode(field): int(delta) for field, delta in values.items()}
+
+
+def flush():
+    """
+    Write every buffered counter to the database
+
+    Returns:
+        int: Number of campaigns updated
+    """
+    client = _redis()
+    take = client.register_script(TAKE_SCRIPT)
+    flushed = 0
+
+    for campaign_id in client.smembers(DIRTY_KEY):
+        campaign_id = int(campaign_id)
+        values = take(keys=[_buffer_key(campaign_id), DIRTY_KEY], args=[campaign_id])
+
+        deltas = {
+            _decode(values[i]): int(values[i + 1])
+            for i in range(0, len(values), 2)
+        }
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            continue
+
+        try:
+            _apply(campaign_id, deltas)
+            flushed += 1
+        except Exception as e:
+            # Put the deltas back for the next flush
+            logger.error(f"Error flushing counters of campaign {campaign_id}: {str(e)}")
+            pipe = client.pipeline(transaction=False)
+            for field, delta in deltas.items():
+                pipe.hincrby(_buffer_key(campaign_id), field, delta)
+            pipe.sadd(DIRTY_KEY, campaign_id)
+            pipe.execute()
+
+    return flushed
+
+
+def reconcile(campaign):
+    """
+    Recompute a campaign's counters from EmailLog, EmailEvent and the
+    recipient snapshot
+
+    Buffered increments are discarded first, since the rows they stand
+    for are already counted by the recompute.
+
+    Args:
+        campaign: Campaign to fix
+
+    Returns:
+        dict: {field: (old value, new value)} for the counters that changed
+    """
+    from apps.analytics.models import EmailLog, EmailEvent
+    from apps.campaigns.models import CampaignRecipient
+
+    try:
+        client = _redis()
+        client.register_script(TAKE_SCRIPT)(
+            keys=[_buffer_key(campaign.id), DIRTY_KEY], args=[campaign.id]
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Could not clear counter buffer of campaign {campaign.id}: {str(e)}")
+
+    values = {field: 0 for field in COUNTER_FIELDS}
+    values['sent_count'] = EmailLog.objects.filter(
+        campaign=campaign,
+        sent_at__isnull=False
+    ).count()
+    values['failed_count'] = CampaignRecipient.objects.filter(
+        campaign=campaign,
+        state=CampaignRecipient.STATE_FAILED
+    ).count()
+
+    events = (
+        EmailEvent.objects
+        .filter(email_log__campaign=campaign, event_type__in=EVENT_COUNTERS)
+        .values('event_type')
+        .annotate(total=Count('id'))
+    )
+    for row in events:
+        values[EVENT_COUNTERS[row['event_type']]] = row['total']
+
+    changes = {
+        field: (getattr(campaign, field), value)
+        for field, value in values.items()
+        if getattr(campaign, field) != value
+    }
+
+    if changes:
+        type(campaign).objects.filter(id=campaign.id).update(**values)
+        for field, value in values.items():
+            setattr(campaign, field, value)
+
+    return changes
+
+
+def _apply(campaign_id, deltas):
+    from apps.campaigns.models import Campaign
+
+    Campaign.objects.filter(id=campaign_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
@@ -0,0 +1,185 @@
+"""
+Campaign completion latch and dispatch state
+
+The dispatcher adds every recipient it queues to a per-campaign Redis
+counter and seals it once the whole list is queued. Batches subtract the
+recipients they finished; whoever brings a sealed counter to zero wins
+the latch and completes the campaign. No task or COUNT query per email.
+
+The batches currently in flight live here as well, they bound how far
+ahead of the workers the scheduler runs. Each one has a deadline: a
+batch whose task was lost (a dead worker, a message dropped by the
+broker) never releases its entry, so entries past their deadline are
+dropped and the scheduler publishes the batch again.
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Long enough for any campaign, short enough not to leak abandoned ones
+PROGRESS_TTL_SECONDS = 7 * 24 * 3600
+
+# KEYS[1] = progress hash
+# ARGV[1] = recipients finished, ARGV[2] = 1 to seal, ARGV[3] = TTL
+#
+# Returns 1 exactly once: to the caller that finds the counter sealed
+# and at zero first.
+FINISH_SCRIPT = """
+local remaining = redis.call('HINCRBY', KEYS[1], 'remaining', -tonumber(ARGV[1]))
+if ARGV[2] == '1' then
+    redis.call('HSET', KEYS[1], 'sealed', 1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+
+if remaining <= 0 and redis.call('HGET', KEYS[1], 'sealed') == '1' then
+    return redis.call('HSETNX', KEYS[1], 'finished', 1)
+end
+return 0
+"""
+
+
+def _progress_key(campaign_id):
+    return f"campaign_progress:{campaign_id}"
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def reset(campaign_id):
+    """Start a new dispatch of the campaign with nothing queued"""
+    _redis().delete(_progress_key(campaign_id))
+
+
+def add(campaign_id, count):
+    """Record recipients queued for sending (before the batch is published)"""
+    pipe = _redis().pipeline(transaction=False)
+    pipe.hincrby(_progress_key(campaign_id), 'remaining', count)
+    pipe.expire(_progress_key(campaign_id), PROGRESS_TTL_SECONDS)
+    pipe.execute()
+
+
+def start(campaign_id, unfinished):
+    """
+    Start tracking a (re)started send with every unfinished recipient
+
+    unfinished counts the pending recipients and the ones a batch is still
+    sending: a batch in flight when the campaign was paused reports them
+    when it finishes. Batches left in flight by an earlier run are
+    forgotten; if one of them is dispatched again its task finds nothing
+    left to claim.
+
+    Returns:
+        bool: True if there was nothing to send and the campaign completed
+    """
+    reset(campaign_id)
+    _redis().delete(_inflight_key(campaign_id))
+    add(campaign_id, unfinished)
+    return seal(campaign_id)
+
+
+def seal(campaign_id):
+    """
+    Mark the dispatch as complete, nothing more will be added
+
+    Completes the campaign if every batch already finished.
+
+    Returns:
+        bool: True if this call completed the campaign
+    """
+    return _finish(campaign_id, 0, seal=True)
+
+
+def done(campaign_id, count):
+    """
+    Record recipients a batch is done with (sent, failed or skipped)
+
+    Returns:
+        bool: True if this call completed the campaign, None if Redis was
+        unavailable and completion must be checked some other way
+    """
+    try:
+        return _finish(campaign_id, count)
+    except redis.RedisError as e:
+        logger.warning(f"Progress latch unavailable for campaign {campaign_id}: {str(e)}")
+        return None
+
+
+def remaining(campaign_id):
+    """Recipients queued but not finished yet, None if not tracked"""
+    value = _redis().hget(_progress_key(campaign_id), 'remaining')
+    return int(value) if value is not None else None
+
+
+def _inflight_key(campaign_id):
+    return f"campaign_inflight_batches:{campaign_id}"
+
+
+def mark_inflight(campaign_id, batch, countdown=0):
+    """
+    Record a batch as published and not finished yet
+
+    Marking it again (a re-queued batch) moves its deadline.
+
+    Args:
+        campaign_id: ID of the campaign
+        batch: Batch number
+        countdown: Seconds before its task runs
+    """
+    deadline = time.time() + countdown + settings.CAMPAIGN_BATCH_TIMEOUT_SECONDS
+    pipe = _redis().pipeline(transaction=False)
+    pipe.zadd(_inflight_key(campaign_id), {batch: deadline})
+    pipe.expire(_inflight_key(campaign_id), PROGRESS_TTL_SECONDS)
+    pipe.execute()
+
+
+def release_inflight(campaign_id, batch):
+    """Free the batch's dispatch slot"""
+    _redis().zrem(_inflight_key(campaign_id), batch)
+
+
+def inflight_batches(campaign_id):
+    """Batch numbers currently in flight, batches past their deadline are dropped"""
+    pipe = _redis().pipeline(transaction=False)
+    pipe.zremrangebyscore(_inflight_key(campaign_id), '-inf', time.time())
+    pipe.zrange(_inflight_key(campaign_id), 0, -1)
+    expired, batches = pipe.execute()
+
+    if expired:
+        logger.warning(f"{expired} batches of campaign {campaign_id} timed out, they will be dispatched again")
+    return {int(batch) for batch in batches}
+
+
+def _finish(campaign_id, count, seal=False):
+    script = _redis().register_script(FINISH_SCRIPT)
+    won = script(
+        keys=[_progress_key(campaign_id)],
+        args=[count, 1 if seal else 0, PROGRESS_TTL_SECONDS]
+    )
+
+    if int(won):
+        complete_campaign(campaign_id)
+        return True
+
+    return False
+
+
+def complete_campaign(campaign_id):
+    """Flip a sending campaign to sent"""
+    from apps.campaigns.models import Campaign
+
+    now = timezone.now()
+    updated = Campaign.objects.filter(id=campaign_id, status='sending').update(
+        status='sent',
+        completed_at=now,
+        updated_at=now
+    )
+
+    if updated:
+        logger.info(f"Campaign {campaign_id} completed")
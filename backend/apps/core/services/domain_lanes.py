@@ -0,0 +1,177 @@
+"""
+Per-recipient-domain sending lanes
+
+Recipients are grouped by the domain of their address (SES_DOMAIN_GROUPS)
+so that one mailbox provider can't take the whole SES rate. Every lane
+has its own token bucket, drawn from before the global SES bucket, and a
+ceiling on the batches sending to it at the same time. Snapshot batches
+hold a single lane and are numbered round-robin across lanes, so the
+scheduler interleaves providers while it walks the batches in order.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.db.models import Case, CharField, IntegerField, Value, When
+from django.db.models.functions import Lower, StrIndex, Substr
+
+from .rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Lane of every domain not listed in SES_DOMAIN_GROUPS
+DEFAULT_LANE = 'other'
+
+# KEYS[1] = slot sorted set (member = token, score = expiry)
+# ARGV[1] = now, ARGV[2] = concurrency, ARGV[3] = token, ARGV[4] = TTL
+ACQUIRE_SLOT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + tonumber(ARGV[4]), ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def lanes():
+    """
+    Lane names in snapshot order, DEFAULT_LANE last
+
+    Returns:
+        list: Lane names
+    """
+    return [name for name in settings.SES_DOMAIN_GROUPS if name != DEFAULT_LANE] + [DEFAULT_LANE]
+
+
+def lane_config(lane):
+    """
+    Rate and concurrency of a lane
+
+    Returns:
+        dict: rate (emails/second, 0 = only the global limit) and
+        concurrency (batches at once, 0 = unlimited)
+    """
+    if lane in settings.SES_DOMAIN_GROUPS:
+        group = settings.SES_DOMAIN_GROUPS[lane]
+        return {
+            'rate': float(group.get('rate') or 0),
+            'concurrency': int(group.get('concurrency') or 0),
+        }
+
+    return {
+        'rate': settings.SES_DOMAIN_DEFAULT_RATE,
+        'concurrency': settings.SES_DOMAIN_DEFAULT_CONCURRENCY,
+    }
+
+
+def _domain_map():
+    return {
+        domain.lower(): name
+        for name, group in settings.SES_DOMAIN_GROUPS.items()
+        for domain in group.get('domains', [])
+    }
+
+
+def lane_for_email(email):
+    """Lane an address is sent through"""
+    domain = email.rsplit('@', 1)[-1].strip().lower()
+    return _domain_map().get(domain, DEFAULT_LANE)
+
+
+def annotate_lanes(queryset, field='email'):
+    """
+    Alias each row's lane in SQL
+
+    Adds lane_name and lane_index (position in lanes()) as aliases usable
+    in later annotations, filters and window partitions.
+
+    Args:
+        queryset: Queryset with an email field
+        field: Name of that field
+    """
+    order = lanes()
+    groups = [
+        (name, [domain.lower() for domain in group.get('domains', [])])
+        for name, group in settings.SES_DOMAIN_GROUPS.items()
+        if name != DEFAULT_LANE and group.get('domains')
+    ]
+
+    queryset = queryset.alias(
+        lane_domain=Lower(Substr(field, StrIndex(field, Value('@')) + 1))
+    )
+
+    if not groups:
+        return queryset.alias(
+            lane_name=Value(DEFAULT_LANE, output_field=CharField()),
+            lane_index=Value(0, output_field=IntegerField()),
+        )
+
+    return queryset.alias(
+        lane_name=Case(
+            *[When(lane_domain__in=domains, then=Value(name)) for name, domains in groups],
+            default=Value(DEFAULT_LANE),
+            output_field=CharField()
+        ),
+        lane_index=Case(
+            *[When(lane_domain__in=domains, then=Value(order.index(name))) for name, domains in groups],
+            default=Value(order.index(DEFAULT_LANE)),
+            output_field=IntegerField()
+        ),
+    )
+
+
+def get_bucket(lane):
+    """Token bucket of a lane, None when it only has the global limit"""
+    rate = lane_config(lane)['rate']
+    if not rate:
+        return None
+    return TokenBucket(_redis(), f"ses_rate_limit:lane:{lane}", rate)
+
+
+def _slots_key(lane):
+    return f"ses_lane_slots:{lane}"
+
+
+def acquire_slot(lane):
+    """
+    Take one of the lane's concurrent batch slots
+
+    A slot is held for CAMPAIGN_BATCH_TIMEOUT_SECONDS at most, so a slow
+    batch keeps it while it sends and one whose worker died gives it back
+    when the batch is presumed lost.
+
+    Returns:
+        str: Token to release the slot with, '' if the lane has no
+        ceiling, None if every slot is taken
+    """
+    concurrency = lane_config(lane)['concurrency']
+    if not concurrency:
+        return ''
+
+    token = uuid.uuid4().hex
+    acquired = _redis().register_script(ACQUIRE_SLOT_SCRIPT)(
+        keys=[_slots_key(lane)],
+        args=[time.time(), concurrency, token, settings.CAMPAIGN_BATCH_TIMEOUT_SECONDS]
+    )
+    return token if int(acquired) else None
+
+
+def release_slot(lane, token):
+    """Give a slot back (no-op for the '' token of an unlimited lane)"""
+    if token:
+        _redis().zrem(_slots_key(lane), token)
+
+
+def active_slots(lane):
+    """Batches currently sending to a lane"""
+    client = _redis()
+    client.zremrangebyscore(_slots_key(lane), '-inf', time.time())
+    return client.zcard(_slots_key(lane))
@@ -0,0 +1,133 @@
+"""
+Distributed token bucket rate limiter backed by Redis
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# KEYS[1] = bucket hash
+# ARGV[1] = default rate (tokens/second), ARGV[2] = default capacity,
+# ARGV[3] = tokens requested, ARGV[4] = max wait in seconds (-1 = no limit)
+#
+# Refill, check and consume happen in one script, so concurrent workers
+# can never observe the same tokens. A granted request may drive the
+# bucket negative; that debt is the wait time the caller must honour
+# before sending, which keeps reservations first-come first-served.
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local requested = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', key, 'tokens', 'ts', 'rate', 'capacity')
+local rate = tonumber(state[3]) or tonumber(ARGV[1])
+local capacity = tonumber(state[4]) or tonumber(ARGV[2])
+
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens < requested then
+    wait = (requested - tokens) / rate
+end
+
+-- Requests bigger than the burst capacity can never be served without
+-- waiting for the excess to refill, that part doesn't count against max_wait
+local unavoidable = math.max(0, requested - capacity) / rate
+
+local granted = 0
+if max_wait < 0 or wait - unavoidable <= max_wait then
+    tokens = tokens - requested
+    granted = 1
+else
+    -- Refused: the request is granted again once the avoidable part of the
+    -- wait is down to max_wait, the unavoidable refill is waited after that
+    wait = wait - unavoidable - max_wait
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', key, 3600)
+
+return {granted, tostring(wait)}
+"""
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every worker through one Redis hash
+
+    Args:
+        redis_client: Redis connection
+        key: Redis key of the bucket
+        rate: Tokens added per second (fractional rates are fine)
+        capacity: Maximum burst size, defaults to one second of rate
+    """
+
+    def __init__(self, redis_client, key, rate, capacity=None):
+        self.redis_client = redis_client
+        self.key = key
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def reserve(self, tokens=1, max_wait=None):
+        """
+        Reserve tokens, possibly ahead of time
+
+        Args:
+            tokens: Number of tokens (emails) to reserve
+            max_wait: Refuse the reservation if it would need a longer wait
+                (not counting the refill time of tokens beyond capacity)
+
+        Returns:
+            tuple: (granted, wait_seconds). When granted the caller must
+            wait wait_seconds before using the tokens. When refused nothing
+            is consumed and wait_seconds says when the same reservation
+            would be granted.
+        """
+        granted, wait = self._script(
+            keys=[self.key],
+            args=[self.rate, self.capacity, tokens, -1 if max_wait is None else max_wait]
+        )
+        return bool(int(granted)), float(wait)
+
+    def refund(self, tokens):
+        """Give back tokens reserved but not used"""
+        self.redis_client.hincrbyfloat(self.key, 'tokens', tokens)
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens only if they are available right now
+
+        Returns:
+            tuple: (granted, wait_seconds until enough tokens are available)
+        """
+        return self.reserve(tokens, max_wait=0)
+
+    def set_rate(self, rate, capacity=None):
+        """
+        Change the refill rate (and burst capacity) for every worker
+
+        Args:
+            rate: New tokens per second
+            capacity: New burst size, defaults to one second of rate
+        """
+        self.redis_client.hset(self.key, mapping={
+            'rate': float(rate),
+            'capacity': float(capacity or rate),
+        })
+        self.redis_client.expire(self.key, 3600)
+
+    def get_rate(self):
+        """Current refill rate, including overrides made with set_rate"""
+        rate = self.redis_client.hget(self.key, 'rate')
+        return float(rate) if rate is not None else self.rate
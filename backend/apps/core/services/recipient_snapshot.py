@@ -0,0 +1,198 @@
+"""
+Campaign recipient snapshot
+
+Who a campaign targets is frozen into campaign_recipients when it starts
+sending. Batches are claimed from the snapshot, so retries, pauses and
+worker crashes resume exactly where the send stopped.
+"""
+import logging
+
+from django.db import connection, transaction
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+
+from . import domain_lanes
+
+logger = logging.getLogger(__name__)
+
+
+def create_snapshot(campaign, contacts, batch_size, by_engagement=False):
+    """
+    Copy the campaign's recipients into campaign_recipients
+
+    Runs as a single INSERT ... SELECT built from the contacts queryset,
+    numbering batches of batch_size by contact id within each domain lane,
+    with the lanes interleaved. Does nothing if the campaign already has
+    a snapshot.
+
+    Args:
+        campaign: Campaign being sent
+        contacts: Contact queryset of the recipients
+        batch_size: Recipients per batch
+        by_engagement: Number the most recently engaged contacts first
+            (warm-up sends), instead of by contact id
+
+    Returns:
+        int: Recipients in the snapshot, None if it already existed
+    """
+    from apps.campaigns.models import Campaign, CampaignRecipient
+
+    with transaction.atomic():
+        # Serialises concurrent dispatchers of the same campaign
+        Campaign.objects.select_for_update().filter(id=campaign.id).first()
+
+        if CampaignRecipient.objects.filter(campaign=campaign).exists():
+            return None
+
+        # Batches hold one lane each and go round-robin across lanes:
+        # batch = (position within the lane // batch_size) * lanes + lane
+        lane_count = len(domain_lanes.lanes())
+        order_by = [F('id').asc()]
+        if by_engagement:
+            order_by.insert(0, F('last_engaged_at').desc(nulls_last=True))
+
+        rows = domain_lanes.annotate_lanes(contacts.order_by()).annotate(
+            snapshot_campaign=Value(campaign.id, output_field=IntegerField()),
+            snapshot_state=Value(CampaignRecipient.STATE_PENDING, output_field=IntegerField()),
+            snapshot_batch=(
+                (Window(RowNumber(), partition_by=[F('lane_index')], order_by=order_by) - 1)
+                / Value(batch_size, output_field=IntegerField())
+            ) * Value(lane_count, output_field=IntegerField()) + F('lane_index'),
+            snapshot_lane=F('lane_name'),
+        ).values_list('id', 'snapshot_campaign', 'snapshot_state', 'snapshot_batch', 'snapshot_lane')
+
+        select_sql, params = rows.query.sql_with_params()
+        table = CampaignRecipient._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (contact_id, campaign_id, state, batch, lane) {select_sql}",
+                params
+            )
+            count = cursor.rowcount
+
+    logger.info(f"Snapshot of {count} recipients taken for campaign {campaign.id}")
+    return count
+
+
+def pending_count(campaign_id):
+    """Recipients of the campaign that weren't sent yet"""
+    from apps.campaigns.models import CampaignRecipient
+
+    return CampaignRecipient.objects.filter(
+        campaign_id=campaign_id,
+        state=CampaignRecipient.STATE_PENDING
+    ).count()
+
+
+def unfinished_count(campaign_id):
+    """Recipients of the campaign that are pending or being sent"""
+    from apps.campaigns.models import CampaignRecipient
+
+    return CampaignRecipient.objects.filter(
+        campaign_id=campaign_id,
+        state__in=[CampaignRecipient.STATE_PENDING, CampaignRecipient.STATE_SENDING]
+    ).count()
+
+
+def next_pending_batch(campaign_id, cursor=0, exclude=()):
+    """
+    First batch at or after cursor that still has pending recipients
+
+    Args:
+        campaign_id: ID of the campaign
+        cursor: Lowest batch number to consider
+        exclude: Batch numbers to skip (already in flight)
+
+    Returns:
+        int: Batch number, None when no pending batch is left
+    """
+    from apps.campaigns.models import CampaignRecipient
+
+    return (
+        CampaignRecipient.objects
+        .filter(campaign_id=campaign_id, state=CampaignRecipient.STATE_PENDING, batch__gte=cursor)
+        .exclude(batch__in=list(exclude))
+        .order_by('batch')
+        .values_list('batch', flat=True)
+        .first()
+    )
+
+
+def claim_batch(campaign_id, batch):
+    """
+    Lock the pending recipients of a batch
+
+    Must run inside a transaction. Rows locked by another worker are
+    skipped, so the same recipient is never claimed twice. The lock only
+    lasts until the transaction ends: the caller moves the rows it keeps
+    out of pending before committing, and keeps the transaction short.
+
+    Returns:
+        list: CampaignRecipient rows with their contacts loaded
+    """
+    from apps.campaigns.models import CampaignRecipient
+
+    return list(
+        CampaignRecipient.objects
+        .select_for_update(skip_locked=True, of=('self',))
+        .select_related('contact')
+        .filter(campaign_id=campaign_id, batch=batch, state=CampaignRecipient.STATE_PENDING)
+        .order_by('id')
+    )
+
+
+def close_abandoned(campaign_id, older_than):
+    """
+    Fail the recipients a lost batch left sending
+
+    A worker that died (or failed to save its results) after claiming a
+    batch leaves its recipients sending with 'sending' email logs. Whether
+    SES got those emails is unknown, so they are never sent again: the
+    recipients and their logs are marked failed.
+
+    Args:
+        campaign_id: ID of the campaign
+        older_than: Only logs created before this are closed, a batch
+            still being sent is left alone
+
+    Returns:
+        int: Recipients closed
+    """
+    from django.utils import timezone
+
+    from apps.analytics.models import EmailLog
+    from apps.campaigns.models import CampaignRecipient
+
+    sending = CampaignRecipient.objects.filter(campaign_id=campaign_id, state=CampaignRecipient.STATE_SENDING)
+
+    with transaction.atomic():
+        contact_ids = list(
+            EmailLog.objects
+            .filter(
+                campaign_id=campaign_id,
+                contact_id__in=sending.values('contact_id'),
+                attempt=1,
+                status='sending',
+                created_at__lt=older_than
+            )
+            .values_list('contact_id', flat=True)
+        )
+        if not contact_ids:
+            return 0
+
+        EmailLog.objects.filter(
+            campaign_id=campaign_id,
+            contact_id__in=contact_ids,
+            attempt=1,
+            status='sending'
+        ).update(
+            status='failed',
+            error_message='Batch lost while sending, delivery unknown',
+            updated_at=timezone.now()
+        )
+        closed = sending.filter(contact_id__in=contact_ids).update(state=CampaignRecipient.STATE_FAILED)
+
+    logger.warning(f"{closed} recipients of campaign {campaign_id} were left sending by a lost batch, failed")
+    return closed
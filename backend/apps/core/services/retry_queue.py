@@ -0,0 +1,135 @@
+"""
+Delay queue of failed sends waiting to be retried
+
+A send that failed with a retryable error gets next_retry_at on its
+email log, exponential in its attempt number, and its log ID goes into a
+Redis sorted set scored by that time. retry_failed_emails_task pops the
+entries that are due and sends the next attempt, so no task scans the
+failed logs. Logs keep next_retry_at until they are popped, which lets
+the queue be rebuilt from the database when Redis lost some of it.
+"""
+import logging
+import time
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+RETRY_QUEUE_KEY = 'email_retry_queue'
+REBUILT_KEY = 'email_retry_queue:rebuilt'
+
+# How often the queue is checked against the database while it isn't empty
+REBUILD_INTERVAL_SECONDS = 300
+
+# KEYS[1] = retry queue
+# ARGV[1] = now, ARGV[2] = max entries
+#
+# Pops the due entries atomically, so two drainers never retry the same log
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def should_retry(result, attempt):
+    """Whether a failed send result is retried as attempt + 1"""
+    return not result.get('permanent') and attempt < settings.EMAIL_RETRY_MAX_ATTEMPTS
+
+
+def retry_at(attempt):
+    """When the attempt after a failed one is due"""
+    backoff = min(
+        settings.EMAIL_RETRY_MAX_BACKOFF_SECONDS,
+        settings.EMAIL_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+    )
+    return timezone.now() + timedelta(seconds=backoff)
+
+
+def push(email_logs):
+    """
+    Queue email logs for retry at their next_retry_at
+
+    Call after the logs are committed, a drainer may pop them right away.
+    """
+    entries = {email_log.id: email_log.next_retry_at.timestamp() for email_log in email_logs}
+    if not entries:
+        return
+
+    try:
+        _redis().zadd(RETRY_QUEUE_KEY, entries)
+    except redis.RedisError as e:
+        # Still in the database, rebuild() picks them up
+        logger.warning(f"Could not queue {len(entries)} retries: {str(e)}")
+
+
+def postpone(email_logs):
+    """
+    Hold back the retries of a paused campaign
+
+    They are due again after the first backoff, and postponed again for
+    as long as the campaign stays paused.
+    """
+    from apps.analytics.models import EmailLog
+
+    email_logs = list(email_logs)
+    for email_log in email_logs:
+        email_log.next_retry_at = retry_at(1)
+    EmailLog.objects.bulk_update(email_logs, ['next_retry_at'])
+    push(email_logs)
+
+
+def pop_due(limit=1000):
+    """
+    Take the log IDs whose retry is due
+
+    Returns:
+        list: Email log IDs, at most limit
+    """
+    due = _redis().register_script(POP_DUE_SCRIPT)(keys=[RETRY_QUEUE_KEY], args=[time.time(), limit])
+    return [int(email_log_id) for email_log_id in due]
+
+
+def size():
+    """Retries waiting in the queue"""
+    return _redis().zcard(RETRY_QUEUE_KEY)
+
+
+def rebuild_due():
+    """Whether to rebuild now: the queue is empty, or it wasn't rebuilt for REBUILD_INTERVAL_SECONDS"""
+    client = _redis()
+    if not client.zcard(RETRY_QUEUE_KEY):
+        return True
+    return bool(client.set(REBUILT_KEY, 1, nx=True, ex=REBUILD_INTERVAL_SECONDS))
+
+
+def rebuild(limit=10000):
+    """
+    Queue the logs the database says are waiting for a retry
+
+    Only reads logs with next_retry_at set (indexed). Logs already in the
+    queue keep their entry, ZADD only sets their score again.
+
+    Returns:
+        int: Retries queued
+    """
+    from apps.analytics.models import EmailLog
+
+    email_logs = list(
+        EmailLog.objects
+        .filter(next_retry_at__isnull=False)
+        .only('id', 'next_retry_at')
+        .order_by('next_retry_at')[:limit]
+    )
+    push(email_logs)
+    return len(email_logs)
@@ -0,0 +1,88 @@
+"""
+Idempotency keys of individual sends
+
+Every send of a campaign email to a contact is identified by
+(campaign, contact, attempt). Before calling SES a worker claims the
+send's key in Redis with SET NX; whoever finds the key taken drops the
+send, so a retried task, a re-run batch or a retry enqueued twice never
+delivers the same attempt twice. The unique (campaign, contact, attempt)
+constraint on EmailLog backs this up when Redis has lost the key.
+
+A key is only given back when the send certainly did not happen
+(throttled, or the log could not be written): when in doubt the
+recipient gets at most one email.
+"""
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Covers retries and re-runs of a send; after that the EmailLog constraint
+# alone keeps a million-recipient campaign from pinning a key per email
+SEND_KEY_TTL_SECONDS = 24 * 3600
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def send_key(campaign_id, contact_id, attempt):
+    return f"send_key:{campaign_id}:{contact_id}:{attempt}"
+
+
+def placeholder_message_id(campaign_id, contact_id, attempt):
+    """
+    message_id stored until SES returns the real one
+
+    Unique like the (campaign, contact, attempt) it is built from, so
+    logs that are still sending never collide on message_id.
+    """
+    return f"pending:{campaign_id}:{contact_id}:{attempt}"
+
+
+def claim(campaign_id, contact_id, attempt):
+    """
+    Claim one send
+
+    Returns:
+        bool: False if the send was already claimed. True when Redis is
+        unavailable, the EmailLog constraint is then the only check.
+    """
+    try:
+        return bool(_redis().set(send_key(campaign_id, contact_id, attempt), 1, nx=True, ex=SEND_KEY_TTL_SECONDS))
+    except redis.RedisError as e:
+        logger.warning(f"Could not claim send key, relying on the database: {str(e)}")
+        return True
+
+
+def claim_many(campaign_id, contact_ids, attempt=1):
+    """
+    Claim the sends of many contacts in one round trip
+
+    Returns:
+        set: Contact IDs whose send was claimed now
+    """
+    contact_ids = list(contact_ids)
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for contact_id in contact_ids:
+            pipe.set(send_key(campaign_id, contact_id, attempt), 1, nx=True, ex=SEND_KEY_TTL_SECONDS)
+        claimed = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not claim send keys, relying on the database: {str(e)}")
+        return set(contact_ids)
+
+    return {contact_id for contact_id, ok in zip(contact_ids, claimed) if ok}
+
+
+def release(campaign_id, contact_ids, attempt=1):
+    """Give back claims of sends that did not happen, so a retry can make them"""
+    if not contact_ids:
+        return
+
+    try:
+        _redis().delete(*[send_key(campaign_id, contact_id, attempt) for contact_id in contact_ids])
+    except redis.RedisError as e:
+        logger.warning(f"Could not release send keys: {str(e)}")
@@ -0,0 +1,169 @@
+"""
+Fair-share scheduling of send batches across campaigns
+
+Only one scheduler pass runs at a time (Redis lock). Each pass hands the
+free batch slots to the sending campaigns with smooth weighted
+round-robin: every campaign earns its priority weight per pick and the
+one with the most credit gets the slot, so a high priority campaign
+gets most of the slots without starving the others. Campaigns with a
+max_send_rate are also held to it by their own token bucket.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+
+from .rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'send_scheduler:lock'
+REQUEST_KEY = 'send_scheduler:requested'
+CREDIT_KEY = 'send_scheduler:credit'
+
+# Only delete the lock if it wasn't taken over after expiring
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def acquire_lock(timeout=60):
+    """
+    Take the scheduler lock
+
+    Returns:
+        str: Token to release the lock with, None if it is held elsewhere
+    """
+    token = uuid.uuid4().hex
+    if _redis().set(LOCK_KEY, token, nx=True, ex=timeout):
+        return token
+    return None
+
+
+def release_lock(token):
+    """Release the scheduler lock if this caller still holds it"""
+    _redis().register_script(RELEASE_LOCK_SCRIPT)(keys=[LOCK_KEY], args=[token])
+
+
+def request_pass():
+    """Ask the running scheduler to make another pass"""
+    _redis().set(REQUEST_KEY, 1)
+
+
+def has_request():
+    """Whether a pass was requested and not made yet"""
+    return bool(_redis().exists(REQUEST_KEY))
+
+
+def take_request():
+    """Clear a pending pass request, True if there was one"""
+    return bool(_redis().delete(REQUEST_KEY))
+
+
+def weight(campaign):
+    """Scheduling weight of a campaign's priority class"""
+    return settings.CAMPAIGN_PRIORITY_WEIGHTS.get(campaign.priority, 1)
+
+
+def forget_inactive(active_ids):
+    """Drop the round-robin credit of campaigns that stopped sending"""
+    client = _redis()
+    stale = [field for field in client.hkeys(CREDIT_KEY) if int(field) not in active_ids]
+    if stale:
+        client.hdel(CREDIT_KEY, *stale)
+
+
+def pick(campaigns):
+    """
+    Choose the campaign that gets the next batch slot
+
+    Args:
+        campaigns: Campaigns that can use a slot right now
+
+    Returns:
+        Campaign
+    """
+    client = _redis()
+    ids = [campaign.id for campaign in campaigns]
+    credit = {
+        campaign_id: float(value or 0)
+        for campaign_id, value in zip(ids, client.hmget(CREDIT_KEY, ids))
+    }
+
+    total = 0
+    for campaign in campaigns:
+        credit[campaign.id] += weight(campaign)
+        total += weight(campaign)
+
+    chosen = max(campaigns, key=lambda campaign: credit[campaign.id])
+    credit[chosen.id] -= total
+
+    client.hset(CREDIT_KEY, mapping=credit)
+    return chosen
+
+
+def reserve_rate(campaign, emails):
+    """
+    Charge a batch to the campaign's max_send_rate
+
+    A batch is bigger than the bucket's one second burst, so a granted
+    batch comes with the wait that pays for it: it must not be sent
+    before then.
+
+    Returns:
+        tuple: (granted, wait_seconds). Granted: the countdown to publish
+        the batch with. Refused: when to try again. Campaigns without a
+        cap are always granted right away.
+    """
+    if not campaign.max_send_rate:
+        return True, 0.0
+
+    bucket = TokenBucket(_redis(), f"campaign_rate:{campaign.id}", campaign.max_send_rate)
+    return bucket.reserve(emails, max_wait=0)
+
+
+def record_sent(campaign_id, count):
+    """Count emails sent by a campaign in the current minute"""
+    if not count:
+        return
+
+    key = f"campaign_throughput:{campaign_id}:{int(time.time() // 60)}"
+    pipe = _redis().pipeline(transaction=False)
+    pipe.incrby(key, count)
+    pipe.expire(key, 180)
+    pipe.execute()
+
+
+def throughput(campaign_id):
+    """
+    Recent send rate of a campaign
+
+    Sliding one minute window approximated from the current and previous
+    minute counters.
+
+    Returns:
+        dict: sent_last_minute and emails_per_second
+    """
+    now = time.time()
+    minute = int(now // 60)
+    elapsed = (now % 60) / 60
+
+    current, previous = _redis().mget(
+        f"campaign_throughput:{campaign_id}:{minute}",
+        f"campaign_throughput:{campaign_id}:{minute - 1}",
+    )
+    sent = int(current or 0) + int(previous or 0) * (1 - elapsed)
+
+    return {
+        'sent_last_minute': round(sent),
+        'emails_per_second': round(sent / 60, 2),
+    }
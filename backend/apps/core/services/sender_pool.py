@@ -0,0 +1,237 @@
+"""
+Pool of SES endpoints (regions / accounts) sends are sharded across
+
+Each shard has its own client, token bucket, adaptive rate and 24h
+quota. Batches pick a shard by weight among the ones allowed for the
+campaign's sending domain; a shard that keeps throttling or failing is
+taken out of rotation for a cooldown and its batches fail over to the
+others. Without SES_SENDER_SHARDS the pool is a single 'default' shard
+built from the AWS_* settings.
+"""
+import logging
+import random
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD = 'default'
+
+
+class SenderShard:
+    """
+    One SES endpoint of the pool
+
+    Args:
+        name: Unique shard name, used in Redis keys and logs
+        region: AWS region
+        access_key_id: Credentials, None for the default credential chain
+        secret_access_key: Credentials, None for the default credential chain
+        endpoint_url: Endpoint override (local SES stub)
+        configuration_set: SES configuration set of the account
+        rate_limit: Emails per second before the adaptive rate takes over
+        burst: Token bucket capacity, one second of rate_limit if empty
+        weight: Share of the batches among eligible shards
+        domains: Sending domains pinned to this shard (empty = any domain
+            not pinned elsewhere)
+    """
+
+    def __init__(self, name, region, access_key_id=None, secret_access_key=None, endpoint_url=None,
+                 configuration_set='', rate_limit=None, burst=None, weight=1, domains=()):
+        self.name = name
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.endpoint_url = endpoint_url or None
+        self.configuration_set = configuration_set or ''
+        self.rate_limit = float(rate_limit or settings.SES_RATE_LIMIT_PER_SECOND)
+        self.burst = float(burst or self.rate_limit)
+        self.weight = float(weight)
+        self.domains = {domain.lower() for domain in domains}
+
+    def __repr__(self):
+        return f"<SenderShard {self.name} ({self.region})>"
+
+    @property
+    def bucket_key(self):
+        # The default shard keeps the keys used before sharding
+        if self.name == DEFAULT_SHARD:
+            return 'ses_rate_limit:bucket'
+        return f"ses_rate_limit:bucket:{self.name}"
+
+    @property
+    def adaptive_key(self):
+        if self.name == DEFAULT_SHARD:
+            return 'ses_adaptive_rate'
+        return f"ses_adaptive_rate:{self.name}"
+
+
+def get_shards():
+    """
+    Shards configured in SES_SENDER_SHARDS
+
+    Returns:
+        list: SenderShard objects, the default one first
+    """
+    if not settings.SES_SENDER_SHARDS:
+        return [SenderShard(
+            DEFAULT_SHARD,
+            region=settings.AWS_SES_REGION,
+            access_key_id=settings.AWS_ACCESS_KEY_ID,
+            secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            endpoint_url=settings.AWS_SES_ENDPOINT_URL,
+            configuration_set=settings.AWS_SES_CONFIGURATION_SET,
+            burst=settings.SES_RATE_LIMIT_BURST,
+        )]
+
+    return [
+        SenderShard(
+            config.get('name', DEFAULT_SHARD if index == 0 else f"shard{index}"),
+            region=config.get('region', settings.AWS_SES_REGION),
+            access_key_id=config.get('access_key_id'),
+            secret_access_key=config.get('secret_access_key'),
+            endpoint_url=config.get('endpoint_url'),
+            configuration_set=config.get('configuration_set', ''),
+            rate_limit=config.get('rate_limit'),
+            burst=config.get('burst'),
+            weight=config.get('weight', 1),
+            domains=config.get('domains', ()),
+        )
+        for index, config in enumerate(settings.SES_SENDER_SHARDS)
+    ]
+
+
+def default_shard():
+    """Shard used when the caller doesn't pick one"""
+    return get_shards()[0]
+
+
+def get_shard(name):
+    """Shard by name, None if it isn't configured (anymore)"""
+    for shard in get_shards():
+        if shard.name == name:
+            return shard
+    return None
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def _failures_key(shard):
+    return f"ses_shard:{shard.name}:failures"
+
+
+def _down_key(shard):
+    return f"ses_shard:{shard.name}:down"
+
+
+def record_failure(shard, reason):
+    """
+    Count a throttle or endpoint error against a shard
+
+    SES_SHARD_FAILURE_THRESHOLD failures within
+    SES_SHARD_FAILURE_WINDOW_SECONDS take the shard out of rotation for
+    SES_SHARD_COOLDOWN_SECONDS.
+    """
+    try:
+        client = _redis()
+        failures = client.incr(_failures_key(shard))
+        if failures == 1:
+            client.expire(_failures_key(shard), settings.SES_SHARD_FAILURE_WINDOW_SECONDS)
+
+        if failures >= settings.SES_SHARD_FAILURE_THRESHOLD:
+            if client.set(_down_key(shard), reason, nx=True, ex=settings.SES_SHARD_COOLDOWN_SECONDS):
+                logger.warning(
+                    f"SES shard {shard.name} marked unhealthy after {failures} failures ({reason}), "
+                    f"failing over for {settings.SES_SHARD_COOLDOWN_SECONDS}s"
+                )
+            client.delete(_failures_key(shard))
+    except redis.RedisError as e:
+        logger.warning(f"Could not record failure of SES shard {shard.name}: {str(e)}")
+
+
+def healthy(shards):
+    """
+    Shards that aren't in a failure cooldown
+
+    Returns:
+        list: The healthy shards, in the same order
+    """
+    try:
+        down = _redis().mget([_down_key(shard) for shard in shards])
+    except redis.RedisError:
+        return list(shards)
+    return [shard for shard, state in zip(shards, down) if state is None]
+
+
+def choose(from_email, count=None):
+    """
+    Pick the shard a batch is sent through
+
+    A sending domain pinned to some shards only uses those, any other
+    domain uses the shards without pinned domains. Shards without count
+    emails left in their 24h quota are skipped; among the healthy
+    remaining shards the choice is random by weight. When every one of
+    them is cooling down the least bad option is to keep using them.
+
+    Args:
+        from_email: Campaign sender address
+        count: Emails about to be sent, None to ignore the quotas
+
+    Returns:
+        SenderShard, None if no eligible shard has count emails of quota left
+    """
+    from .ses_service import SESService
+
+    domain = from_email.rsplit('@', 1)[-1].strip().lower()
+    shards = get_shards()
+    eligible = (
+        [shard for shard in shards if domain in shard.domains]
+        or [shard for shard in shards if not shard.domains]
+        or shards
+    )
+    if count is not None:
+        eligible = [shard for shard in eligible if SESService(shard=shard).has_send_quota(count)]
+        if not eligible:
+            return None
+    if len(eligible) == 1:
+        return eligible[0]
+
+    candidates = healthy(eligible)
+    if not candidates:
+        logger.warning(f"No healthy SES shard for {domain}, using unhealthy ones")
+        candidates = eligible
+
+    return random.choices(candidates, weights=[shard.weight for shard in candidates])[0]
+
+
+def has_send_quota(count=1):
+    """Whether any shard has count more emails left in its 24h quota"""
+    from .ses_service import SESService
+
+    return any(SESService(shard=shard).has_send_quota(count) for shard in get_shards())
+
+
+def status():
+    """
+    Health and rate of every shard
+
+    Returns:
+        list: One dict per shard
+    """
+    from .ses_service import SESService
+
+    shards = get_shards()
+    up = {shard.name for shard in healthy(shards)}
+
+    return [{
+        'name': shard.name,
+        'region': shard.region,
+        'weight': shard.weight,
+        'domains': sorted(shard.domains),
+        'healthy': shard.name in up,
+        'send_rate': SESService(shard=shard).rate_limiter.get_rate(),
+    } for shard in shards]
@@ -0,0 +1,467 @@
+"""
+Batched ingestion of SES notifications
+
+The SNS webhook appends each SNS message, unparsed, to a Redis Stream
+and returns. consume_ses_notifications_task reads the stream through a
+consumer group in batches of SES_NOTIFICATION_BATCH_SIZE and processes a
+whole batch at once: one IN query resolves the email logs, events are
+written with bulk_create, log statuses with bulk_update, suppressions
+and engagement with one UPDATE per kind, and campaign counters as
+aggregated deltas.
+
+Entries are acknowledged once their batch is committed, entries that
+don't hold a valid notification are acknowledged and dropped. When a
+batch fails its entries are applied one by one, so a bad one can't hold
+back the others: it stays pending in the group and is claimed again by
+a consumer after CLAIM_IDLE_MS, until it was delivered MAX_DELIVERIES
+times and goes to the DEAD_LETTER_KEY stream.
+
+SNS delivers at least once, so every notification has a dedup key: its
+SNS MessageId, or its SES event identity when it came without one. Keys
+already seen are dropped before any database work by a Redis set-if-new
+check, and EmailEvent.dedup_key is unique in case Redis forgot them.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'ses_notifications'
+GROUP = 'ses_notification_consumers'
+
+# Entries that kept failing, kept for inspection
+DEAD_LETTER_KEY = 'ses_notifications:dead'
+DEAD_LETTER_MAXLEN = 10000
+
+# Entries a consumer took but never acknowledged are retried after this
+CLAIM_IDLE_MS = 60 * 1000
+
+# Deliveries of an entry that fails before it is dead-lettered
+MAX_DELIVERIES = 5
+
+# KEYS = seen keys, ARGV[1] = TTL, ARGV[2..] = stream entry ID of each key
+#
+# Returns 1 per key that is new, or already held by the same stream entry
+# (a batch that failed and was claimed again), 0 per duplicate.
+SEEN_SCRIPT = """
+local fresh = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('SET', key, ARGV[i + 1], 'NX', 'EX', ARGV[1]) then
+        fresh[i] = 1
+    elseif redis.call('GET', key) == ARGV[i + 1] then
+        fresh[i] = 1
+    else
+        fresh[i] = 0
+    end
+end
+return fresh
+"""
+
+# notificationType -> (EmailEvent type, campaign counter, new EmailLog status)
+NOTIFICATION_TYPES = {
+    'Bounce': ('bounce', 'bounce_count', 'bounced'),
+    'Complaint': ('complaint', 'complaint_count', 'complained'),
+    'Delivery': ('delivery', 'delivered_count', 'delivered'),
+    'Send': ('send', None, None),
+    'Reject': ('reject', None, 'failed'),
+    'Open': ('open', 'open_count', None),
+    'Click': ('click', 'click_count', None),
+}
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def consumer_name():
+    """Name of this process in the consumer group"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def append(message):
+    """
+    Add one notification to the stream
+
+    Args:
+        message: SNS message body as received (or a bare SES
+            notification), str or bytes
+    """
+    _redis().xadd(
+        STREAM_KEY,
+        {'data': message},
+        maxlen=settings.SES_NOTIFICATION_STREAM_MAXLEN,
+        approximate=True
+    )
+
+
+def ensure_group():
+    """Create the consumer group (and the stream) if they don't exist"""
+    try:
+        _redis().xgroup_create(STREAM_KEY, GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def read(consumer, count):
+    """
+    Take up to count entries for a consumer
+
+    Entries abandoned by a dead consumer come first, then new ones.
+
+    Returns:
+        list: (entry ID, fields) pairs
+    """
+    client = _redis()
+    _, entries, *_ = client.xautoclaim(STREAM_KEY, GROUP, consumer, min_idle_time=CLAIM_IDLE_MS, count=count)
+    entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+
+    if len(entries) < count:
+        response = client.xreadgroup(GROUP, consumer, {STREAM_KEY: '>'}, count=count - len(entries))
+        for _, stream_entries in response:
+            entries.extend(stream_entries)
+
+    return entries
+
+
+def ack(entry_ids):
+    """Acknowledge processed entries and drop them from the stream"""
+    if not entry_ids:
+        return
+
+    pipe = _redis().pipeline(transaction=False)
+    pipe.xack(STREAM_KEY, GROUP, *entry_ids)
+    pipe.xdel(STREAM_KEY, *entry_ids)
+    pipe.execute()
+
+
+def dead_letter(entries):
+    """
+    Move entries that keep failing to the dead letter stream
+
+    Args:
+        entries: (entry ID, fields, error) tuples
+    """
+    if not entries:
+        return
+
+    pipe = _redis().pipeline(transaction=False)
+    for entry_id, fields, error in entries:
+        pipe.xadd(
+            DEAD_LETTER_KEY,
+            {'data': fields.get(b'data', fields.get('data', b'')), 'entry_id': entry_id, 'error': str(error)[:1000]},
+            maxlen=DEAD_LETTER_MAXLEN,
+            approximate=True
+        )
+    pipe.execute()
+    ack([entry_id for entry_id, _, _ in entries])
+    logger.error(f"{len(entries)} SES notifications failed {MAX_DELIVERIES} times, moved to {DEAD_LETTER_KEY}")
+
+
+def times_delivered(entry_ids):
+    """
+    How many times each pending entry was handed to a consumer
+
+    Returns:
+        dict: Entry ID -> deliveries
+    """
+    pipe = _redis().pipeline(transaction=False)
+    for entry_id in entry_ids:
+        pipe.xpending_range(STREAM_KEY, GROUP, min=entry_id, max=entry_id, count=1)
+
+    return {
+        entry_id: pending[0]['times_delivered'] if pending else 0
+        for entry_id, pending in zip(entry_ids, pipe.execute())
+    }
+
+
+def backlog():
+    """Entries in the stream, processed or not yet"""
+    try:
+        return _redis().xlen(STREAM_KEY)
+    except redis.RedisError:
+        return None
+
+
+def _section(notification, key):
+    """A part of a notification (mail, bounce...), {} when missing or malformed"""
+    section = notification.get(key)
+    return section if isinstance(section, dict) else {}
+
+
+def event_identity(notification):
+    """
+    Dedup key of an SES notification from its own content
+
+    The same event always gives the same key: its type, message and the
+    feedback ID or timestamp (and link) of the event.
+    """
+    notification_type = str(notification.get('notificationType', ''))
+    detail = _section(notification, notification_type[:1].lower() + notification_type[1:])
+
+    identity = '\x00'.join(str(part) for part in (
+        notification_type,
+        _section(notification, 'mail').get('messageId'),
+        detail.get('feedbackId') or detail.get('timestamp') or '',
+        detail.get('link', ''),
+    ))
+    return f"ses:{hashlib.sha1(identity.encode('utf-8')).hexdigest()}"
+
+
+def decode(fields):
+    """
+    Notification of a stream entry
+
+    Entries are whole SNS messages as the webhook received them; the SES
+    notification is their Message.
+
+    Returns:
+        tuple: (dedup key, SES notification), None if the entry holds no
+        notification or isn't valid JSON
+    """
+    data = fields.get(b'data', fields.get('data'))
+    sns_message_id = None
+    try:
+        notification = json.loads(data)
+
+        if isinstance(notification, dict) and 'Type' in notification:
+            if notification['Type'] == 'SubscriptionConfirmation':
+                # In production, you should verify and confirm the subscription
+                logger.info(f"SNS Subscription confirmation received: {notification.get('SubscribeURL')}")
+                return None
+            if notification['Type'] != 'Notification':
+                logger.info(f"Ignoring SNS {notification['Type']} message")
+                return None
+            sns_message_id = notification.get('MessageId')
+            notification = json.loads(notification.get('Message', '{}'))
+
+    except (TypeError, ValueError):
+        logger.error(f"Dropping malformed SES notification: {data!r:.200}")
+        return None
+
+    if not isinstance(notification, dict):
+        return None
+
+    return (f"sns:{sns_message_id}" if sns_message_id else event_identity(notification)), notification
+
+
+def drop_seen(entries):
+    """
+    Drop notifications already processed, or taken by another entry
+
+    Args:
+        entries: (stream entry ID, dedup key, notification) tuples
+
+    Returns:
+        list: The entries to process. All of them when Redis can't tell,
+        the database constraint catches the duplicates then.
+    """
+    if not entries:
+        return []
+
+    try:
+        fresh = _redis().register_script(SEEN_SCRIPT)(
+            keys=[f"ses_notification_seen:{dedup_key}" for _, dedup_key, _ in entries],
+            args=[settings.SES_NOTIFICATION_DEDUP_TTL_SECONDS] + [entry_id for entry_id, _, _ in entries]
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Could not check SES notifications for duplicates, relying on the database: {str(e)}")
+        return entries
+
+    kept = [entry for entry, is_fresh in zip(entries, fresh) if is_fresh]
+    if len(kept) < len(entries):
+        logger.info(f"Dropped {len(entries) - len(kept)} duplicate SES notifications")
+    return kept
+
+
+def process_batch(notifications, dedup_keys=None):
+    """
+    Apply a batch of SES notifications
+
+    Notifications are applied in order, so a later one for the same
+    message wins the log status like it did one at a time. One whose
+    dedup key already has an event is skipped.
+
+    Args:
+        notifications: SES notification dicts
+        dedup_keys: Dedup key of each notification, their event
+            identity by default
+
+    Returns:
+        int: Notifications applied
+    """
+    from apps.analytics.models import EmailLog, EmailEvent
+    from apps.contacts.models import Contact
+    from . import campaign_counters
+
+    if dedup_keys is None:
+        dedup_keys = [event_identity(notification) for notification in notifications]
+    seen = set(EmailEvent.objects.filter(dedup_key__in=dedup_keys).values_list('dedup_key', flat=True))
+
+    message_ids = [_section(notification, 'mail').get('messageId') for notification in notifications]
+    message_ids = {message_id for message_id in message_ids if isinstance(message_id, str)}
+    email_logs = {
+        email_log.message_id: email_log
+        for email_log in EmailLog.objects.filter(message_id__in=message_ids).only(
+            'id', 'message_id', 'campaign_id', 'contact_id', 'status', 'error_message', 'delivered_at'
+        )
+    }
+
+    now = timezone.now()
+    events = []
+    updated_logs = {}
+    counters = defaultdict(lambda: defaultdict(int))
+    suppressed = {}
+    engaged = set()
+    applied = 0
+
+    for notification, dedup_key in zip(notifications, dedup_keys):
+        if dedup_key in seen:
+            logger.info(f"Skipping duplicate SES notification {dedup_key}")
+            continue
+        seen.add(dedup_key)
+
+        notification_type = notification.get('notificationType')
+        if notification_type not in NOTIFICATION_TYPES:
+            logger.warning(f"Unknown notification type: {notification_type}")
+            continue
+
+        message_id = _section(notification, 'mail').get('messageId')
+        email_log = email_logs.get(message_id) if isinstance(message_id, str) else None
+        if email_log is None:
+            logger.error(f"EmailLog not found for message_id: {message_id}")
+            continue
+
+        event_type, counter, status = NOTIFICATION_TYPES[notification_type]
+        event = EmailEvent(
+            email_log=email_log,
+            event_type=event_type,
+            timestamp=now,
+            metadata=notification,
+            dedup_key=dedup_key
+        )
+
+        if notification_type == 'Bounce':
+            bounce_type = str(_section(notification, 'bounce').get('bounceType', '')).lower()
+            event.bounce_type = 'hard' if bounce_type == 'permanent' else 'soft'
+            if bounce_type == 'permanent':
+                suppressed[email_log.contact_id] = 'hard_bounce'
+        elif notification_type == 'Complaint':
+            suppressed[email_log.contact_id] = 'complaint'
+        elif notification_type == 'Delivery':
+            email_log.delivered_at = now
+        elif notification_type == 'Reject':
+            email_log.error_message = 'Rejected by SES'
+        elif notification_type in ('Open', 'Click'):
+            # Engaged contacts go first in warm-up sends
+            engaged.add(email_log.contact_id)
+
+        if status:
+            email_log.status = status
+            email_log.updated_at = now
+            updated_logs[email_log.id] = email_log
+        if counter:
+            counters[email_log.campaign_id][counter] += 1
+
+        events.append(event)
+        applied += 1
+
+    with transaction.atomic():
+        # A duplicate processed concurrently by another consumer is left out
+        EmailEvent.objects.bulk_create(events, ignore_conflicts=True)
+        EmailLog.objects.bulk_update(
+            list(updated_logs.values()),
+            ['status', 'delivered_at', 'error_message', 'updated_at']
+        )
+
+        by_reason = defaultdict(list)
+        for contact_id, reason in suppressed.items():
+            by_reason[reason].append(contact_id)
+        for reason, contact_ids in by_reason.items():
+            Contact.objects.filter(id__in=contact_ids).update(
+                is_suppressed=True,
+                suppression_reason=reason,
+                updated_at=now
+            )
+            logger.info(f"{len(contact_ids)} contacts suppressed due to {reason.replace('_', ' ')}")
+
+        if engaged:
+            Contact.objects.filter(id__in=engaged).update(last_engaged_at=now)
+
+    campaign_counters.increment_many(counters)
+
+    return applied
+
+
+def consume(consumer=None, batch_size=None, max_batches=None):
+    """
+    Drain the stream in batches
+
+    Args:
+        consumer: Consumer name, this process by default
+        batch_size: Entries per batch, SES_NOTIFICATION_BATCH_SIZE by default
+        max_batches: Stop after this many batches (None = until empty)
+
+    Returns:
+        int: Notifications applied
+    """
+    consumer = consumer or consumer_name()
+    batch_size = batch_size or settings.SES_NOTIFICATION_BATCH_SIZE
+    ensure_group()
+
+    applied = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        entries = read(consumer, batch_size)
+        if not entries:
+            break
+
+        # Entries without a valid notification are acknowledged with the batch
+        decoded = []
+        for entry_id, fields in entries:
+            try:
+                decoded.append((entry_id, decode(fields)))
+            except Exception as e:
+                logger.error(f"Dropping SES notification {entry_id!r} that could not be decoded: {str(e)}")
+        fresh = drop_seen([
+            (entry_id, *notification) for entry_id, notification in decoded if notification
+        ])
+
+        failed = {}
+        try:
+            applied += process_batch(
+                [notification for _, _, notification in fresh],
+                [dedup_key for _, dedup_key, _ in fresh]
+            )
+        except Exception as e:
+            logger.error(f"Error processing {len(fresh)} SES notifications, applying them one by one: {str(e)}")
+            for entry_id, dedup_key, notification in fresh:
+                try:
+                    applied += process_batch([notification], [dedup_key])
+                except Exception as e:
+                    failed[entry_id] = e
+
+        if failed:
+            # Left pending and claimed again after CLAIM_IDLE_MS, until they run out of deliveries
+            deliveries = times_delivered(list(failed))
+            fields_by_id = dict(entries)
+            dead_letter([
+                (entry_id, fields_by_id[entry_id], error) for entry_id, error in failed.items()
+                if deliveries[entry_id] >= MAX_DELIVERIES
+            ])
+
+        ack([entry_id for entry_id, _ in entries if entry_id not in failed])
+        batches += 1
+
+    return applied
@@ -2,34 +2,174 @@
 AWS SES Service for sending emails
 """
 import boto3
-from botocore.exceptions import ClientError, BotoCoreError
+from botocore.config import Config
+from botocore.exceptions import ClientError, BotoCoreError, ConnectTimeoutError, EndpointConnectionError
 from django.conf import settings
+import hashlib
+import json
 import logging
-import time
-from string import Template
 import redis
+from .adaptive_rate import AdaptiveRateController
+from .rate_limiter import TokenBucket
+from . import domain_lanes, sender_pool
+from .template_cache import CompiledTemplate, get_compiled_template
+from .transports import TransportError, get_transport, reset_transports
 
 logger = logging.getLogger(__name__)
 
+# SES accepts at most 50 destinations per SendBulkTemplatedEmail call
+BULK_SEND_MAX_DESTINATIONS = 50
+
+# Errors of the endpoint rather than the email, retried (on another shard)
+SHARD_FAILURE_CODES = ('ServiceUnavailable', 'InternalFailure')
+
+# Errors that sending the same email again won't fix, never retried
+PERMANENT_ERROR_CODES = (
+    'MessageRejected',
+    'MailFromDomainNotVerified',
+    'MailFromDomainNotVerifiedException',
+    'InvalidParameterValue',
+    'ConfigurationSetDoesNotExist',
+    'TemplateDoesNotExist',
+    'InvalidTemplate',
+    'AccountSuspended',
+)
+
+# Per-destination statuses of a bulk send that mean "not now", handed back
+# to the caller to reschedule like a throttled request
+BULK_THROTTLED_STATUSES = (
+    'AccountThrottled',
+    'AccountDailyQuotaExceeded',
+    'AccountSendingPaused',
+    'ConfigurationSetSendingPaused',
+    'TransientFailure',
+)
+
+# SES templates synced through a transport and shard, template name -> content digest
+SYNCED_TEMPLATES_KEY = 'ses_templates:{transport}:{shard}'
+
+# Per-process clients, (re)created by init_process_clients on worker_process_init
+_ses_clients = {}
+_redis_pool = None
+_rate_control = {}
+
+
+def create_ses_client(shard=None):
+    """
+    Build a boto3 SES client with a keep-alive connection pool
+
+    Credential and endpoint resolution plus the TLS handshake make this
+    expensive, use get_ses_client() instead of calling it per email.
+
+    Args:
+        shard: SenderShard to connect to, the default shard if None
+    """
+    shard = shard or sender_pool.default_shard()
+    return boto3.client(
+        'ses',
+        region_name=shard.region,
+        aws_access_key_id=shard.access_key_id,
+        aws_secret_access_key=shard.secret_access_key,
+        endpoint_url=shard.endpoint_url,
+        config=Config(
+            max_pool_connections=settings.SES_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            # botocore would otherwise sleep through Throttling retries itself
+            retries={
+                'mode': 'standard',
+                'total_max_attempts': settings.SES_CLIENT_MAX_ATTEMPTS,
+            }
+        )
+    )
+
+
+def get_ses_client(shard=None):
+    """Return this process's SES client of a shard, creating it on first use"""
+    shard = shard or sender_pool.default_shard()
+    if shard.name not in _ses_clients:
+        _ses_clients[shard.name] = create_ses_client(shard)
+    return _ses_clients[shard.name]
+
+
+def get_redis_client():
+    """Return a Redis client backed by this process's shared connection pool"""
+    global _redis_pool
+    if _redis_pool is None:
+        _redis_pool = redis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+    return redis.Redis(connection_pool=_redis_pool)
+
+
+def init_process_clients():
+    """
+    Create fresh clients for the current process
+
+    Connections must not be shared across fork(), so prefork workers call
+    this from worker_process_init.
+    """
+    global _redis_pool
+    _ses_clients.clear()
+    _redis_pool = None
+    _rate_control.clear()
+    reset_transports()
+    get_ses_client()
+    get_redis_client()
+
+
+def _get_rate_control(shard):
+    """Return this process's (TokenBucket, AdaptiveRateController or None) of a shard"""
+    if shard.name not in _rate_control:
+        redis_client = get_redis_client()
+        rate_limit = shard.rate_limit
+        bucket = TokenBucket(
+            redis_client,
+            shard.bucket_key,
+            rate=rate_limit,
+            capacity=shard.burst
+        )
+        controller = None
+        if settings.SES_ADAPTIVE_RATE_ENABLED:
+            controller = AdaptiveRateController(
+                redis_client,
+                bucket,
+                key=shard.adaptive_key,
+                increase_step=settings.SES_RATE_INCREASE_STEP,
+                decrease_factor=settings.SES_RATE_DECREASE_FACTOR,
+                min_rate=settings.SES_RATE_MIN_PER_SECOND,
+                utilization=settings.SES_QUOTA_UTILIZATION
+            )
+        _rate_control[shard.name] = (bucket, controller)
+    return _rate_control[shard.name]
+
 
 class SESService:
     """Service class for interacting with AWS SES"""
 
-    def __init__(self):
-        self.client = boto3.client(
-            'ses',
-            region_name=settings.AWS_SES_REGION,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-        )
-        self.configuration_set = settings.AWS_SES_CONFIGURATION_SET
-        self.rate_limit = settings.SES_RATE_LIMIT_PER_SECOND
-        self.redis_client = redis.from_url(settings.REDIS_URL)
-        self.rate_key = 'ses_rate_limit'
+    def __init__(self, lane=None, shard=None, transport=None):
+        """
+        Args:
+            lane: Recipient domain lane the sends go to, its token bucket
+                is drawn from before the global one
+            shard: SenderShard to send through, the default shard if None
+            transport: Transport name, EMAIL_TRANSPORT if None
+        """
+        # Clients and rate control are shared by every SESService in the process
+        self.shard = shard or sender_pool.default_shard()
+        self.client = get_ses_client(self.shard)
+        self.configuration_set = self.shard.configuration_set
+        self.rate_limit = self.shard.rate_limit
+        self.redis_client = get_redis_client()
+        self.rate_limiter, self.rate_controller = _get_rate_control(self.shard)
+        self.rate_key = self.rate_limiter.key
+        self.lane = lane
+        self.lane_limiter = domain_lanes.get_bucket(lane) if lane else None
+        self.transport = get_transport(transport, self.client, self.configuration_set)
 
     def send_email(self, to_email, from_email, from_name, subject, html_content, plain_text_content):
         """
-        Send an email via SES
+        Send an email through the transport (SES unless configured otherwise)
 
         Args:
             to_email: Recipient email
@@ -40,84 +180,184 @@ class SESService:
             plain_text_content: Plain text content
 
         Returns:
-            dict: Response from SES with MessageId
+            dict: Response from SES with MessageId. Throttled sends come back
+            with throttled=True and should be rescheduled by the caller.
         """
 
         # Rate limiting check
-        self._check_rate_limit()
+        retry_after = self._check_rate_limit()
+        if retry_after is not None:
+            return _throttled_result('Local send rate limit reached', retry_after)
 
         try:
             source = f"{from_name} <{from_email}>"
 
-            response = self.client.send_email(
-                Source=source,
-                Destination={
-                    'ToAddresses': [to_email]
-                },
-                Message={
-                    'Subject': {
-                        'Data': subject,
-                        'Charset': 'UTF-8'
-                    },
-                    'Body': {
-                        'Html': {
-                            'Data': html_content,
-                            'Charset': 'UTF-8'
-                        },
-                        'Text': {
-                            'Data': plain_text_content,
-                            'Charset': 'UTF-8'
-                        }
-                    }
-                },
-                ConfigurationSetName=self.configuration_set if self.configuration_set else None
+            message_id = self.transport.send_email(
+                source, to_email, subject, html_content, plain_text_content
             )
 
-            # Increment rate counter
-            self._increment_rate_counter()
+            if self.rate_controller:
+                self.rate_controller.record_success()
 
-            logger.info(f"Email sent successfully to {to_email}, MessageId: {response['MessageId']}")
+            logger.info(f"Email sent successfully to {to_email}, MessageId: {message_id}")
 
             return {
                 'success': True,
-                'message_id': response['MessageId'],
+                'message_id': message_id,
                 'error': None
             }
 
+        except TransportError as e:
+            logger.error(f"{self.transport.name} transport error: {str(e)}")
+            if e.retryable:
+                return _throttled_result(str(e))
+            return _failed_result(str(e), permanent=True)
+
         except ClientError as e:
             error_code = e.response['Error']['Code']
             error_message = e.response['Error']['Message']
 
             logger.error(f"SES ClientError: {error_code} - {error_message}")
 
-            # Handle throttling with exponential backoff
+            # Throttled sends are handed back to the caller to reschedule
             if error_code == 'Throttling':
-                return self._handle_throttling(
-                    to_email, from_email, from_name, subject,
-                    html_content, plain_text_content
-                )
+                if self.rate_controller:
+                    self.rate_controller.record_throttle()
+                sender_pool.record_failure(self.shard, 'throttle')
+                return _throttled_result(f"{error_code}: {error_message}")
+
+            if error_code in SHARD_FAILURE_CODES:
+                sender_pool.record_failure(self.shard, 'error')
+                return _throttled_result(f"{error_code}: {error_message}")
+
+            return _failed_result(
+                f"{error_code}: {error_message}",
+                permanent=error_code in PERMANENT_ERROR_CODES
+            )
 
-            return {
-                'success': False,
-                'message_id': None,
-                'error': f"{error_code}: {error_message}"
-            }
+        except (EndpointConnectionError, ConnectTimeoutError) as e:
+            # The request never reached SES, retry it (on another shard)
+            logger.error(f"SES shard {self.shard.name} unreachable: {str(e)}")
+            sender_pool.record_failure(self.shard, 'error')
+            return _throttled_result(str(e))
 
         except BotoCoreError as e:
             logger.error(f"BotoCoreError: {str(e)}")
-            return {
-                'success': False,
-                'message_id': None,
-                'error': str(e)
-            }
+            return _failed_result(str(e))
 
         except Exception as e:
             logger.error(f"Unexpected error sending email: {str(e)}")
-            return {
-                'success': False,
-                'message_id': None,
-                'error': str(e)
-            }
+            return _failed_result(str(e))
+
+    def send_bulk_templated_email(self, from_email, from_name, template_name, destinations, default_template_data=None):
+        """
+        Send a stored SES template to many recipients
+
+        Destinations are sent in groups of BULK_SEND_MAX_DESTINATIONS, one
+        SendBulkTemplatedEmail call per group.
+
+        Args:
+            from_email: Sender email
+            from_name: Sender name
+            template_name: Name of a template created with sync_template
+            destinations: List of (to_email, template_data) tuples
+            default_template_data: Values for variables missing from a destination
+
+        Returns:
+            list: One result dict per destination, in the same order
+        """
+        source = f"{from_name} <{from_email}>"
+        default_data = json.dumps(default_template_data or {}, default=str)
+        results = []
+
+        for start in range(0, len(destinations), BULK_SEND_MAX_DESTINATIONS):
+            group = destinations[start:start + BULK_SEND_MAX_DESTINATIONS]
+            group_results = self._send_bulk_group(source, template_name, default_data, group)
+            results.extend(group_results)
+
+            # Out of local rate tokens, the next groups would be refused too
+            if group_results[0].get('retry_after') is not None:
+                results.extend([group_results[0]] * (len(destinations) - len(results)))
+                break
+
+        return results
+
+    def sync_template(self, template_name, subject, html_content, plain_text_content):
+        """
+        Create or update an SES template from our $variable templates
+
+        Args:
+            template_name: SES template name
+            subject: Subject template
+            html_content: HTML template
+            plain_text_content: Plain text template
+
+        Returns:
+            dict: Sync result
+        """
+        template = {
+            'TemplateName': template_name,
+            'SubjectPart': to_ses_template_syntax(subject),
+            'HtmlPart': to_ses_template_syntax(html_content),
+            'TextPart': to_ses_template_syntax(plain_text_content),
+        }
+
+        try:
+            self.transport.sync_template(template)
+
+            logger.info(f"SES template {template_name} synced")
+            return {'success': True, 'template_name': template_name}
+
+        except ClientError as e:
+            logger.error(f"Error syncing SES template {template_name}: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+    def ensure_template(self, template_name, subject, html_content, plain_text_content):
+        """
+        Sync an SES template unless it already has this content
+
+        The digest of the synced content is kept in Redis, so workers (and
+        restarted ones) only sync a template when its content changed.
+
+        Returns:
+            dict: Sync result
+        """
+        digest = hashlib.sha1(
+            '\x00'.join([subject, html_content, plain_text_content]).encode('utf-8')
+        ).hexdigest()
+        key = self._synced_templates_key()
+
+        if self.redis_client.hget(key, template_name) == digest.encode():
+            return {'success': True, 'template_name': template_name}
+
+        result = self.sync_template(template_name, subject, html_content, plain_text_content)
+        if result['success']:
+            self.redis_client.hset(key, template_name, digest)
+        return result
+
+    def synced_templates(self):
+        """Names of the SES templates synced through this transport and shard"""
+        return [name.decode() for name in self.redis_client.hkeys(self._synced_templates_key())]
+
+    def delete_template(self, template_name):
+        """
+        Delete an SES template
+
+        Returns:
+            dict: Delete result
+        """
+        try:
+            self.transport.delete_template(template_name)
+        except ClientError as e:
+            logger.error(f"Error deleting SES template {template_name}: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+        self.redis_client.hdel(self._synced_templates_key(), template_name)
+        logger.info(f"SES template {template_name} deleted")
+        return {'success': True, 'template_name': template_name}
+
+    def _synced_templates_key(self):
+        return SYNCED_TEMPLATES_KEY.format(transport=self.transport.name, shard=self.shard.name)
 
     def render_template(self, template_content, data):
         """
@@ -131,8 +371,8 @@ class SESService:
             str: Rendered content
         """
         try:
-            template = Template(template_content)
-            return template.safe_substitute(data)
+            template = get_compiled_template(('content', template_content), template_content)
+            return template.render(data)
         except Exception as e:
             logger.error(f"Template rendering error: {str(e)}")
             raise
@@ -160,8 +400,17 @@ class SESService:
         Get SES sending quota and usage
 
         Returns:
-            dict: Quota information
+            dict: Quota information. Other transports report an unlimited
+            quota at the shard's configured rate.
         """
+        if self.transport.name != 'ses':
+            return {
+                'success': True,
+                'max_24_hour_send': -1,
+                'max_send_rate': self.rate_limit,
+                'sent_last_24_hours': 0
+            }
+
         try:
             response = self.client.get_send_quota()
             return {
@@ -174,6 +423,28 @@ class SESService:
             logger.error(f"Error getting send quota: {str(e)}")
             return {'success': False, 'error': str(e)}
 
+    def refresh_send_rate(self):
+        """
+        Apply the current SES quota to the adaptive rate controller
+
+        Returns:
+            float: Send rate now in effect, None if unchanged
+        """
+        if not self.rate_controller:
+            return None
+        return self.rate_controller.refresh(self.get_send_quota())
+
+    def has_send_quota(self, count=1):
+        """
+        Check whether count more emails fit in the 24h sending quota
+
+        Returns:
+            bool: True when sending may proceed
+        """
+        if not self.rate_controller:
+            return True
+        return self.rate_controller.has_quota(count)
+
     def test_connection(self):
         """
         Test SES connection
@@ -202,45 +473,177 @@ class SESService:
                 'error': str(e)
             }
 
-    def _check_rate_limit(self):
-        """Check if we're within rate limits"""
-        current_count = self.redis_client.get(self.rate_key)
+    def _check_rate_limit(self, count=1):
+        """
+        Reserve send rate tokens from the shared token bucket
 
-        if current_count and int(current_count) >= self.rate_limit:
-            # Wait for a second if rate limit reached
-            time.sleep(1)
-            self.redis_client.delete(self.rate_key)
+        Never waits in the worker: a send whose tokens aren't there yet is
+        handed back to be rescheduled once they are. A bulk group bigger
+        than the bucket's burst goes out, and its debt holds back the sends
+        after it. The lane bucket, if any, is charged first, so a busy lane
+        defers without using up global tokens other lanes could send with;
+        its tokens are given back when the global bucket refuses.
 
-    def _increment_rate_counter(self):
-        """Increment the rate limiting counter"""
-        pipe = self.redis_client.pipeline()
-        pipe.incr(self.rate_key)
-        pipe.expire(self.rate_key, 1)  # Expire after 1 second
-        pipe.execute()
+        Args:
+            count: Number of emails about to be sent
 
-    def _handle_throttling(self, to_email, from_email, from_name, subject, html_content, plain_text_content, retry=1, max_retries=3):
+        Returns:
+            float: None if the send may go out now, else the seconds until
+            its tokens are available
         """
-        Handle SES throttling with exponential backoff
+        if self.lane_limiter:
+            granted, wait = self.lane_limiter.reserve(count, max_wait=0)
+            if not granted:
+                logger.debug(f"Lane '{self.lane}' out of tokens for {count} emails, deferring {wait:.3f}s")
+                return wait
 
-        Args:
-            Same as send_email, plus:
-            retry: Current retry attempt
-            max_retries: Maximum number of retries
+        granted, wait = self.rate_limiter.reserve(count, max_wait=0)
+
+        if not granted:
+            if self.lane_limiter:
+                self.lane_limiter.refund(count)
+            logger.debug(f"Send rate limit reached for {count} emails, deferring {wait:.3f}s")
+            return wait
+
+        return None
+
+    def _send_bulk_group(self, source, template_name, default_data, group):
+        """
+        Send one SendBulkTemplatedEmail call (up to 50 destinations)
 
         Returns:
-            dict: Response from SES
+            list: One result dict per destination in the group
         """
-        if retry > max_retries:
-            return {
-                'success': False,
-                'message_id': None,
-                'error': 'Max retries exceeded due to throttling'
-            }
+        retry_after = self._check_rate_limit(len(group))
+        if retry_after is not None:
+            return [_throttled_result('Local send rate limit reached', retry_after) for _ in group]
 
-        # Exponential backoff: 2^retry seconds
-        wait_time = 2 ** retry
-        logger.info(f"Throttling detected, waiting {wait_time} seconds before retry {retry}/{max_retries}")
-        time.sleep(wait_time)
+        permanent = False
+        try:
+            statuses = self.transport.send_bulk_templated_email(
+                source,
+                template_name,
+                default_data,
+                [
+                    {
+                        'Destination': {'ToAddresses': [to_email]},
+                        'ReplacementTemplateData': json.dumps(template_data, default=str),
+                    }
+                    for to_email, template_data in group
+                ]
+            )
+
+            results = []
+            for status in statuses:
+                if status['Status'] == 'Success':
+                    results.append({
+                        'success': True,
+                        'message_id': status['MessageId'],
+                        'error': None
+                    })
+                elif status['Status'] in BULK_THROTTLED_STATUSES:
+                    results.append(_throttled_result(f"{status['Status']}: {status.get('Error', '')}"))
+                else:
+                    results.append(_failed_result(
+                        f"{status['Status']}: {status.get('Error', '')}",
+                        permanent=status['Status'] in PERMANENT_ERROR_CODES
+                    ))
+
+            if any(result.get('throttled') for result in results):
+                logger.warning(f"SES throttled part of a bulk send of {len(group)} emails")
+                if self.rate_controller:
+                    self.rate_controller.record_throttle()
+                sender_pool.record_failure(self.shard, 'throttle')
+            elif self.rate_controller:
+                self.rate_controller.record_success(sum(1 for result in results if result['success']))
+
+            logger.info(f"Bulk templated send of {len(group)} emails with template {template_name}")
+            return results
 
-        # Retry sending
-        return self.send_email(to_email, from_email, from_name, subject, html_content, plain_text_content)
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            error_message = e.response['Error']['Message']
+
+            logger.error(f"SES ClientError: {error_code} - {error_message}")
+
+            # Throttled sends are handed back to the caller to reschedule
+            if error_code == 'Throttling':
+                if self.rate_controller:
+                    self.rate_controller.record_throttle()
+                sender_pool.record_failure(self.shard, 'throttle')
+                return [_throttled_result(f"{error_code}: {error_message}") for _ in group]
+
+            if error_code in SHARD_FAILURE_CODES:
+                sender_pool.record_failure(self.shard, 'error')
+                return [_throttled_result(f"{error_code}: {error_message}") for _ in group]
+
+            error = f"{error_code}: {error_message}"
+            permanent = error_code in PERMANENT_ERROR_CODES
+
+        except (EndpointConnectionError, ConnectTimeoutError) as e:
+            # The request never reached SES, retry it (on another shard)
+            logger.error(f"SES shard {self.shard.name} unreachable: {str(e)}")
+            sender_pool.record_failure(self.shard, 'error')
+            return [_throttled_result(str(e)) for _ in group]
+
+        except BotoCoreError as e:
+            logger.error(f"BotoCoreError: {str(e)}")
+            error = str(e)
+
+        except Exception as e:
+            logger.error(f"Unexpected error sending bulk email: {str(e)}")
+            error = str(e)
+
+        return [_failed_result(error, permanent) for _ in group]
+
+
+def _failed_result(error, permanent=False):
+    """
+    Result for a send that failed
+
+    Args:
+        error: Error reported to the email log
+        permanent: True if retrying the send can't succeed
+    """
+    return {
+        'success': False,
+        'message_id': None,
+        'error': error,
+        'permanent': permanent
+    }
+
+
+def _throttled_result(error, retry_after=None):
+    """
+    Result for a send that was throttled and not attempted
+
+    retry_after is set when the local rate limiter held the send back:
+    its tokens are available again after that many seconds.
+    """
+    result = {
+        'success': False,
+        'message_id': None,
+        'error': error,
+        'throttled': True
+    }
+    if retry_after is not None:
+        result['retry_after'] = retry_after
+    return result
+
+
+def to_ses_template_syntax(content):
+    """
+    Convert a $variable / ${variable} template into SES {{{variable}}} syntax
+
+    Args:
+        content: Template string in string.Template syntax
+
+    Returns:
+        str: Template string in SES (Handlebars) syntax
+    """
+    return CompiledTemplate(content).to_ses_syntax()
+
+
+def template_variables(content):
+    """Return the set of variable names used in a string.Template"""
+    return CompiledTemplate(content).variables
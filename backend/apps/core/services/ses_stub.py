@@ -0,0 +1,220 @@
+"""
+Local stub of the AWS SES query API
+
+Lets the send path run against a real HTTP endpoint without spending SES
+quota. Point AWS_SES_ENDPOINT_URL at it (python manage.py ses_stub).
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from xml.sax.saxutils import escape
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SES_XMLNS = 'http://ses.amazonaws.com/doc/2010-12-01/'
+
+DESTINATION_PARAM = re.compile(r'^Destinations\.member\.(\d+)\.Destination\.ToAddresses\.member\.1$')
+
+
+class SESStubServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering the SES actions used by SESService
+
+    Args:
+        address: (host, port) tuple
+        latency: Artificial latency per request, in seconds
+        error_rate: Fraction of recipients rejected with MessageRejected
+        max_send_rate: Recipients per second before Throttling (None = unlimited)
+        max_24_hour_send: Value reported by GetSendQuota
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, max_send_rate=None, max_24_hour_send=1000000.0):
+        super().__init__(address, SESStubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_send_rate = max_send_rate
+        self.max_24_hour_send = max_24_hour_send
+        self.templates = {}
+        self.stats = {'requests': 0, 'emails': 0, 'rejected': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+        self._tokens = max_send_rate or 0
+        self._refilled_at = time.monotonic()
+
+    def take_tokens(self, count):
+        """Consume send rate tokens, returns False when the call must be throttled"""
+        with self._lock:
+            self.stats['requests'] += 1
+
+            if self.max_send_rate:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.max_send_rate,
+                    self._tokens + (now - self._refilled_at) * self.max_send_rate
+                )
+                self._refilled_at = now
+
+                if self._tokens < count:
+                    self.stats['throttled'] += 1
+                    return False
+
+                self._tokens -= count
+
+            self.stats['emails'] += count
+            return True
+
+    def reject(self):
+        """Decide whether one recipient is rejected"""
+        if self.error_rate and random.random() < self.error_rate:
+            with self._lock:
+                self.stats['rejected'] += 1
+            return True
+        return False
+
+
+class SESStubHandler(BaseHTTPRequestHandler):
+    """Request handler for SESStubServer"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body leave in one segment, unbuffered writes hit Nagle and
+    # delayed ACKs on keep-alive connections (~40ms per call)
+    wbufsize = -1
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        params = {
+            key: values[0]
+            for key, values in parse_qs(self.rfile.read(length).decode('utf-8')).items()
+        }
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        action = params.get('Action', '')
+        handler = getattr(self, f'_action_{action}', None)
+
+        if handler is None:
+            self._error('InvalidAction', f'Unsupported action {action}')
+            return
+
+        handler(params)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    # Actions
+
+    def _action_SendEmail(self, params):
+        self._send_single('SendEmail')
+
+    def _action_SendRawEmail(self, params):
+        self._send_single('SendRawEmail')
+
+    def _action_SendTemplatedEmail(self, params):
+        if params.get('Template') not in self.server.templates:
+            self._error('TemplateDoesNotExist', f"Template {params.get('Template')} does not exist")
+            return
+        self._send_single('SendTemplatedEmail')
+
+    def _action_SendBulkTemplatedEmail(self, params):
+        if params.get('Template') not in self.server.templates:
+            self._error('TemplateDoesNotExist', f"Template {params.get('Template')} does not exist")
+            return
+
+        count = sum(1 for key in params if DESTINATION_PARAM.match(key))
+
+        if not self.server.take_tokens(count):
+            self._error('Throttling', 'Maximum sending rate exceeded.')
+            return
+
+        members = []
+        for _ in range(count):
+            if self.server.reject():
+                members.append(
+                    '<member><Status>MessageRejected</Status>'
+                    '<Error>Rejected by SES stub</Error></member>'
+                )
+            else:
+                members.append(
+                    f'<member><Status>Success</Status><MessageId>{_message_id()}</MessageId></member>'
+                )
+
+        self._result('SendBulkTemplatedEmail', f"<Status>{''.join(members)}</Status>")
+
+    def _action_CreateTemplate(self, params):
+        name = params.get('Template.TemplateName')
+        if name in self.server.templates:
+            self._error('AlreadyExists', f'Template {name} already exists')
+            return
+        self.server.templates[name] = params
+        self._result('CreateTemplate')
+
+    def _action_UpdateTemplate(self, params):
+        name = params.get('Template.TemplateName')
+        if name not in self.server.templates:
+            self._error('TemplateDoesNotExist', f'Template {name} does not exist')
+            return
+        self.server.templates[name] = params
+        self._result('UpdateTemplate')
+
+    def _action_DeleteTemplate(self, params):
+        self.server.templates.pop(params.get('TemplateName'), None)
+        self._result('DeleteTemplate')
+
+    def _action_GetSendQuota(self, params):
+        self._result('GetSendQuota', (
+            f'<Max24HourSend>{self.server.max_24_hour_send}</Max24HourSend>'
+            f'<MaxSendRate>{float(self.server.max_send_rate or 1000)}</MaxSendRate>'
+            f"<SentLast24Hours>{float(self.server.stats['emails'])}</SentLast24Hours>"
+        ))
+
+    def _action_VerifyEmailIdentity(self, params):
+        self._result('VerifyEmailIdentity')
+
+    # Helpers
+
+    def _send_single(self, action):
+        if not self.server.take_tokens(1):
+            self._error('Throttling', 'Maximum sending rate exceeded.')
+            return
+
+        if self.server.reject():
+            self._error('MessageRejected', 'Rejected by SES stub')
+            return
+
+        self._result(action, f'<MessageId>{_message_id()}</MessageId>')
+
+    def _result(self, action, body=''):
+        self._respond(200, (
+            f'<{action}Response xmlns="{SES_XMLNS}">'
+            f'<{action}Result>{body}</{action}Result>'
+            f'<ResponseMetadata><RequestId>{uuid.uuid4()}</RequestId></ResponseMetadata>'
+            f'</{action}Response>'
+        ))
+
+    def _error(self, code, message):
+        self._respond(400, (
+            f'<ErrorResponse xmlns="{SES_XMLNS}">'
+            f'<Error><Type>Sender</Type><Code>{code}</Code><Message>{escape(message)}</Message></Error>'
+            f'<RequestId>{uuid.uuid4()}</RequestId>'
+            f'</ErrorResponse>'
+        ))
+
+    def _respond(self, status, body):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _message_id():
+    """Random id shaped like an SES MessageId"""
+    return f"{uuid.uuid4().hex}-{uuid.uuid4().hex[:8]}-000000"
@@ -0,0 +1,185 @@
+"""
+Pre-parsed email templates with a per-process LRU cache
+"""
+import logging
+import threading
+from collections import OrderedDict
+from string import Template
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledTemplate:
+    """
+    A string.Template parsed once into static segments and placeholder slots
+
+    Rendering fills the slots and joins the segments, so the template is
+    never scanned again. Output is identical to Template.safe_substitute:
+    unknown variables and invalid placeholders are left as-is and $$
+    becomes $.
+
+    Args:
+        content: Template string in string.Template syntax
+    """
+
+    def __init__(self, content):
+        self.content = content or ''
+        self.segments = []
+        self.slots = []  # (segment index, variable name, original text)
+
+        static = []
+        position = 0
+        for match in Template.pattern.finditer(self.content):
+            static.append(self.content[position:match.start()])
+            position = match.end()
+
+            name = match.group('named') or match.group('braced')
+            if name is not None:
+                self.segments.append(''.join(static))
+                static = []
+                self.slots.append((len(self.segments), name, match.group(0)))
+                self.segments.append(match.group(0))
+            elif match.group('escaped') is not None:
+                static.append(Template.delimiter)
+            else:
+                static.append(match.group(0))
+
+        static.append(self.content[position:])
+        self.segments.append(''.join(static))
+
+        self.variables = {name for _, name, _ in self.slots}
+        self.is_static = not self.slots
+        self._static_content = ''.join(self.segments) if self.is_static else None
+
+    def render(self, data):
+        """
+        Render the template with data
+
+        Args:
+            data: Dictionary with template variables
+
+        Returns:
+            str: Rendered content
+        """
+        if self.is_static:
+            return self._static_content
+
+        segments = list(self.segments)
+        for index, name, _ in self.slots:
+            if name in data:
+                segments[index] = str(data[name])
+        return ''.join(segments)
+
+    def to_ses_syntax(self):
+        """
+        The template in SES (Handlebars) syntax
+
+        Variables become {{{variable}}}: Handlebars would HTML-escape
+        {{variable}}, render() inserts values as they are.
+        """
+        segments = list(self.segments)
+        for index, name, _ in self.slots:
+            segments[index] = '{{{' + name + '}}}'
+        return ''.join(segments)
+
+
+class CampaignTemplates:
+    """
+    Compiled subject, HTML and plain text of a campaign
+
+    When none of them has per-recipient placeholders the email is rendered
+    once and every recipient gets the same content.
+    """
+
+    def __init__(self, subject, html, text):
+        self.subject = subject
+        self.html = html
+        self.text = text
+        self.is_static = subject.is_static and html.is_static and text.is_static
+        self._static = self._render({}) if self.is_static else None
+
+    @property
+    def variables(self):
+        return self.subject.variables | self.html.variables | self.text.variables
+
+    def render(self, data):
+        """
+        Render the campaign email for one recipient
+
+        Returns:
+            tuple: (subject, html_content, plain_text_content)
+        """
+        if self.is_static:
+            return self._static
+        return self._render(data)
+
+    def _render(self, data):
+        return (
+            self.subject.render(data),
+            self.html.render(data),
+            self.text.render(data),
+        )
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_compiled_template(key, content):
+    """
+    Compiled template from the per-process LRU cache
+
+    Args:
+        key: Cache key, must change whenever content does
+        content: Template string, only parsed on a cache miss
+
+    Returns:
+        CompiledTemplate
+    """
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+            return compiled
+
+    compiled = CompiledTemplate(content)
+
+    with _cache_lock:
+        _cache[key] = compiled
+        _cache.move_to_end(key)
+        while len(_cache) > settings.TEMPLATE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return compiled
+
+
+def get_campaign_templates(campaign):
+    """
+    Compiled templates of a campaign
+
+    The email template is cached by (EmailTemplate.id, updated_at), so an
+    edited template is parsed again while the old version ages out of the
+    cache. The subject lives on the campaign and is keyed by its text.
+
+    Args:
+        campaign: Campaign with its template loaded
+
+    Returns:
+        CampaignTemplates
+    """
+    template = campaign.template
+    version = (template.id, template.updated_at)
+
+    return CampaignTemplates(
+        subject=get_compiled_template(('subject', campaign.id, campaign.subject), campaign.subject),
+        html=get_compiled_template(('html',) + version, template.html_content),
+        text=get_compiled_template(('text',) + version, template.plain_text_content),
+    )
+
+
+def clear_template_cache():
+    """Drop every compiled template of this process"""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,310 @@
+"""
+Email transports behind SESService
+
+SESService keeps rate limiting, quota and result handling; the transport
+only delivers the message. 'ses' is the real thing, the others let the
+whole pipeline run without spending SES quota:
+
+- smtp: any SMTP relay (EMAIL_HOST, EMAIL_PORT, ...)
+- maildir: writes every message into a Maildir (EMAIL_MAILDIR_PATH)
+- null: drops messages after EMAIL_NULL_LATENCY_MS, failing
+  EMAIL_NULL_ERROR_RATE of them, for load tests
+"""
+import logging
+import mailbox
+import os
+import random
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+from email.utils import make_msgid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TRANSPORT_CHOICES = [
+    ('ses', 'Amazon SES'),
+    ('smtp', 'SMTP'),
+    ('maildir', 'Maildir (file)'),
+    ('null', 'Null (load testing)'),
+]
+
+
+class TransportError(Exception):
+    """
+    Delivery failure of a non-SES transport
+
+    Args:
+        message: Error reported to the email log
+        retryable: True if the send should be retried later rather than
+            marked as failed
+    """
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class EmailTransport:
+    """Base transport, subclasses implement send_email"""
+
+    name = None
+    # Whether SES stored templates and bulk sends work through it
+    supports_templates = False
+
+    def send_email(self, source, to_email, subject, html_content, plain_text_content):
+        """
+        Deliver one message
+
+        Returns:
+            str: Message ID
+
+        Raises:
+            TransportError (ClientError / BotoCoreError for SES)
+        """
+        raise NotImplementedError
+
+    def sync_template(self, template):
+        """Store an SES template (only for transports with supports_templates)"""
+        raise NotImplementedError
+
+    def delete_template(self, template_name):
+        """Delete an SES template (only for transports with supports_templates)"""
+        raise NotImplementedError
+
+    def send_bulk_templated_email(self, source, template_name, default_data, destinations):
+        """
+        Send a stored template to many recipients
+
+        Args:
+            destinations: SES Destinations entries
+
+        Returns:
+            list: SES-style status dicts, one per destination
+        """
+        raise NotImplementedError
+
+
+class SESTransport(EmailTransport):
+    """Delivers through an SES client"""
+
+    name = 'ses'
+    supports_templates = True
+
+    def __init__(self, client, configuration_set=''):
+        self.client = client
+        self.configuration_set = configuration_set
+
+    def _configuration_set_kwargs(self):
+        """ConfigurationSetName is only sent when one is configured"""
+        if self.configuration_set:
+            return {'ConfigurationSetName': self.configuration_set}
+        return {}
+
+    def send_email(self, source, to_email, subject, html_content, plain_text_content):
+        response = self.client.send_email(
+            **self._configuration_set_kwargs(),
+            Source=source,
+            Destination={
+                'ToAddresses': [to_email]
+            },
+            Message={
+                'Subject': {
+                    'Data': subject,
+                    'Charset': 'UTF-8'
+                },
+                'Body': {
+                    'Html': {
+                        'Data': html_content,
+                        'Charset': 'UTF-8'
+                    },
+                    'Text': {
+                        'Data': plain_text_content,
+                        'Charset': 'UTF-8'
+                    }
+                }
+            }
+        )
+        return response['MessageId']
+
+    def sync_template(self, template):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.create_template(Template=template)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'AlreadyExists':
+                raise
+            self.client.update_template(Template=template)
+
+    def delete_template(self, template_name):
+        self.client.delete_template(TemplateName=template_name)
+
+    def send_bulk_templated_email(self, source, template_name, default_data, destinations):
+        response = self.client.send_bulk_templated_email(
+            **self._configuration_set_kwargs(),
+            Source=source,
+            Template=template_name,
+            DefaultTemplateData=default_data,
+            Destinations=destinations
+        )
+        return response['Status']
+
+
+def _build_message(source, to_email, subject, html_content, plain_text_content):
+    message = EmailMessage()
+    message['From'] = source
+    message['To'] = to_email
+    message['Subject'] = subject
+    message['Message-ID'] = make_msgid()
+    message.set_content(plain_text_content)
+    message.add_alternative(html_content, subtype='html')
+    return message
+
+
+class SMTPTransport(EmailTransport):
+    """Delivers through Django's SMTP backend, one open connection per process"""
+
+    name = 'smtp'
+
+    def __init__(self):
+        from django.core.mail import get_connection
+
+        self.connection = get_connection('django.core.mail.backends.smtp.EmailBackend')
+        self._lock = threading.Lock()
+
+    def send_email(self, source, to_email, subject, html_content, plain_text_content):
+        from django.core.mail import EmailMultiAlternatives
+
+        message_id = make_msgid()
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=plain_text_content,
+            from_email=source,
+            to=[to_email],
+            headers={'Message-ID': message_id},
+            connection=self.connection
+        )
+        email.attach_alternative(html_content, 'text/html')
+
+        try:
+            with self._lock:
+                self.connection.open()
+                email.send()
+        except OSError as e:
+            # Connection problems: close so the next send reconnects
+            self.connection.close()
+            raise TransportError(f"SMTP: {str(e)}", retryable=True)
+        except Exception as e:
+            raise TransportError(f"SMTP: {str(e)}")
+
+        return message_id.strip('<>')
+
+
+class MaildirTransport(EmailTransport):
+    """Writes each message to a Maildir, one file per email"""
+
+    name = 'maildir'
+
+    def __init__(self, path=None):
+        path = path or settings.EMAIL_MAILDIR_PATH
+        # Maildir(create=True) leaves an existing empty directory (volume mount) alone
+        for subdir in ('tmp', 'new', 'cur'):
+            os.makedirs(os.path.join(path, subdir), exist_ok=True)
+        self.maildir = mailbox.Maildir(path)
+
+    def send_email(self, source, to_email, subject, html_content, plain_text_content):
+        message = _build_message(source, to_email, subject, html_content, plain_text_content)
+
+        try:
+            self.maildir.add(message)
+        except OSError as e:
+            raise TransportError(f"Maildir: {str(e)}", retryable=True)
+
+        return message['Message-ID'].strip('<>')
+
+
+class NullTransport(EmailTransport):
+    """
+    Accepts and drops every message
+
+    Args:
+        latency: Seconds every call takes
+        error_rate: Fraction of recipients rejected
+    """
+
+    name = 'null'
+    supports_templates = True
+
+    def __init__(self, latency=None, error_rate=None):
+        self.latency = settings.EMAIL_NULL_LATENCY_MS / 1000 if latency is None else latency
+        self.error_rate = settings.EMAIL_NULL_ERROR_RATE if error_rate is None else error_rate
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _rejected(self):
+        return self.error_rate and random.random() < self.error_rate
+
+    def send_email(self, source, to_email, subject, html_content, plain_text_content):
+        self._wait()
+        if self._rejected():
+            raise TransportError('Rejected by null transport')
+        return f"null-{uuid.uuid4().hex}"
+
+    def sync_template(self, template):
+        pass
+
+    def delete_template(self, template_name):
+        pass
+
+    def send_bulk_templated_email(self, source, template_name, default_data, destinations):
+        self._wait()
+        return [
+            {'Status': 'MessageRejected', 'Error': 'Rejected by null transport'}
+            if self._rejected() else
+            {'Status': 'Success', 'MessageId': f"null-{uuid.uuid4().hex}"}
+            for _ in destinations
+        ]
+
+
+# Non-SES transports shared by the process (SES ones belong to a shard's client)
+_transports = {}
+
+
+def get_transport(name, ses_client=None, configuration_set=''):
+    """
+    Transport by name
+
+    Args:
+        name: One of TRANSPORT_CHOICES, '' or None for EMAIL_TRANSPORT
+        ses_client: SES client used by the 'ses' transport
+        configuration_set: SES configuration set used by the 'ses' transport
+
+    Returns:
+        EmailTransport
+    """
+    name = name or settings.EMAIL_TRANSPORT
+
+    if name == 'ses':
+        return SESTransport(ses_client, configuration_set)
+
+    if name not in _transports:
+        transport_classes = {
+            'smtp': SMTPTransport,
+            'maildir': MaildirTransport,
+            'null': NullTransport,
+        }
+        if name not in transport_classes:
+            raise ValueError(f"Unknown email transport: {name}")
+        _transports[name] = transport_classes[name]()
+
+    return _transports[name]
+
+
+def reset_transports():
+    """Forget the process's transports (after fork)"""
+    _transports.clear()
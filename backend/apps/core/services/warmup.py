@@ -0,0 +1,147 @@
+"""
+Sender domain warm-up
+
+Campaigns whose from_email domain has an active WarmupPlan share that
+plan's daily and hourly volume, counted in Redis per local day and hour.
+Batches take what is left of the current window and leave the rest of
+their recipients pending for the next one.
+"""
+import logging
+from datetime import timedelta
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] = day counter, KEYS[2] = hour counter
+# ARGV[1] = requested, ARGV[2] = daily limit, ARGV[3] = hourly limit,
+# ARGV[4] = day TTL, ARGV[5] = hour TTL
+#
+# Grants as much of the request as both windows have left
+RESERVE_SCRIPT = """
+local day = tonumber(redis.call('GET', KEYS[1]) or '0')
+local hour = tonumber(redis.call('GET', KEYS[2]) or '0')
+local granted = math.min(
+    tonumber(ARGV[1]),
+    tonumber(ARGV[2]) - day,
+    tonumber(ARGV[3]) - hour
+)
+if granted <= 0 then
+    return 0
+end
+redis.call('INCRBY', KEYS[1], granted)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('INCRBY', KEYS[2], granted)
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return granted
+"""
+
+
+def _redis():
+    from .ses_service import get_redis_client
+    return get_redis_client()
+
+
+def sender_domain(from_email):
+    """Domain part of a sender address, lowercased"""
+    return from_email.rsplit('@', 1)[-1].strip().lower()
+
+
+def active_plans():
+    """
+    Active warm-up plans by domain
+
+    Returns:
+        dict: {domain: WarmupPlan}
+    """
+    from apps.campaigns.models import WarmupPlan
+
+    return {plan.domain.lower(): plan for plan in WarmupPlan.objects.filter(is_active=True)}
+
+
+def plan_for_sender(from_email):
+    """Active warm-up plan of a sender address, None if it has none"""
+    from apps.campaigns.models import WarmupPlan
+
+    return WarmupPlan.objects.filter(
+        domain__iexact=sender_domain(from_email),
+        is_active=True
+    ).first()
+
+
+def _window_keys(plan, now):
+    return (
+        f"warmup:{plan.id}:{now:%Y%m%d}",
+        f"warmup:{plan.id}:{now:%Y%m%d%H}",
+    )
+
+
+def reserve(plan, count):
+    """
+    Take up to count emails from the plan's current day and hour
+
+    Returns:
+        int: Emails that may be sent now
+    """
+    now = timezone.localtime()
+    granted = _redis().register_script(RESERVE_SCRIPT)(
+        keys=list(_window_keys(plan, now)),
+        args=[count, plan.daily_limit(now.date()), plan.hourly_limit(now.date()), 2 * 86400, 2 * 3600]
+    )
+    return int(granted)
+
+
+def refund(plan, count):
+    """Give back emails reserved but not sent (throttled)"""
+    if not count:
+        return
+
+    pipe = _redis().pipeline(transaction=False)
+    for key in _window_keys(plan, timezone.localtime()):
+        pipe.decrby(key, count)
+    pipe.execute()
+
+
+def allowance(plan):
+    """
+    Current windows of a plan
+
+    Returns:
+        dict: Limits and usage of today and the current hour, what can
+        still be sent now and the seconds until more can
+    """
+    now = timezone.localtime()
+    day_sent, hour_sent = [int(value or 0) for value in _redis().mget(*_window_keys(plan, now))]
+    daily_limit = plan.daily_limit(now.date())
+    hourly_limit = plan.hourly_limit(now.date())
+    remaining = max(0, min(daily_limit - day_sent, hourly_limit - hour_sent))
+
+    if remaining:
+        next_window_in = 0
+    elif day_sent >= daily_limit:
+        next_window_in = _seconds_until(now, days=1)
+    else:
+        next_window_in = _seconds_until(now, hours=1)
+
+    return {
+        'domain': plan.domain,
+        'daily_limit': daily_limit,
+        'daily_sent': day_sent,
+        'hourly_limit': hourly_limit,
+        'hourly_sent': hour_sent,
+        'remaining': remaining,
+        'next_window_in': next_window_in,
+    }
+
+
+def next_window_in(plan):
+    """Seconds until the plan can send again (0 if it can now)"""
+    return allowance(plan)['next_window_in']
+
+
+def _seconds_until(now, days=0, hours=0):
+    if days:
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=days)
+    else:
+        start = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=hours)
+    return max(1, int((start - now).total_seconds()) + 1)
@@ -0,0 +1,128 @@
+"""
+Shared setup of the tests that send campaigns
+
+Needs the Redis of REDIS_URL, the keys of the campaigns created here are
+removed after each test.
+"""
+from contextlib import nullcontext
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from apps.campaigns.models import Campaign, CampaignRecipient
+from apps.contacts.models import Contact, ContactList
+from apps.core.services import sender_pool
+from apps.core.services.ses_service import get_redis_client
+from apps.emails.models import EmailTemplate
+from tasks import email_tasks
+
+
+class CampaignTestMixin:
+    """
+    Creates a sending campaign of recipients recipients in batches of batch_size
+
+    The scheduler is not run: tests send the batches they want with
+    send_batch(), with on_commit callbacks run as in a worker.
+    """
+
+    recipients = 6
+    batch_size = 3
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(
+            EMAIL_TRANSPORT='null',
+            EMAIL_NULL_LATENCY_MS=0.0,
+            EMAIL_NULL_ERROR_RATE=0.0,
+            CAMPAIGN_SEND_BATCH_SIZE=self.batch_size,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        # Batches are published by hand, nothing reaches the broker
+        for task in (email_tasks.schedule_send_batches_task, email_tasks.update_campaign_metrics_task):
+            patcher = mock.patch.object(task, 'delay')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        contact_list = ContactList.objects.create(name='Test list')
+        for index in range(self.recipients):
+            contact = Contact.objects.create(email=f"user{index}@example.org", first_name=f"User{index}")
+            contact.lists.add(contact_list)
+
+        template = EmailTemplate.objects.create(
+            name='Test template',
+            subject_template='Hello',
+            html_content='<p>Hello $first_name</p>',
+            plain_text_content='Hello $first_name'
+        )
+        self.campaign = Campaign.objects.create(
+            name='Test campaign',
+            subject='Hello',
+            from_email='news@example.com',
+            from_name='News',
+            template=template,
+            contact_list=contact_list,
+            status='sending'
+        )
+        self.addCleanup(self._clear_redis, self.campaign.id)
+
+        # A full send rate bucket, sends held back by the limiter are deferred
+        rate_key = sender_pool.default_shard().bucket_key
+        get_redis_client().delete(rate_key)
+        self.addCleanup(get_redis_client().delete, rate_key)
+
+    def _clear_redis(self, campaign_id):
+        client = get_redis_client()
+        client.delete(
+            f"campaign_progress:{campaign_id}",
+            f"campaign_inflight_batches:{campaign_id}",
+            f"campaign_counters:{campaign_id}",
+            f"campaign_rate:{campaign_id}",
+        )
+        client.srem('campaign_counters:dirty', campaign_id)
+        for pattern in (f"send_key:{campaign_id}:*", f"pending:{campaign_id}:*"):
+            keys = list(client.scan_iter(pattern))
+            if keys:
+                client.delete(*keys)
+
+    def on_commit(self):
+        """Run the on_commit callbacks, TransactionTestCase commits for real"""
+        if isinstance(self, TestCase):
+            return self.captureOnCommitCallbacks(execute=True)
+        return nullcontext()
+
+    def start(self):
+        """Run send_campaign_task: take the snapshot and arm the completion latch"""
+        with self.on_commit():
+            email_tasks.send_campaign_task.apply((self.campaign.id,))
+
+    def send_batch(self, batch):
+        with self.on_commit():
+            return email_tasks.send_email_batch_task.apply((self.campaign.id, batch)).get()
+
+    def states(self, batch=None):
+        """Recipient states of the campaign (or one batch), by contact email"""
+        recipients = CampaignRecipient.objects.filter(campaign=self.campaign)
+        if batch is not None:
+            recipients = recipients.filter(batch=batch)
+        return dict(recipients.values_list('contact__email', 'state'))
+
+    def status(self):
+        self.campaign.refresh_from_db()
+        return self.campaign.status
+
+    def pause(self):
+        Campaign.objects.filter(id=self.campaign.id).update(status='paused')
+
+    def resume(self):
+        Campaign.objects.filter(id=self.campaign.id).update(status='sending')
+        self.start()
+
+
+class CampaignTestCase(CampaignTestMixin, TestCase):
+    pass
+
+
+class CampaignTransactionTestCase(CampaignTestMixin, TransactionTestCase):
+    """For tests that need other connections to see the campaign (row locks)"""
@@ -0,0 +1,117 @@
+"""
+Campaign completion latch, against real batches of the null transport
+"""
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from apps.campaigns.models import CampaignRecipient
+from apps.contacts.models import Contact
+from apps.core.services import campaign_progress
+
+from .base import CampaignTestCase
+
+
+class PauseResumeTests(CampaignTestCase):
+
+    def test_batch_in_flight_during_pause_and_resume(self):
+        self.start()
+
+        # Batch 0 was claimed and is being sent when the campaign is paused
+        CampaignRecipient.objects.filter(campaign=self.campaign, batch=0).update(
+            state=CampaignRecipient.STATE_SENDING
+        )
+        self.pause()
+        self.resume()
+
+        # Batch 0 finishes after the resume
+        CampaignRecipient.objects.filter(campaign=self.campaign, batch=0).update(
+            state=CampaignRecipient.STATE_SENT
+        )
+        self.assertFalse(campaign_progress.done(self.campaign.id, self.batch_size))
+        self.assertEqual(self.status(), 'sending')
+
+        self.send_batch(1)
+
+        self.assertEqual(self.status(), 'sent')
+        self.assertEqual(set(self.states().values()), {CampaignRecipient.STATE_SENT})
+
+    def test_batch_sent_before_the_pause_isnt_counted_again(self):
+        self.start()
+        self.send_batch(0)
+        self.pause()
+        self.resume()
+
+        self.assertEqual(self.status(), 'sending')
+        self.send_batch(1)
+        self.assertEqual(self.status(), 'sent')
+
+
+
+class LatchTests(CampaignTestCase):
+
+    def test_completes_exactly_once(self):
+        campaign_progress.add(self.campaign.id, 4)
+
+        self.assertFalse(campaign_progress.done(self.campaign.id, 2))
+        # Not sealed yet, more recipients may still be queued
+        self.assertFalse(campaign_progress.done(self.campaign.id, 2))
+        self.assertTrue(campaign_progress.seal(self.campaign.id))
+
+        self.assertFalse(campaign_progress.seal(self.campaign.id))
+        self.assertFalse(campaign_progress.done(self.campaign.id, 0))
+        self.assertEqual(self.status(), 'sent')
+
+    def test_concurrent_batches_complete_once(self):
+        campaign_progress.add(self.campaign.id, 50)
+        campaign_progress.seal(self.campaign.id)
+
+        # The winner's database update would run outside the test transaction
+        with mock.patch.object(campaign_progress, 'complete_campaign') as complete_campaign:
+            with ThreadPoolExecutor(max_workers=10) as pool:
+                won = list(pool.map(lambda _: campaign_progress.done(self.campaign.id, 1), range(50)))
+
+        self.assertEqual(won.count(True), 1)
+        complete_campaign.assert_called_once_with(self.campaign.id)
+        self.assertEqual(campaign_progress.remaining(self.campaign.id), 0)
+
+    def test_campaign_sends_all_its_batches_before_completing(self):
+        self.start()
+
+        self.send_batch(0)
+        self.assertEqual(self.status(), 'sending')
+
+        self.send_batch(1)
+        self.assertEqual(self.status(), 'sent')
+
+    def test_skipped_recipients_count_toward_completion(self):
+        Contact.objects.filter(email__in=['user0@example.org', 'user1@example.org']).update(is_subscribed=False)
+        self.start()
+        Contact.objects.filter(email__in=['user3@example.org', 'user4@example.org']).update(is_suppressed=True)
+
+        self.send_batch(0)
+        self.send_batch(1)
+
+        self.assertEqual(self.status(), 'sent')
+
+    def test_nothing_to_send_completes_on_start(self):
+        Contact.objects.update(is_subscribed=False)
+
+        self.start()
+
+        self.assertEqual(self.status(), 'sent')
+
+    def test_pause_before_a_batch_is_sent(self):
+        self.start()
+        self.send_batch(0)
+        self.pause()
+
+        # Published before the pause, it leaves its recipients pending
+        self.send_batch(1)
+        self.assertEqual(self.status(), 'paused')
+        self.assertEqual(
+            set(self.states(batch=1).values()), {CampaignRecipient.STATE_PENDING}
+        )
+
+        self.resume()
+        self.send_batch(1)
+        self.assertEqual(self.status(), 'sent')
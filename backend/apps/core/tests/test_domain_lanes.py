@@ -0,0 +1,48 @@
+"""
+Domain lane slots and token buckets
+"""
+import time
+
+from django.test import override_settings
+
+from apps.core.services import domain_lanes, sender_pool
+from apps.core.services.ses_service import SESService, get_redis_client
+
+from .test_sender_pool import SESStubTestCase
+
+
+@override_settings(
+    SES_DOMAIN_GROUPS={'test-lane': {'domains': ['example.org'], 'rate': 100, 'concurrency': 1}},
+    CAMPAIGN_BATCH_TIMEOUT_SECONDS=1800,
+)
+class DomainLaneTests(SESStubTestCase):
+    stubs = {'test-lane-shard': {}}
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(
+            get_redis_client().delete,
+            domain_lanes._slots_key('test-lane'),
+            'ses_rate_limit:lane:test-lane',
+        )
+
+    def test_slot_is_held_for_the_batch_timeout(self):
+        token = domain_lanes.acquire_slot('test-lane')
+
+        expiry = get_redis_client().zscore(domain_lanes._slots_key('test-lane'), token)
+        self.assertAlmostEqual(expiry - time.time(), 1800, delta=5)
+        self.assertIsNone(domain_lanes.acquire_slot('test-lane'))
+
+        domain_lanes.release_slot('test-lane', token)
+        self.assertIsNotNone(domain_lanes.acquire_slot('test-lane'))
+
+    def test_lane_tokens_are_refunded_when_the_global_bucket_refuses(self):
+        ses = SESService(lane='test-lane', shard=sender_pool.get_shard('test-lane-shard'))
+        # Global bucket in debt
+        ses.rate_limiter.reserve(5000)
+
+        self.assertIsNotNone(ses._check_rate_limit(10))
+
+        granted, wait = ses.lane_limiter.reserve(100, max_wait=0)
+        self.assertTrue(granted)
+        self.assertAlmostEqual(wait, 0, places=1)
@@ -0,0 +1,72 @@
+"""
+Snapshot batch claiming: every recipient is sent once
+"""
+import threading
+from unittest import skipUnless
+
+from django.db import connection, transaction
+
+from apps.analytics.models import EmailLog
+from apps.campaigns.models import CampaignRecipient
+from apps.core.services.recipient_snapshot import claim_batch, next_pending_batch
+
+from .base import CampaignTestCase, CampaignTransactionTestCase
+
+
+class ClaimBatchTests(CampaignTestCase):
+
+    def test_snapshot_numbers_the_batches(self):
+        self.start()
+
+        batches = CampaignRecipient.objects.filter(campaign=self.campaign).values_list('batch', flat=True)
+        self.assertEqual(sorted(batches), [0, 0, 0, 1, 1, 1])
+
+    def test_batch_run_twice_is_sent_once(self):
+        self.start()
+
+        first = self.send_batch(0)
+        second = self.send_batch(0)
+
+        self.assertEqual(first['sent'], 3)
+        self.assertEqual(second, {'sent': 0, 'failed': 0, 'skipped': 0, 'deferred': 0})
+        self.assertEqual(EmailLog.objects.filter(campaign=self.campaign).count(), 3)
+
+    def test_claimed_batch_is_no_longer_pending(self):
+        self.start()
+        self.send_batch(0)
+
+        self.assertEqual(next_pending_batch(self.campaign.id), 1)
+        with transaction.atomic():
+            self.assertEqual(claim_batch(self.campaign.id, 0), [])
+
+
+@skipUnless(connection.features.has_select_for_update_skip_locked, 'Needs SELECT ... FOR UPDATE SKIP LOCKED')
+class ConcurrentClaimTests(CampaignTransactionTestCase):
+
+    def test_locked_recipients_are_skipped(self):
+        self.start()
+        claimed = threading.Event()
+        finish = threading.Event()
+        first = []
+
+        def worker():
+            try:
+                with transaction.atomic():
+                    first.extend(claim_batch(self.campaign.id, 0))
+                    claimed.set()
+                    finish.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        try:
+            self.assertTrue(claimed.wait(10))
+            with transaction.atomic():
+                second = claim_batch(self.campaign.id, 0)
+        finally:
+            finish.set()
+            thread.join()
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(second, [])
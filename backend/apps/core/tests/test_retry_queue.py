@@ -0,0 +1,148 @@
+"""
+Retry queue of failed campaign emails
+"""
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.utils import timezone
+
+from apps.analytics.models import EmailLog
+from apps.campaigns.models import Campaign, CampaignRecipient
+from apps.core.services import campaign_counters, retry_queue
+from apps.core.services.ses_service import get_redis_client
+from tasks import email_tasks
+
+from .base import CampaignTestCase
+
+
+class RetryQueueTestCase(CampaignTestCase):
+    """Adds failed first attempts queued for retry, removed from the queue after the test"""
+
+    def failed_log(self, contact, due=True):
+        email_log = EmailLog.objects.create(
+            campaign=self.campaign,
+            contact=contact,
+            message_id=f"test-{self.campaign.id}-{contact.id}",
+            attempt=1,
+            subject='Hello',
+            from_email=self.campaign.from_email,
+            to_email=contact.email,
+            status='failed',
+            next_retry_at=timezone.now() - timezone.timedelta(seconds=1 if due else -3600)
+        )
+        self.addCleanup(get_redis_client().zrem, retry_queue.RETRY_QUEUE_KEY, email_log.id)
+        return email_log
+
+    def queued(self, email_log):
+        return get_redis_client().zscore(retry_queue.RETRY_QUEUE_KEY, email_log.id) is not None
+
+
+class PausedRetryTests(RetryQueueTestCase):
+
+    def test_retry_popped_before_the_pause_is_postponed(self):
+        self.start()
+        contact = self.campaign.contact_list.contacts.first()
+        email_log = self.failed_log(contact)
+        Campaign.objects.filter(id=self.campaign.id).update(status='paused')
+
+        email_tasks.send_single_email_task.apply((self.campaign.id, contact.id, 2))
+
+        self.assertFalse(EmailLog.objects.filter(campaign=self.campaign, contact=contact, attempt=2).exists())
+        email_log.refresh_from_db()
+        self.assertGreater(email_log.next_retry_at, timezone.now())
+        self.assertTrue(self.queued(email_log))
+
+
+class PopDueTests(RetryQueueTestCase):
+
+    def test_only_due_retries_are_popped(self):
+        contacts = list(self.campaign.contact_list.contacts.order_by('id')[:2])
+        due = self.failed_log(contacts[0])
+        later = self.failed_log(contacts[1], due=False)
+        retry_queue.push([due, later])
+
+        self.assertEqual(retry_queue.pop_due(), [due.id])
+        self.assertTrue(self.queued(later))
+
+    def test_concurrent_drainers_pop_each_retry_once(self):
+        client = get_redis_client()
+        ids = list(range(10 ** 9, 10 ** 9 + 200))
+        client.zadd(retry_queue.RETRY_QUEUE_KEY, {email_log_id: 0 for email_log_id in ids})
+        self.addCleanup(client.zrem, retry_queue.RETRY_QUEUE_KEY, *ids)
+        ids_set = set(ids)
+
+        def drain(_):
+            popped = []
+            while True:
+                batch = [email_log_id for email_log_id in retry_queue.pop_due(limit=7) if email_log_id in ids_set]
+                if not batch:
+                    return popped
+                popped.extend(batch)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            popped = [email_log_id for result in pool.map(drain, range(8)) for email_log_id in result]
+
+        self.assertEqual(sorted(popped), ids)
+
+
+class DrainerTests(RetryQueueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.start()
+        self.contact = self.campaign.contact_list.contacts.first()
+        self.email_log = self.failed_log(self.contact)
+        retry_queue.push([self.email_log])
+        self.addCleanup(get_redis_client().delete, retry_queue.REBUILT_KEY)
+
+        patcher = mock.patch.object(email_tasks.send_single_email_task, 'delay')
+        self.send_single_email = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_due_retry_is_sent_as_the_next_attempt(self):
+        email_tasks.retry_failed_emails_task.apply()
+
+        self.send_single_email.assert_called_once_with(self.campaign.id, self.contact.id, 2)
+        self.email_log.refresh_from_db()
+        self.assertIsNone(self.email_log.next_retry_at)
+        self.assertFalse(self.queued(self.email_log))
+
+    def test_paused_campaign_keeps_its_retries(self):
+        Campaign.objects.filter(id=self.campaign.id).update(status='paused')
+
+        email_tasks.retry_failed_emails_task.apply()
+
+        self.send_single_email.assert_not_called()
+        self.email_log.refresh_from_db()
+        self.assertGreater(self.email_log.next_retry_at, timezone.now())
+        self.assertTrue(self.queued(self.email_log))
+
+    def test_retries_lost_by_redis_are_queued_again(self):
+        # Another retry still queued, so the queue isn't empty
+        other = self.failed_log(self.campaign.contact_list.contacts.exclude(id=self.contact.id).first(), due=False)
+        retry_queue.push([other])
+        get_redis_client().zrem(retry_queue.RETRY_QUEUE_KEY, self.email_log.id)
+
+        email_tasks.retry_failed_emails_task.apply()
+
+        self.send_single_email.assert_called_once_with(self.campaign.id, self.contact.id, 2)
+
+
+class SuccessfulRetryTests(RetryQueueTestCase):
+
+    def test_recipient_is_no_longer_failed(self):
+        self.start()
+        contact = self.campaign.contact_list.contacts.first()
+        self.failed_log(contact)
+        CampaignRecipient.objects.filter(campaign=self.campaign, contact=contact).update(
+            state=CampaignRecipient.STATE_FAILED
+        )
+        Campaign.objects.filter(id=self.campaign.id).update(failed_count=1)
+
+        email_tasks.send_single_email_task.apply((self.campaign.id, contact.id, 2))
+        campaign_counters.flush()
+
+        recipient = CampaignRecipient.objects.get(campaign=self.campaign, contact=contact)
+        self.assertEqual(recipient.state, CampaignRecipient.STATE_SENT)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.failed_count, 0)
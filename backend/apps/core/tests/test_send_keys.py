@@ -0,0 +1,67 @@
+"""
+Idempotency keys of individual sends
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.analytics.models import EmailLog
+from apps.campaigns.models import CampaignRecipient
+from apps.core.services import send_keys
+from tasks import email_tasks
+
+from .base import CampaignTestCase
+
+
+class SendKeyTests(CampaignTestCase):
+
+    def test_send_is_claimed_once(self):
+        self.assertTrue(send_keys.claim(self.campaign.id, 1, 1))
+        self.assertFalse(send_keys.claim(self.campaign.id, 1, 1))
+        # Another attempt is another send
+        self.assertTrue(send_keys.claim(self.campaign.id, 1, 2))
+
+    def test_concurrent_claims_have_one_winner(self):
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            claimed = list(pool.map(lambda _: send_keys.claim(self.campaign.id, 1, 1), range(20)))
+
+        self.assertEqual(claimed.count(True), 1)
+
+    def test_claim_many_skips_claimed_contacts(self):
+        send_keys.claim(self.campaign.id, 2, 1)
+
+        self.assertEqual(send_keys.claim_many(self.campaign.id, [1, 2, 3]), {1, 3})
+        self.assertEqual(send_keys.claim_many(self.campaign.id, [1, 2, 3]), set())
+
+    def test_released_send_can_be_claimed_again(self):
+        send_keys.claim_many(self.campaign.id, [1, 2])
+        send_keys.release(self.campaign.id, [1])
+
+        self.assertEqual(send_keys.claim_many(self.campaign.id, [1, 2]), {1})
+
+
+class DuplicateSendTests(CampaignTestCase):
+
+    def test_batch_skips_recipients_already_claimed(self):
+        self.start()
+        # An earlier run of the batch claimed this send, then its worker died
+        recipient = CampaignRecipient.objects.filter(campaign=self.campaign, batch=0).first()
+        send_keys.claim(self.campaign.id, recipient.contact_id, 1)
+
+        counters = self.send_batch(0)
+
+        self.assertEqual((counters['sent'], counters['skipped']), (2, 1))
+        recipient.refresh_from_db()
+        self.assertEqual(recipient.state, CampaignRecipient.STATE_SKIPPED)
+        self.assertFalse(EmailLog.objects.filter(campaign=self.campaign, contact_id=recipient.contact_id).exists())
+
+        # The skipped recipient still counts toward completion
+        self.send_batch(1)
+        self.assertEqual(self.status(), 'sent')
+
+    def test_retry_enqueued_twice_is_sent_once(self):
+        self.start()
+        contact = self.campaign.contact_list.contacts.first()
+
+        for _ in range(2):
+            email_tasks.send_single_email_task.apply((self.campaign.id, contact.id, 2))
+
+        self.assertEqual(EmailLog.objects.filter(campaign=self.campaign, contact=contact, attempt=2).count(), 1)
@@ -0,0 +1,123 @@
+"""
+Campaign max_send_rate enforcement by the batch scheduler
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from apps.campaigns.models import Campaign, CampaignRecipient, WarmupPlan
+from apps.core.services import sender_pool
+from apps.core.services.rate_limiter import TokenBucket
+from apps.core.services.ses_service import SESService, get_redis_client
+from tasks import email_tasks
+
+from .base import CampaignTestCase
+
+
+class TokenBucketTests(SimpleTestCase):
+    key = 'test_token_bucket'
+
+    def setUp(self):
+        self.addCleanup(get_redis_client().delete, self.key)
+        self.bucket = TokenBucket(get_redis_client(), self.key, 10)
+
+    def test_granted_batch_waits_for_its_tokens(self):
+        granted, wait = self.bucket.reserve(500, max_wait=0)
+
+        self.assertTrue(granted)
+        self.assertAlmostEqual(wait, 49.0, places=1)
+
+    def test_refused_batch_retries_when_the_budget_is_back(self):
+        self.bucket.reserve(500, max_wait=0)
+
+        granted, wait = self.bucket.reserve(500, max_wait=0)
+
+        # The first batch is paid for after 50s, not after both refills
+        self.assertFalse(granted)
+        self.assertAlmostEqual(wait, 50.0, places=1)
+
+
+class MaxSendRateTests(CampaignTestCase):
+    recipients = 9
+
+    def setUp(self):
+        super().setUp()
+        Campaign.objects.filter(id=self.campaign.id).update(max_send_rate=1)
+        self.start()
+
+        for task in (email_tasks.send_email_batch_task, email_tasks.schedule_send_batches_task):
+            patcher = mock.patch.object(task, 'apply_async')
+            self.addCleanup(patcher.stop)
+            setattr(self, task.__name__.rsplit('.', 1)[-1], patcher.start())
+
+    def test_batches_are_published_at_the_capped_rate(self):
+        email_tasks._schedule_pass()
+
+        # One batch of 3 at 1 email/s: published with the countdown that
+        # pays for it, the next one comes back when the budget is there
+        self.assertEqual(self.send_email_batch_task.call_count, 1)
+        countdown = self.send_email_batch_task.call_args.kwargs['countdown']
+        self.assertAlmostEqual(countdown, 2.0, places=1)
+
+        retry_in = self.schedule_send_batches_task.call_args.kwargs['countdown']
+        self.assertAlmostEqual(retry_in, 3.0, places=1)
+
+
+@override_settings(TASK_MAX_COUNTDOWN_SECONDS=1800)
+class WarmupWindowTests(CampaignTestCase):
+    """A sender whose warm-up starts tomorrow waits most of a day"""
+
+    def setUp(self):
+        super().setUp()
+        WarmupPlan.objects.create(domain='example.com', start_date=timezone.localdate() + timedelta(days=1))
+        self.start()
+
+        for task in (email_tasks.send_email_batch_task, email_tasks.schedule_send_batches_task):
+            patcher = mock.patch.object(task, 'apply_async')
+            self.addCleanup(patcher.stop)
+            setattr(self, task.__name__.rsplit('.', 1)[-1], patcher.start())
+
+    def test_scheduler_rechecks_before_the_visibility_timeout(self):
+        email_tasks._schedule_pass()
+
+        self.send_email_batch_task.assert_not_called()
+        self.assertEqual(self.schedule_send_batches_task.call_args.kwargs['countdown'], 1800)
+
+    def test_deferred_batch_comes_back_before_the_visibility_timeout(self):
+        with self.on_commit():
+            email_tasks.send_email_batch_task.run(self.campaign.id, 0)
+
+        self.assertEqual(self.send_email_batch_task.call_args.kwargs['countdown'], 1800)
+        self.assertEqual(set(self.states(batch=0).values()), {CampaignRecipient.STATE_PENDING})
+
+
+@override_settings(CAMPAIGN_SEND_QUEUE='test-sending')
+class SendQueueTests(CampaignTestCase):
+
+    def test_requeued_batch_goes_to_the_send_queue(self):
+        with mock.patch.object(email_tasks.send_email_batch_task, 'apply_async') as apply_async:
+            email_tasks._requeue_batch(self.campaign.id, 0, 1, 5)
+
+        self.assertEqual(apply_async.call_args.kwargs['queue'], 'test-sending')
+
+
+class LocalRateLimitTests(CampaignTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.start()
+        shard = sender_pool.default_shard()
+        self.addCleanup(get_redis_client().delete, shard.bucket_key)
+        # Seconds of debt on the global SES bucket
+        SESService(shard=shard).rate_limiter.reserve(5000)
+
+    def test_batch_is_deferred_without_counting_a_throttle(self):
+        with mock.patch.object(email_tasks, '_requeue_batch') as requeue_batch:
+            self.send_batch(0)
+
+        campaign_id, batch, throttle_attempt, countdown = requeue_batch.call_args.args
+        self.assertEqual((campaign_id, batch, throttle_attempt), (self.campaign.id, 0, 0))
+        self.assertGreater(countdown, 0)
+        self.assertEqual(set(self.states(batch=0).values()), {CampaignRecipient.STATE_PENDING})
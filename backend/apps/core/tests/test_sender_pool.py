@@ -0,0 +1,196 @@
+"""
+Sender pool rate limiting and failover, against the local SES stub
+
+Needs the Redis of REDIS_URL, the shards use their own keys.
+"""
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.core.services import sender_pool
+from apps.core.services.ses_service import SESService, get_redis_client, init_process_clients
+from apps.core.services.ses_stub import SESStubServer
+
+
+class SESStubTestCase(SimpleTestCase):
+    """
+    Runs one SES stub per shard and points SES_SENDER_SHARDS at them
+
+    Subclasses set stubs to {shard name: SESStubServer options}.
+    """
+
+    stubs = {}
+    from_email = 'news@example.com'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servers = {}
+        for name, options in cls.stubs.items():
+            server = SESStubServer(('127.0.0.1', 0), **options)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.servers[name] = server
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers.values():
+            server.shutdown()
+            server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        shards = [{
+            'name': name,
+            'endpoint_url': f"http://127.0.0.1:{server.server_address[1]}",
+            'access_key_id': 'test',
+            'secret_access_key': 'test',
+            'rate_limit': 1000,
+        } for name, server in self.servers.items()]
+
+        override = override_settings(
+            EMAIL_TRANSPORT='ses',
+            SES_SENDER_SHARDS=shards,
+            SES_ADAPTIVE_RATE_ENABLED=True,
+            SES_SHARD_FAILURE_THRESHOLD=3,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(init_process_clients)
+        self.addCleanup(self._clear_redis)
+
+        init_process_clients()
+        self._clear_redis()
+        for server in self.servers.values():
+            server.stats.update(requests=0, emails=0, rejected=0, throttled=0)
+
+    def _clear_redis(self):
+        client = get_redis_client()
+        for shard in sender_pool.get_shards():
+            client.delete(
+                shard.bucket_key,
+                shard.adaptive_key,
+                f"ses_shard:{shard.name}:failures",
+                f"ses_shard:{shard.name}:down",
+            )
+
+    def send(self, shard, count):
+        ses = SESService(shard=sender_pool.get_shard(shard))
+        return [
+            ses.send_email(
+                to_email=f"user{index}@example.org",
+                from_email=self.from_email,
+                from_name='News',
+                subject='Hello',
+                html_content='<p>Hello</p>',
+                plain_text_content='Hello'
+            )
+            for index in range(count)
+        ]
+
+
+class RateLimitTests(SESStubTestCase):
+    stubs = {'test-slow': {'max_send_rate': 5}}
+
+    def test_throttled_sends_are_handed_back(self):
+        results = self.send('test-slow', 20)
+
+        throttled = [result for result in results if result.get('throttled')]
+        self.assertTrue(throttled)
+        self.assertFalse([result for result in throttled if result['success']])
+        self.assertEqual(self.servers['test-slow'].stats['throttled'], len(throttled))
+
+    def test_throttling_lowers_the_send_rate(self):
+        ses = SESService(shard=sender_pool.get_shard('test-slow'))
+        # An account whose quota claims more than SES lets through
+        ses.rate_controller.refresh({
+            'success': True,
+            'max_send_rate': 100,
+            'max_24_hour_send': -1,
+            'sent_last_24_hours': 0,
+        })
+        before = ses.rate_limiter.get_rate()
+
+        results = self.send('test-slow', 20)
+
+        self.assertTrue(any(result.get('throttled') for result in results))
+        self.assertLess(ses.rate_limiter.get_rate(), before)
+
+    def test_local_rate_limit_defers_instead_of_waiting(self):
+        ses = SESService(shard=sender_pool.get_shard('test-slow'))
+        # Four seconds of debt at the shard's 1000/s
+        ses.rate_limiter.reserve(5000)
+
+        started = time.monotonic()
+        results = self.send('test-slow', 3)
+
+        self.assertLess(time.monotonic() - started, 1)
+        for result in results:
+            self.assertTrue(result['throttled'])
+            self.assertAlmostEqual(result['retry_after'], 4.0, delta=0.5)
+        self.assertEqual(self.servers['test-slow'].stats['requests'], 0)
+
+    def test_quota_follows_the_stub(self):
+        ses = SESService(shard=sender_pool.get_shard('test-slow'))
+        ses.refresh_send_rate()
+
+        # 95% of the stub's MaxSendRate
+        self.assertAlmostEqual(ses.rate_limiter.get_rate(), 4.75)
+        self.assertTrue(ses.has_send_quota(1000))
+
+
+class FailoverTests(SESStubTestCase):
+    stubs = {
+        'test-primary': {'max_send_rate': 1},
+        'test-secondary': {},
+    }
+
+    def test_throttling_shard_is_taken_out_of_rotation(self):
+        self.send('test-primary', 10)
+
+        self.assertEqual(
+            [shard.name for shard in sender_pool.healthy(sender_pool.get_shards())],
+            ['test-secondary']
+        )
+        for _ in range(20):
+            self.assertEqual(sender_pool.choose(self.from_email).name, 'test-secondary')
+
+    def test_batches_fail_over_to_the_healthy_shard(self):
+        self.send('test-primary', 10)
+
+        shard = sender_pool.choose(self.from_email, 10)
+        results = self.send(shard.name, 10)
+
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(self.servers['test-secondary'].stats['emails'], 10)
+
+    def test_every_shard_down_keeps_sending(self):
+        for shard in sender_pool.get_shards():
+            for _ in range(3):
+                sender_pool.record_failure(shard, 'error')
+
+        self.assertIsNotNone(sender_pool.choose(self.from_email))
+
+
+class QuotaFailoverTests(SESStubTestCase):
+    stubs = {
+        'test-small': {'max_24_hour_send': 10.0},
+        'test-large': {'max_24_hour_send': 1000.0},
+    }
+
+    def setUp(self):
+        super().setUp()
+        for shard in sender_pool.get_shards():
+            SESService(shard=shard).refresh_send_rate()
+
+    def test_shard_without_quota_is_skipped(self):
+        for _ in range(20):
+            self.assertEqual(sender_pool.choose(self.from_email, 50).name, 'test-large')
+
+    def test_both_shards_used_within_quota(self):
+        chosen = {sender_pool.choose(self.from_email, 5).name for _ in range(50)}
+        self.assertEqual(chosen, {'test-small', 'test-large'})
+
+    def test_no_shard_with_quota(self):
+        self.assertIsNone(sender_pool.choose(self.from_email, 5000))
+        self.assertFalse(sender_pool.has_send_quota(5000))
@@ -0,0 +1,121 @@
+"""
+Deduplication of SES notifications redelivered by SNS
+"""
+import json
+import uuid
+from unittest import mock
+
+from apps.analytics.models import EmailEvent, EmailLog
+from apps.contacts.models import Contact
+from apps.core.services import ses_notifications
+from apps.core.services.ses_service import get_redis_client
+
+from .base import CampaignTestCase
+
+TEST_STREAM_KEY = 'ses_notifications:test'
+TEST_DEAD_LETTER_KEY = 'ses_notifications:test:dead'
+
+
+class SESNotificationTestCase(CampaignTestCase):
+    """Uses streams of its own, removed with its seen keys after the test"""
+
+    def setUp(self):
+        super().setUp()
+        for name, key in (('STREAM_KEY', TEST_STREAM_KEY), ('DEAD_LETTER_KEY', TEST_DEAD_LETTER_KEY)):
+            patcher = mock.patch.object(ses_notifications, name, key)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+            self.addCleanup(get_redis_client().delete, key)
+
+        contact = Contact.objects.get(email='user0@example.org')
+        self.email_log = EmailLog.objects.create(
+            campaign=self.campaign,
+            contact=contact,
+            message_id=f"test-{uuid.uuid4().hex}",
+            attempt=1,
+            subject='Hello',
+            from_email=self.campaign.from_email,
+            to_email=contact.email,
+            status='sent'
+        )
+
+    def sns_message(self):
+        """An SNS Delivery notification of the email log, with a MessageId of its own"""
+        sns_message_id = str(uuid.uuid4())
+        self.addCleanup(get_redis_client().delete, f"ses_notification_seen:sns:{sns_message_id}")
+        return json.dumps({
+            'Type': 'Notification',
+            'MessageId': sns_message_id,
+            'Message': json.dumps({
+                'notificationType': 'Delivery',
+                'mail': {'messageId': self.email_log.message_id},
+                'delivery': {'timestamp': '2024-01-01T12:00:01.000Z'},
+            }),
+        })
+
+    def post(self, body):
+        return self.client.post('/api/webhooks/ses/', body, content_type='application/json')
+
+    def pending(self):
+        return get_redis_client().xpending(TEST_STREAM_KEY, ses_notifications.GROUP)['pending']
+
+    def events(self):
+        return EmailEvent.objects.filter(email_log=self.email_log).count()
+
+
+class RedeliveryTests(SESNotificationTestCase):
+
+    def test_redelivered_message_is_applied_once(self):
+        body = self.sns_message()
+        self.assertEqual(self.post(body).status_code, 200)
+        self.assertEqual(self.post(body).status_code, 200)
+
+        self.assertEqual(ses_notifications.consume(consumer='test'), 1)
+
+        self.assertEqual(self.events(), 1)
+        self.email_log.refresh_from_db()
+        self.assertEqual(self.email_log.status, 'delivered')
+        self.assertEqual(ses_notifications.backlog(), 0)
+
+    def test_redelivery_after_processing_is_dropped(self):
+        body = self.sns_message()
+        self.post(body)
+        ses_notifications.consume(consumer='test')
+
+        self.post(body)
+
+        self.assertEqual(ses_notifications.consume(consumer='test'), 0)
+        self.assertEqual(self.events(), 1)
+        self.assertEqual(ses_notifications.backlog(), 0)
+
+    def test_reclaimed_entry_is_processed_and_its_redelivery_dropped(self):
+        body = self.sns_message()
+        self.post(body)
+
+        # The first consumer marks the message seen, then its batch fails
+        with mock.patch.object(ses_notifications, 'process_batch', side_effect=RuntimeError('database down')):
+            self.assertEqual(ses_notifications.consume(consumer='first'), 0)
+        self.assertEqual(self.pending(), 1)
+        self.assertEqual(self.events(), 0)
+
+        # SNS redelivers while the entry waits to be claimed again
+        self.post(body)
+
+        with mock.patch.object(ses_notifications, 'CLAIM_IDLE_MS', 0):
+            self.assertEqual(ses_notifications.consume(consumer='second'), 1)
+
+        self.assertEqual(self.events(), 1)
+        self.assertEqual(self.pending(), 0)
+        self.assertEqual(ses_notifications.backlog(), 0)
+
+    def test_entry_failing_every_delivery_is_dead_lettered(self):
+        self.post(self.sns_message())
+
+        with mock.patch.object(ses_notifications, 'process_batch', side_effect=RuntimeError('database down')), \
+                mock.patch.object(ses_notifications, 'CLAIM_IDLE_MS', 0):
+            for _ in range(ses_notifications.MAX_DELIVERIES):
+                ses_notifications.consume(consumer='test', max_batches=1)
+
+        self.assertEqual(self.pending(), 0)
+        self.assertEqual(ses_notifications.backlog(), 0)
+        self.assertEqual(get_redis_client().xlen(TEST_DEAD_LETTER_KEY), 1)
@@ -4,6 +4,7 @@ Celery configuration for email platform project.
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -20,26 +21,63 @@ app.autodiscover_tasks()
 # Import tasks to register them
 from tasks import (
     check_scheduled_campaigns_task,
+    refresh_ses_quota_task,
+    flush_campaign_counters_task,
     cleanup_old_logs_task,
     sync_suppression_list_task,
+    delete_finished_ses_templates_task,
+    retry_failed_emails_task,
+    consume_ses_notifications_task,
+    close_abandoned_batches_task,
 )
 
 # Celery Beat Schedule
 app.conf.beat_schedule = {
     'check-scheduled-campaigns': {
-        'task': 'check_scheduled_campaigns_task',
+        'task': check_scheduled_campaigns_task.name,
         'schedule': 60.0,  # Every 1 minute
     },
+    'refresh-ses-quota': {
+        'task': refresh_ses_quota_task.name,
+        'schedule': 60.0,  # Every 1 minute
+    },
+    'flush-campaign-counters': {
+        'task': flush_campaign_counters_task.name,
+        'schedule': 5.0,  # Every 5 seconds
+    },
+    'consume-ses-notifications': {
+        'task': consume_ses_notifications_task.name,
+        'schedule': 2.0,  # Every 2 seconds, drains the webhook stream
+    },
+    'retry-failed-emails': {
+        'task': retry_failed_emails_task.name,
+        'schedule': 5.0,  # Every 5 seconds, only pops the retries that are due
+    },
+    'close-abandoned-batches': {
+        'task': close_abandoned_batches_task.name,
+        'schedule': 60.0,  # Every 1 minute, also re-dispatches timed out batches
+    },
     'cleanup-old-logs': {
-        'task': 'cleanup_old_logs_task',
+        'task': cleanup_old_logs_task.name,
         'schedule': crontab(hour=3, minute=0),  # Daily at 3 AM
     },
     'sync-suppression-list': {
-        'task': 'sync_suppression_list_task',
+        'task': sync_suppression_list_task.name,
         'schedule': crontab(hour='*/6'),  # Every 6 hours
     },
+    'delete-finished-ses-templates': {
+        'task': delete_finished_ses_templates_task.name,
+        'schedule': crontab(minute=30),  # Every hour
+    },
 }
 
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Create the per-process SES client and Redis pool after fork"""
+    from apps.core.services.ses_service import init_process_clients
+    init_process_clients()
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -167,12 +167,127 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# The Redis broker hands a task that isn't acked within the visibility
+# timeout to another worker, tasks waiting for their countdown included.
+# Tasks are never published further ahead than TASK_MAX_COUNTDOWN_SECONDS,
+# a longer wait (the next warm-up window) is made of several hops.
+BROKER_VISIBILITY_TIMEOUT_SECONDS = env.int('BROKER_VISIBILITY_TIMEOUT_SECONDS', default=3600)
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': BROKER_VISIBILITY_TIMEOUT_SECONDS}
+TASK_MAX_COUNTDOWN_SECONDS = env.int(
+    'TASK_MAX_COUNTDOWN_SECONDS',
+    default=BROKER_VISIBILITY_TIMEOUT_SECONDS // 2
+)
+
+# One queue per class of work, each served by its own worker pool
+# (see docker-compose.yml) so a big campaign can't delay bounce processing
+CELERY_TASK_DEFAULT_QUEUE = 'maintenance'
+CELERY_TASK_ROUTES = {
+    'tasks.email_tasks.send_campaign_task': {'queue': 'dispatch'},
+    'tasks.email_tasks.schedule_send_batches_task': {'queue': 'dispatch'},
+    'tasks.email_tasks.send_email_batch_task': {'queue': 'sending'},
+    'tasks.email_tasks.send_single_email_task': {'queue': 'sending'},
+    'tasks.email_tasks.process_ses_notification_task': {'queue': 'events'},
+    'tasks.email_tasks.consume_ses_notifications_task': {'queue': 'events'},
+    'tasks.email_tasks.*': {'queue': 'maintenance'},
+    'tasks.scheduled_tasks.*': {'queue': 'maintenance'},
+}
+
 # AWS SES Configuration
 AWS_ACCESS_KEY_ID = env('AWS_ACCESS_KEY_ID', default='')
 AWS_SECRET_ACCESS_KEY = env('AWS_SECRET_ACCESS_KEY', default='')
 AWS_SES_REGION = env('AWS_SES_REGION', default='us-east-1')
 AWS_SES_CONFIGURATION_SET = env('AWS_SES_CONFIGURATION_SET', default='')
-SES_RATE_LIMIT_PER_SECOND = env.int('SES_RATE_LIMIT_PER_SECOND', default=14)
+# Point at a local SES stub (python manage.py ses_stub) for testing
+AWS_SES_ENDPOINT_URL = env('AWS_SES_ENDPOINT_URL', default='')
+SES_RATE_LIMIT_PER_SECOND = env.float('SES_RATE_LIMIT_PER_SECOND', default=14)
+# Token bucket burst size (0 = one second of SES_RATE_LIMIT_PER_SECOND)
+SES_RATE_LIMIT_BURST = env.float('SES_RATE_LIMIT_BURST', default=0)
+
+# Adaptive send rate (AIMD on top of get_send_quota)
+SES_ADAPTIVE_RATE_ENABLED = env.bool('SES_ADAPTIVE_RATE_ENABLED', default=True)
+SES_RATE_INCREASE_STEP = env.float('SES_RATE_INCREASE_STEP', default=2.0)
+SES_RATE_DECREASE_FACTOR = env.float('SES_RATE_DECREASE_FACTOR', default=0.5)
+SES_RATE_MIN_PER_SECOND = env.float('SES_RATE_MIN_PER_SECOND', default=1.0)
+SES_QUOTA_UTILIZATION = env.float('SES_QUOTA_UTILIZATION', default=0.95)
+SES_QUOTA_RETRY_SECONDS = env.int('SES_QUOTA_RETRY_SECONDS', default=900)
+
+# Throttled sends are rescheduled instead of sleeping in the worker
+SES_THROTTLE_BACKOFF_SECONDS = env.float('SES_THROTTLE_BACKOFF_SECONDS', default=2.0)
+SES_THROTTLE_MAX_BACKOFF_SECONDS = env.float('SES_THROTTLE_MAX_BACKOFF_SECONDS', default=300.0)
+SES_THROTTLE_MAX_RETRIES = env.int('SES_THROTTLE_MAX_RETRIES', default=10)
+# Attempts per SES API call made by botocore itself (1 = no in-process retries)
+SES_CLIENT_MAX_ATTEMPTS = env.int('SES_CLIENT_MAX_ATTEMPTS', default=1)
+# Keep-alive HTTPS connections held by each worker process's SES client
+SES_MAX_POOL_CONNECTIONS = env.int('SES_MAX_POOL_CONNECTIONS', default=10)
+
+# Per-recipient-domain lanes, each with its own rate inside the global limit, e.g.
+# {"gmail": {"domains": ["gmail.com", "googlemail.com"], "rate": 5, "concurrency": 4}}
+# rate is emails/second (0 = only the global limit), concurrency is batches at once (0 = unlimited)
+SES_DOMAIN_GROUPS = env.json('SES_DOMAIN_GROUPS', default={})
+# Lane of every domain not listed above
+SES_DOMAIN_DEFAULT_RATE = env.float('SES_DOMAIN_DEFAULT_RATE', default=0)
+SES_DOMAIN_DEFAULT_CONCURRENCY = env.int('SES_DOMAIN_DEFAULT_CONCURRENCY', default=0)
+# Wait before retrying a batch whose lane has no free slot
+SES_DOMAIN_BUSY_BACKOFF_SECONDS = env.float('SES_DOMAIN_BUSY_BACKOFF_SECONDS', default=1.0)
+
+# Pool of SES endpoints sends are sharded across (empty = the AWS_* settings above), e.g.
+# [{"name": "us", "region": "us-east-1", "access_key_id": "...", "secret_access_key": "...",
+#   "configuration_set": "", "rate_limit": 14, "weight": 2, "domains": []}]
+# domains restricts a shard to those sending domains, weight is its share of the batches
+SES_SENDER_SHARDS = env.json('SES_SENDER_SHARDS', default=[])
+# Throttles/endpoint errors within the window that take a shard out of rotation for the cooldown
+SES_SHARD_FAILURE_THRESHOLD = env.int('SES_SHARD_FAILURE_THRESHOLD', default=5)
+SES_SHARD_FAILURE_WINDOW_SECONDS = env.int('SES_SHARD_FAILURE_WINDOW_SECONDS', default=60)
+SES_SHARD_COOLDOWN_SECONDS = env.int('SES_SHARD_COOLDOWN_SECONDS', default=120)
+
+# Email transport: ses, smtp, maildir or null (campaigns can override it)
+EMAIL_TRANSPORT = env('EMAIL_TRANSPORT', default='ses')
+# smtp transport
+EMAIL_HOST = env('EMAIL_HOST', default='localhost')
+EMAIL_PORT = env.int('EMAIL_PORT', default=25)
+EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=False)
+# maildir transport
+EMAIL_MAILDIR_PATH = env('EMAIL_MAILDIR_PATH', default=str(BASE_DIR / 'maildir'))
+# null transport (load testing): latency per call and fraction of recipients rejected
+EMAIL_NULL_LATENCY_MS = env.float('EMAIL_NULL_LATENCY_MS', default=0.0)
+EMAIL_NULL_ERROR_RATE = env.float('EMAIL_NULL_ERROR_RATE', default=0.0)
+
+# Campaign sending
+CAMPAIGN_SEND_BATCH_SIZE = env.int('CAMPAIGN_SEND_BATCH_SIZE', default=500)
+# Batches of one campaign queued or being sent at the same time
+CAMPAIGN_DISPATCH_LOOKAHEAD = env.int('CAMPAIGN_DISPATCH_LOOKAHEAD', default=4)
+# Batches in flight across all campaigns, shared by weighted round-robin on priority
+SCHEDULER_MAX_INFLIGHT_BATCHES = env.int('SCHEDULER_MAX_INFLIGHT_BATCHES', default=16)
+# A batch not finished this long after its task was due is presumed lost and dispatched again
+CAMPAIGN_BATCH_TIMEOUT_SECONDS = env.int('CAMPAIGN_BATCH_TIMEOUT_SECONDS', default=1800)
+CAMPAIGN_PRIORITY_WEIGHTS = {
+    'low': env.int('CAMPAIGN_PRIORITY_WEIGHT_LOW', default=1),
+    'normal': env.int('CAMPAIGN_PRIORITY_WEIGHT_NORMAL', default=4),
+    'high': env.int('CAMPAIGN_PRIORITY_WEIGHT_HIGH', default=16),
+}
+# SES notifications: webhook stream length cap and notifications applied per batch
+SES_NOTIFICATION_STREAM_MAXLEN = env.int('SES_NOTIFICATION_STREAM_MAXLEN', default=1000000)
+SES_NOTIFICATION_BATCH_SIZE = env.int('SES_NOTIFICATION_BATCH_SIZE', default=500)
+# How long notifications are remembered to drop SNS redeliveries before the database
+SES_NOTIFICATION_DEDUP_TTL_SECONDS = env.int('SES_NOTIFICATION_DEDUP_TTL_SECONDS', default=6 * 3600)
+# Failed sends are retried with exponential backoff (permanent errors never are)
+EMAIL_RETRY_MAX_ATTEMPTS = env.int('EMAIL_RETRY_MAX_ATTEMPTS', default=3)
+EMAIL_RETRY_BACKOFF_SECONDS = env.int('EMAIL_RETRY_BACKOFF_SECONDS', default=60)
+EMAIL_RETRY_MAX_BACKOFF_SECONDS = env.int('EMAIL_RETRY_MAX_BACKOFF_SECONDS', default=3600)
+# Broker queue the batch tasks go to, and how deep it may get before dispatchers hold back
+CAMPAIGN_SEND_QUEUE = env('CAMPAIGN_SEND_QUEUE', default='sending')
+CAMPAIGN_DISPATCH_MAX_QUEUE_DEPTH = env.int('CAMPAIGN_DISPATCH_MAX_QUEUE_DEPTH', default=100)
+CAMPAIGN_DISPATCH_BACKOFF_SECONDS = env.float('CAMPAIGN_DISPATCH_BACKOFF_SECONDS', default=5.0)
+# Queues reported by the queue metrics endpoint
+BROKER_MONITORED_QUEUES = env.list(
+    'BROKER_MONITORED_QUEUES',
+    default=['dispatch', 'sending', 'events', 'maintenance']
+)
+# Compiled templates kept per worker process (subject, HTML and text count separately)
+TEMPLATE_CACHE_SIZE = env.int('TEMPLATE_CACHE_SIZE', default=64)
 
 # Redis Configuration
 REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/0')
+REDIS_MAX_CONNECTIONS = env.int('REDIS_MAX_CONNECTIONS', default=20)
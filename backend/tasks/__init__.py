@@ -7,16 +7,23 @@ Import all tasks here to make them discoverable by Celery
 from .email_tasks import (
     send_campaign_task,
     send_single_email_task,
+    send_email_batch_task,
+    schedule_send_batches_task,
     process_ses_notification_task,
+    consume_ses_notifications_task,
     retry_failed_emails_task,
+    close_abandoned_batches_task,
     update_campaign_metrics_task,
 )
 
 # Import all scheduled tasks
 from .scheduled_tasks import (
     check_scheduled_campaigns_task,
+    refresh_ses_quota_task,
+    flush_campaign_counters_task,
     cleanup_old_logs_task,
     sync_suppression_list_task,
+    delete_finished_ses_templates_task,
     daily_metrics_summary_task,
 )
 
@@ -24,12 +31,19 @@ __all__ = [
     # Email tasks
     'send_campaign_task',
     'send_single_email_task',
+    'send_email_batch_task',
+    'schedule_send_batches_task',
     'process_ses_notification_task',
+    'consume_ses_notifications_task',
     'retry_failed_emails_task',
+    'close_abandoned_batches_task',
     'update_campaign_metrics_task',
     # Scheduled tasks
     'check_scheduled_campaigns_task',
+    'refresh_ses_quota_task',
+    'flush_campaign_counters_task',
     'cleanup_old_logs_task',
     'sync_suppression_list_task',
+    'delete_finished_ses_templates_task',
     'daily_metrics_summary_task',
 ]
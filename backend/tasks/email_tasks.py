@@ -2,23 +2,40 @@
 Celery tasks for email sending and processing
 """
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
 import logging
+import random
 
 logger = logging.getLogger(__name__)
 
 
+class SendThrottled(Exception):
+    """SES (or the local rate limiter) throttled a send, reschedule it"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        # Seconds until the local rate limiter has tokens again, None for SES throttling
+        self.retry_after = retry_after
+
+
 @shared_task(bind=True, max_retries=3)
 def send_campaign_task(self, campaign_id):
     """
-    Send all emails for a campaign
+    Start sending a campaign
+
+    The recipients are frozen into a CampaignRecipient snapshot on the
+    first run, then schedule_send_batches_task feeds the batches to the
+    workers a few at a time, sharing them with other sending campaigns.
 
     Args:
         campaign_id: ID of the campaign to send
     """
     from apps.campaigns.models import Campaign
     from apps.contacts.models import Contact
+    from apps.core.services import campaign_progress, sender_pool, warmup
+    from apps.core.services.recipient_snapshot import create_snapshot, pending_count, unfinished_count
 
     try:
         campaign = Campaign.objects.select_related('template', 'contact_list').get(id=campaign_id)
@@ -27,6 +44,12 @@ def send_campaign_task(self, campaign_id):
             logger.warning(f"Campaign {campaign_id} is not in sending status")
             return
 
+        # Don't start dispatching once every shard's 24h quota is used up
+        if not sender_pool.has_send_quota():
+            logger.warning(f"SES 24h quota exhausted, campaign {campaign_id} dispatch postponed")
+            send_campaign_task.apply_async((campaign_id,), countdown=_countdown(settings.SES_QUOTA_RETRY_SECONDS))
+            return f"Campaign {campaign_id} postponed, SES quota exhausted"
+
         # Get all subscribed and non-suppressed contacts from the list
         contacts = Contact.objects.filter(
             lists=campaign.contact_list,
@@ -34,13 +57,23 @@ def send_campaign_task(self, campaign_id):
             is_suppressed=False
         )
 
-        logger.info(f"Sending campaign '{campaign.name}' to {contacts.count()} contacts")
+        # Warming up senders reach their most engaged contacts first
+        batch_size = settings.CAMPAIGN_SEND_BATCH_SIZE
+        by_engagement = warmup.plan_for_sender(campaign.from_email) is not None
+        snapshot_count = create_snapshot(campaign, contacts, batch_size, by_engagement=by_engagement)
+        if snapshot_count is not None:
+            Campaign.objects.filter(id=campaign.id).update(total_recipients=snapshot_count, dispatch_cursor=0)
 
-        # Queue individual email tasks
-        for contact in contacts:
-            send_single_email_task.delay(campaign.id, contact.id)
+        pending = pending_count(campaign.id)
+        logger.info(f"Sending campaign '{campaign.name}': {pending} recipients in batches of {batch_size}")
 
-        return f"Campaign {campaign_id} emails queued successfully"
+        # Completes the campaign right away if nobody is left to send to.
+        # Recipients a batch is still sending (paused mid-batch) are counted
+        # too, that batch reports them when it finishes.
+        if not campaign_progress.start(campaign.id, unfinished_count(campaign.id)):
+            schedule_send_batches_task.delay()
+
+        return f"Campaign {campaign_id} dispatch started"
 
     except Campaign.DoesNotExist:
         logger.error(f"Campaign {campaign_id} not found")
@@ -52,89 +85,363 @@ def send_campaign_task(self, campaign_id):
         raise self.retry(exc=e, countdown=2 ** self.request.retries)
 
 
+@shared_task
+def schedule_send_batches_task():
+    """
+    Hand free batch slots to the sending campaigns
+
+    Keeps at most SCHEDULER_MAX_INFLIGHT_BATCHES batches in flight in
+    total and CAMPAIGN_DISPATCH_LOOKAHEAD per campaign, walking each
+    campaign's snapshot from its dispatch_cursor. Slots go to campaigns
+    by weighted round-robin over their priority class, within their
+    max_send_rate. Every finished batch runs it again, so the broker
+    never holds more than a few batches and a pause takes effect within
+    one batch.
+    """
+    from apps.core.services import send_scheduler
+
+    # If another scheduler holds the lock it makes the pass for us
+    send_scheduler.request_pass()
+
+    while True:
+        token = send_scheduler.acquire_lock()
+        if token is None:
+            return
+
+        try:
+            while send_scheduler.take_request():
+                _schedule_pass()
+        finally:
+            send_scheduler.release_lock(token)
+
+        # A request that arrived after our last pass but before the release
+        if not send_scheduler.has_request():
+            return
+
+
 @shared_task(bind=True, max_retries=3)
-def send_single_email_task(self, campaign_id, contact_id):
+def send_email_batch_task(self, campaign_id, batch, throttle_attempt=0):
     """
-    Send a single email
+    Send a campaign email to the pending recipients of one snapshot batch
+
+    No transaction is open while SES is called. A first short transaction
+    claims the pending recipients with SELECT ... FOR UPDATE SKIP LOCKED,
+    moves them to sending and writes their email logs with one
+    bulk_create, so two workers never send the same batch and the logs
+    are there for the notifications SES sends back. A second one saves
+    the results with one bulk_update. Throttled recipients go back to
+    pending and the batch is re-queued with a jittered countdown, so the
+    worker is free to serve other campaigns meanwhile. Every batch belongs
+    to one recipient domain lane and waits for a free slot of that lane
+    before sending.
 
     Args:
         campaign_id: ID of the campaign
-        contact_id: ID of the contact
+        batch: Snapshot batch number
+        throttle_attempt: How many times this batch was throttled
+
+    Returns:
+        dict: Per-batch counters (sent, failed, skipped, deferred)
     """
-    from apps.campaigns.models import Campaign
-    from apps.contacts.models import Contact
+    from apps.campaigns.models import Campaign, CampaignRecipient
     from apps.analytics.models import EmailLog
+    from apps.core.services import (
+        campaign_counters, domain_lanes, retry_queue, send_keys, send_scheduler, sender_pool, warmup
+    )
+    from apps.core.services.recipient_snapshot import claim_batch
     from apps.core.services.ses_service import SESService
+    from apps.core.services.template_cache import get_campaign_templates
+
+    counters = {'sent': 0, 'failed': 0, 'skipped': 0, 'deferred': 0}
+    lane_slot = None
+    requeue_in = None
+    claimed = set()
+    # Set on every path that is done with the batch, a deferred one keeps its slot
+    release = False
 
     try:
-        campaign = Campaign.objects.select_related('template').get(id=campaign_id)
-        contact = Contact.objects.get(id=contact_id)
+        with transaction.atomic():
+            try:
+                campaign = Campaign.objects.select_related('template').get(id=campaign_id)
+
+                if campaign.status != 'sending':
+                    # Paused: leave the recipients pending for resume
+                    logger.info(f"Campaign {campaign_id} is {campaign.status}, batch {batch} not sent")
+                    release = True
+                    return counters
+
+                templates = get_campaign_templates(campaign)
+
+                recipients = claim_batch(campaign_id, batch)
+                if not recipients:
+                    # Already sent, or being sent by another worker
+                    release = True
+                    return counters
+
+                # A batch holds a single domain lane, wait while the lane is at its ceiling
+                lane = recipients[0].lane
+                lane_slot = domain_lanes.acquire_slot(lane)
+                if lane_slot is None:
+                    logger.info(f"Lane '{lane}' is busy, batch {batch} of campaign {campaign_id} postponed")
+                    countdown = random.uniform(0.5, 1.0) * settings.SES_DOMAIN_BUSY_BACKOFF_SECONDS
+                    transaction.on_commit(lambda: _requeue_batch(campaign_id, batch, throttle_attempt, countdown))
+                    counters['deferred'] = len(recipients)
+                    return counters
+
+                # Shards are picked per batch, so a retried batch fails over,
+                # and a shard whose 24h quota is used up hands over to the others
+                shard = sender_pool.choose(campaign.from_email, len(recipients))
+
+                # Wait for the 24h quota window instead of sending into rejections
+                if shard is None:
+                    logger.warning(
+                        f"SES 24h quota of every shard exhausted, "
+                        f"batch {batch} of campaign {campaign_id} postponed"
+                    )
+                    domain_lanes.release_slot(lane, lane_slot)
+                    transaction.on_commit(lambda: _requeue_batch(
+                        campaign_id, batch, throttle_attempt, settings.SES_QUOTA_RETRY_SECONDS
+                    ))
+                    counters['deferred'] = len(recipients)
+                    return counters
+
+                ses = SESService(lane=lane, shard=shard, transport=campaign.transport or None)
+
+                # Contacts may have unsubscribed or been suppressed since the snapshot
+                sending = []
+                for recipient in recipients:
+                    if recipient.contact.is_subscribed and not recipient.contact.is_suppressed:
+                        sending.append(recipient)
+                    else:
+                        recipient.state = CampaignRecipient.STATE_SKIPPED
+                        counters['skipped'] += 1
+
+                # A warming up sender only sends what is left of its window,
+                # the rest stays pending and the batch comes back for them
+                plan = warmup.plan_for_sender(campaign.from_email)
+                if plan and sending:
+                    allowed = warmup.reserve(plan, len(sending))
+                    if allowed < len(sending):
+                        counters['deferred'] += len(sending) - allowed
+                        sending = sending[:allowed]
+                        requeue_in = warmup.next_window_in(plan) or 1
+                        logger.info(
+                            f"Warm-up limit of {plan.domain} reached, {counters['deferred']} recipients "
+                            f"of batch {batch} carried over to the next window"
+                        )
+
+                # A send claimed by an earlier run of this batch (a worker that died
+                # after calling SES) may have gone out, it is not sent again
+                claimed = send_keys.claim_many(campaign_id, [recipient.contact_id for recipient in sending])
+                if len(claimed) < len(sending):
+                    duplicates = [recipient for recipient in sending if recipient.contact_id not in claimed]
+                    for recipient in duplicates:
+                        recipient.state = CampaignRecipient.STATE_SKIPPED
+                    counters['skipped'] += len(duplicates)
+                    if plan:
+                        warmup.refund(plan, len(duplicates))
+                    sending = [recipient for recipient in sending if recipient.contact_id in claimed]
+                    logger.warning(
+                        f"{len(duplicates)} recipients of batch {batch} of campaign {campaign_id} "
+                        f"were already claimed by an earlier send, skipped"
+                    )
+
+                # Create all email logs up front
+                email_logs = []
+                for recipient in sending:
+                    contact = recipient.contact
+                    email_logs.append(EmailLog(
+                        campaign=campaign,
+                        contact=contact,
+                        # Will be updated after sending
+                        message_id=send_keys.placeholder_message_id(campaign_id, contact.id, 1),
+                        subject=templates.subject.render(_build_template_data(contact)),
+                        from_email=campaign.from_email,
+                        to_email=contact.email,
+                        status='sending'
+                    ))
+
+                EmailLog.objects.bulk_create(email_logs)
+
+                # The row locks end with this transaction, the sending state
+                # keeps other workers off these recipients from then on
+                for recipient in sending:
+                    recipient.state = CampaignRecipient.STATE_SENDING
+                CampaignRecipient.objects.bulk_update(
+                    [recipient for recipient in recipients if recipient.state != CampaignRecipient.STATE_PENDING],
+                    ['state']
+                )
+
+                # Skipped recipients are finished once this commits, a resume
+                # from then on no longer counts them
+                skipped = counters['skipped']
+                if skipped:
+                    transaction.on_commit(lambda: _finish_batch(campaign_id, skipped))
+
+            except Campaign.DoesNotExist:
+                logger.error(f"Campaign {campaign_id} not found")
+                raise
+
+            except Exception as e:
+                logger.error(f"Error preparing batch {batch} for campaign {campaign_id}: {str(e)}")
+                if lane_slot:
+                    domain_lanes.release_slot(lane, lane_slot)
+                # Nothing was sent, the retry claims them again
+                send_keys.release(campaign_id, claimed)
+                # Giving up after the last retry, the recipients stay pending for a resume
+                release = self.request.retries >= self.max_retries
+                # Retry with exponential backoff, the claimed recipients are pending again
+                raise self.retry(exc=e, countdown=2 ** self.request.retries)
+
+        # Nothing is retried past this point, the batch has started sending.
+        # SES calls and rate limiter waits run outside of any transaction.
+        # If saving the results fails, its recipients are left sending and
+        # close_abandoned_batches_task fails them.
+        release = True
+        try:
+            if not email_logs:
+                results = []
+            elif campaign.delivery_mode == 'bulk_template' and ses.transport.supports_templates:
+                results = _send_batch_bulk_template(campaign, email_logs, ses, templates)
+            else:
+                results = _send_batch_individual(campaign, email_logs, ses, templates)
+        finally:
+            domain_lanes.release_slot(lane, lane_slot)
+
+        throttled_logs = []
+        retrying_logs = []
+        # Longest wait for local rate tokens, None if SES itself throttled
+        rate_wait = 0.0
+
+        # Map each result back onto its email log and recipient
+        for recipient, email_log, result in zip(sending, email_logs, results):
+            email_log.updated_at = timezone.now()
+
+            local = result.get('retry_after') is not None
+            if result.get('throttled') and (local or throttle_attempt < settings.SES_THROTTLE_MAX_RETRIES):
+                throttled_logs.append(email_log)
+                if not local:
+                    rate_wait = None
+                elif rate_wait is not None:
+                    rate_wait = max(rate_wait, result['retry_after'])
+                recipient.state = CampaignRecipient.STATE_PENDING
+                counters['deferred'] += 1
+            elif result['success']:
+                email_log.message_id = result['message_id']
+                email_log.status = 'sent'
+                email_log.sent_at = email_log.updated_at
+                recipient.state = CampaignRecipient.STATE_SENT
+                counters['sent'] += 1
+            else:
+                email_log.status = 'failed'
+                email_log.error_message = result['error']
+                if retry_queue.should_retry(result, email_log.attempt):
+                    email_log.next_retry_at = retry_queue.retry_at(email_log.attempt)
+                    retrying_logs.append(email_log)
+                recipient.state = CampaignRecipient.STATE_FAILED
+                counters['failed'] += 1
+
+        next_attempt = throttle_attempt
+        if throttled_logs:
+            if plan:
+                warmup.refund(plan, len(throttled_logs))
+            if rate_wait is None:
+                requeue_in = max(requeue_in or 0, _throttle_countdown(throttle_attempt))
+                next_attempt = throttle_attempt + 1
+            else:
+                # Only held back by the local rate limiter, not a throttle
+                requeue_in = max(requeue_in or 0, _rate_countdown(rate_wait))
+            throttled_ids = {email_log.id for email_log in throttled_logs}
+            email_logs = [email_log for email_log in email_logs if email_log.id not in throttled_ids]
+
+        with transaction.atomic():
+            if throttled_logs:
+                # Drop their logs and claims, they get new ones when the batch is retried
+                EmailLog.objects.filter(id__in=throttled_ids).delete()
+                throttled_contacts = [email_log.contact_id for email_log in throttled_logs]
+                transaction.on_commit(lambda: send_keys.release(campaign_id, throttled_contacts))
+
+            if requeue_in is not None:
+                transaction.on_commit(lambda: _requeue_batch(campaign_id, batch, next_attempt, requeue_in))
+
+            if retrying_logs:
+                transaction.on_commit(lambda: retry_queue.push(retrying_logs))
+
+            EmailLog.objects.bulk_update(
+                email_logs,
+                ['message_id', 'status', 'sent_at', 'error_message', 'next_retry_at', 'updated_at']
+            )
+            CampaignRecipient.objects.bulk_update(sending, ['state'])
+
+        # Deferred recipients are still pending, their retry reports them
+        release = not counters['deferred']
+
+        # Update campaign sent and failed counts
+        campaign_counters.increment_many({
+            campaign_id: {'sent_count': counters['sent'], 'failed_count': counters['failed']}
+        })
+        send_scheduler.record_sent(campaign_id, counters['sent'])
+
+        _finish_batch(campaign_id, counters['sent'] + counters['failed'])
+
+        logger.info(
+            f"Batch {batch} of campaign {campaign.name}: {counters['sent']} sent, "
+            f"{counters['failed']} failed, {counters['skipped']} skipped, "
+            f"{counters['deferred']} deferred"
+        )
+    finally:
+        # Outside of the transactions, so a rollback never loses it
+        if release:
+            _release_batch(campaign_id, batch)
 
-        # Check if contact is still valid
-        if not contact.is_subscribed or contact.is_suppressed:
-            logger.info(f"Skipping contact {contact.email} - unsubscribed or suppressed")
-            return
+    return counters
 
-        # Prepare template data
-        template_data = {
-            'name': contact.full_name or contact.first_name,
-            'email': contact.email,
-            'first_name': contact.first_name,
-            'last_name': contact.last_name,
-        }
-        # Add custom fields
-        template_data.update(contact.custom_fields)
-
-        # Render template
-        ses = SESService()
-        html_content = ses.render_template(campaign.template.html_content, template_data)
-        plain_text = ses.render_template(campaign.template.plain_text_content, template_data)
-        subject = ses.render_template(campaign.subject, template_data)
-
-        # Create email log
-        email_log = EmailLog.objects.create(
-            campaign=campaign,
-            contact=contact,
-            message_id='',  # Will be updated after sending
-            subject=subject,
-            from_email=campaign.from_email,
-            to_email=contact.email,
-            status='sending'
-        )
 
-        # Send email via SES
-        result = ses.send_email(
-            to_email=contact.email,
-            from_email=campaign.from_email,
-            from_name=campaign.from_name,
-            subject=subject,
-            html_content=html_content,
-            plain_text_content=plain_text
-        )
+@shared_task(bind=True, max_retries=3)
+def send_single_email_task(self, campaign_id, contact_id, attempt=1):
+    """
+    Send a single email
 
-        # Update email log based on result
-        if result['success']:
-            email_log.message_id = result['message_id']
-            email_log.status = 'sent'
-            email_log.sent_at = timezone.now()
-            email_log.save()
+    Retries of the task reuse its attempt, so they can't send it twice.
 
-            # Update campaign sent count
-            with transaction.atomic():
-                campaign.sent_count += 1
-                campaign.save()
+    Args:
+        campaign_id: ID of the campaign
+        contact_id: ID of the contact
+        attempt: Send attempt of the campaign to the contact
+    """
+    from apps.analytics.models import EmailLog
+    from apps.campaigns.models import Campaign
+    from apps.contacts.models import Contact
+    from apps.core.services import domain_lanes, retry_queue, sender_pool
+    from apps.core.services.ses_service import SESService
+    from apps.core.services.template_cache import get_campaign_templates
 
-            logger.info(f"Email sent to {contact.email} for campaign {campaign.name}")
+    try:
+        campaign = Campaign.objects.select_related('template').get(id=campaign_id)
 
-        else:
-            email_log.status = 'failed'
-            email_log.error_message = result['error']
-            email_log.save()
+        # Retries go on after the campaign completed, not while it is paused
+        if campaign.status not in ('sending', 'sent'):
+            if campaign.status == 'paused':
+                # Queued before the pause, it waits for the resume in the retry queue
+                retry_queue.postpone(EmailLog.objects.filter(
+                    campaign_id=campaign_id,
+                    contact_id=contact_id,
+                    attempt=attempt - 1,
+                    status='failed'
+                ).only('id'))
+            logger.info(f"Campaign {campaign_id} is {campaign.status}, attempt {attempt} to contact {contact_id} not sent")
+            return
 
-            logger.error(f"Failed to send email to {contact.email}: {result['error']}")
+        templates = get_campaign_templates(campaign)
+        contact = Contact.objects.get(id=contact_id)
 
-        # Check if campaign is complete
-        update_campaign_metrics_task.delay(campaign_id)
+        ses = SESService(
+            lane=domain_lanes.lane_for_email(contact.email),
+            shard=sender_pool.choose(campaign.from_email),
+            transport=campaign.transport or None
+        )
+        if not _send_campaign_email(campaign, contact, ses, attempt):
+            return
 
         return f"Email to {contact.email} processed"
 
@@ -146,6 +453,17 @@ def send_single_email_task(self, campaign_id, contact_id):
         logger.error(f"Contact {contact_id} not found")
         raise
 
+    except SendThrottled as e:
+        # Free the worker now and let the broker hold the retry
+        if e.retry_after is not None:
+            # Held back by the local rate limiter, not a failure: back once it has tokens
+            raise self.retry(exc=e, countdown=_rate_countdown(e.retry_after), max_retries=None)
+        raise self.retry(
+            exc=e,
+            countdown=_throttle_countdown(self.request.retries),
+            max_retries=settings.SES_THROTTLE_MAX_RETRIES
+        )
+
     except Exception as e:
         logger.error(f"Error sending email to contact {contact_id}: {str(e)}")
         # Retry with exponential backoff
@@ -170,40 +488,107 @@ def process_ses_notification_task(notification_data):
         raise
 
 
+@shared_task
+def consume_ses_notifications_task():
+    """
+    Apply the SES notifications queued by the webhook, in batches
+    """
+    from apps.core.services import ses_notifications
+
+    applied = ses_notifications.consume()
+    if applied:
+        logger.info(f"Processed {applied} SES notifications")
+    return f"Processed {applied} SES notifications"
+
+
 @shared_task
 def retry_failed_emails_task():
     """
-    Retry failed emails (max 3 attempts)
+    Send the next attempt of the failed emails whose retry is due
+
+    Runs every few seconds from beat and only pops the retry queue, failed
+    logs are never scanned. Enqueueing a retry twice is harmless, the
+    attempt is only sent once.
     """
     from apps.analytics.models import EmailLog
-    from datetime import timedelta
-
-    # Get failed emails from last 24 hours that have been retried < 3 times
-    cutoff_time = timezone.now() - timedelta(hours=24)
+    from apps.core.services import retry_queue
 
-    failed_logs = EmailLog.objects.filter(
-        status='failed',
-        created_at__gte=cutoff_time
-    ).select_related('campaign', 'contact')
+    # Put back retries Redis lost (eviction, a push that failed), re-adding
+    # the ones still queued is harmless
+    if retry_queue.rebuild_due():
+        retry_queue.rebuild()
 
     retry_count = 0
 
-    for email_log in failed_logs:
-        # Check how many times this email has been attempted
-        attempt_count = EmailLog.objects.filter(
-            campaign=email_log.campaign,
-            contact=email_log.contact
-        ).count()
+    while True:
+        email_log_ids = retry_queue.pop_due()
+        if not email_log_ids:
+            break
 
-        if attempt_count < 3:
-            # Retry sending
-            send_single_email_task.delay(email_log.campaign.id, email_log.contact.id)
-            retry_count += 1
+        email_logs = list(
+            EmailLog.objects
+            .filter(id__in=email_log_ids, status='failed', next_retry_at__isnull=False)
+            .select_related('campaign')
+            .only('id', 'attempt', 'contact_id', 'next_retry_at', 'campaign__status')
+        )
 
-    logger.info(f"Queued {retry_count} failed emails for retry")
+        # Paused campaigns keep their retries until they are resumed
+        paused = [
+            email_log for email_log in email_logs
+            if email_log.campaign and email_log.campaign.status == 'paused'
+        ]
+        paused_ids = {email_log.id for email_log in paused}
+        retry_queue.postpone(paused)
+
+        for email_log in email_logs:
+            if email_log.campaign and email_log.id not in paused_ids:
+                send_single_email_task.delay(email_log.campaign_id, email_log.contact_id, email_log.attempt + 1)
+                retry_count += 1
+
+        # Only the due ones: a retry that found its campaign paused meanwhile
+        # was postponed and keeps its new next_retry_at
+        EmailLog.objects.filter(
+            id__in=email_log_ids,
+            next_retry_at__lte=timezone.now()
+        ).exclude(id__in=paused_ids).update(next_retry_at=None)
+
+    if retry_count:
+        logger.info(f"Queued {retry_count} failed emails for retry")
     return f"Queued {retry_count} emails for retry"
 
 
+@shared_task
+def close_abandoned_batches_task():
+    """
+    Fail the recipients that lost batches left sending
+
+    Runs every minute from beat. A batch whose worker died between
+    calling SES and saving the results leaves recipients sending that no
+    batch will finish, which would keep their campaign from completing.
+    Once they are older than CAMPAIGN_BATCH_TIMEOUT_SECONDS they are
+    failed and reported to the completion latch. The scheduler runs too,
+    so batches whose in-flight entry timed out are dispatched again.
+    """
+    from datetime import timedelta
+
+    from apps.campaigns.models import Campaign
+    from apps.core.services import campaign_counters
+    from apps.core.services.recipient_snapshot import close_abandoned
+
+    older_than = timezone.now() - timedelta(seconds=settings.CAMPAIGN_BATCH_TIMEOUT_SECONDS)
+    closed = 0
+
+    for campaign_id in Campaign.objects.filter(status='sending').values_list('id', flat=True):
+        count = close_abandoned(campaign_id, older_than)
+        if count:
+            campaign_counters.increment(campaign_id, 'failed_count', count)
+            _finish_batch(campaign_id, count)
+            closed += count
+
+    schedule_send_batches_task.delay()
+    return f"Closed {closed} abandoned recipients"
+
+
 @shared_task
 def update_campaign_metrics_task(campaign_id):
     """
@@ -212,8 +597,8 @@ def update_campaign_metrics_task(campaign_id):
     Args:
         campaign_id: ID of the campaign
     """
-    from apps.campaigns.models import Campaign
-    from apps.analytics.models import EmailLog
+    from apps.campaigns.models import Campaign, CampaignRecipient
+    from apps.core.services.campaign_progress import complete_campaign
 
     try:
         campaign = Campaign.objects.get(id=campaign_id)
@@ -221,16 +606,331 @@ def update_campaign_metrics_task(campaign_id):
         if campaign.status != 'sending':
             return
 
-        # Check if all emails have been processed
-        total_logs = EmailLog.objects.filter(campaign=campaign).count()
-
-        if total_logs >= campaign.total_recipients:
-            # Mark campaign as complete
-            campaign.status = 'sent'
-            campaign.completed_at = timezone.now()
-            campaign.save()
+        # Done once no recipient is left to send: sent, failed and skipped
+        # all count, like they do for the progress latch
+        recipients = CampaignRecipient.objects.filter(campaign=campaign)
+        unfinished = recipients.filter(
+            state__in=[CampaignRecipient.STATE_PENDING, CampaignRecipient.STATE_SENDING]
+        )
 
-            logger.info(f"Campaign {campaign.name} completed")
+        if recipients.exists() and not unfinished.exists():
+            complete_campaign(campaign.id)
 
     except Campaign.DoesNotExist:
         logger.error(f"Campaign {campaign_id} not found")
+
+
+def _build_template_data(contact):
+    """Build the template variables for a contact"""
+    template_data = {
+        'name': contact.full_name or contact.first_name,
+        'email': contact.email,
+        'first_name': contact.first_name,
+        'last_name': contact.last_name,
+    }
+    # Add custom fields
+    template_data.update(contact.custom_fields)
+    return template_data
+
+
+def _finish_batch(campaign_id, count):
+    """Report recipients a batch is done with to the completion latch"""
+    from apps.core.services import campaign_progress
+
+    if campaign_progress.done(campaign_id, count) is None:
+        # Redis unavailable, fall back to counting the email logs
+        update_campaign_metrics_task.delay(campaign_id)
+
+
+def _schedule_pass():
+    """Publish pending batches until the slots are used up"""
+    from apps.campaigns.models import Campaign
+    from apps.core.services import campaign_progress, send_scheduler, warmup
+    from apps.core.services.broker_queues import queue_depth
+    from apps.core.services.recipient_snapshot import next_pending_batch
+
+    campaigns = list(
+        Campaign.objects
+        .filter(status='sending')
+        .only('id', 'from_email', 'priority', 'max_send_rate', 'dispatch_cursor')
+    )
+    send_scheduler.forget_inactive({campaign.id for campaign in campaigns})
+
+    inflight = {campaign.id: campaign_progress.inflight_batches(campaign.id) for campaign in campaigns}
+    total_inflight = sum(len(batches) for batches in inflight.values())
+    waiting = set()  # Campaigns with nothing to dispatch right now
+    retry_in = None
+    published = 0
+
+    # Senders that used up their warm-up window wait for the next one
+    plans = warmup.active_plans() if campaigns else {}
+    for campaign in campaigns:
+        plan = plans.get(warmup.sender_domain(campaign.from_email))
+        if plan:
+            wait = warmup.next_window_in(plan)
+            if wait:
+                waiting.add(campaign.id)
+                retry_in = wait if retry_in is None else min(retry_in, wait)
+
+    while total_inflight < settings.SCHEDULER_MAX_INFLIGHT_BATCHES:
+        eligible = [
+            campaign for campaign in campaigns
+            if campaign.id not in waiting
+            and len(inflight[campaign.id]) < settings.CAMPAIGN_DISPATCH_LOOKAHEAD
+        ]
+        if not eligible:
+            break
+
+        # Backpressure: leave the broker to drain before adding more
+        depth = queue_depth(settings.CAMPAIGN_SEND_QUEUE)
+        if depth is not None and depth >= settings.CAMPAIGN_DISPATCH_MAX_QUEUE_DEPTH:
+            logger.info(f"{depth} messages in '{settings.CAMPAIGN_SEND_QUEUE}', dispatch held back")
+            retry_in = settings.CAMPAIGN_DISPATCH_BACKOFF_SECONDS
+            break
+
+        campaign = send_scheduler.pick(eligible)
+
+        batch = next_pending_batch(campaign.id, campaign.dispatch_cursor, exclude=inflight[campaign.id])
+        if batch is None:
+            waiting.add(campaign.id)
+            continue
+
+        granted, wait = send_scheduler.reserve_rate(campaign, settings.CAMPAIGN_SEND_BATCH_SIZE)
+        if not granted:
+            # Over its max_send_rate, come back when it has budget again
+            waiting.add(campaign.id)
+            retry_in = wait if retry_in is None else min(retry_in, wait)
+            continue
+
+        # A capped campaign's batch runs once its max_send_rate paid for it
+        countdown = _countdown(wait) or None
+        campaign_progress.mark_inflight(campaign.id, batch, countdown or 0)
+        inflight[campaign.id].add(batch)
+        total_inflight += 1
+        campaign.dispatch_cursor = batch + 1
+        Campaign.objects.filter(id=campaign.id).update(dispatch_cursor=campaign.dispatch_cursor)
+        send_email_batch_task.apply_async(
+            (campaign.id, batch), countdown=countdown, queue=settings.CAMPAIGN_SEND_QUEUE
+        )
+        published += 1
+
+    if retry_in is not None:
+        schedule_send_batches_task.apply_async(countdown=_countdown(retry_in))
+
+    if published:
+        logger.info(f"Scheduler dispatched {published} batches, {total_inflight} in flight")
+
+
+def _release_batch(campaign_id, batch):
+    """Free the batch's dispatch slot and let the scheduler fill it"""
+    from apps.core.services import campaign_progress
+
+    campaign_progress.release_inflight(campaign_id, batch)
+    schedule_send_batches_task.delay()
+
+
+def _requeue_batch(campaign_id, batch, throttle_attempt, countdown):
+    """Run the batch again later, it stays in flight until then"""
+    from apps.core.services import campaign_progress
+
+    # A batch that comes back before its wait is over (the next warm-up
+    # window) finds nothing it may send yet and goes back for the rest
+    countdown = _countdown(countdown)
+    campaign_progress.mark_inflight(campaign_id, batch, countdown)
+    send_email_batch_task.apply_async(
+        (campaign_id, batch, throttle_attempt), countdown=countdown, queue=settings.CAMPAIGN_SEND_QUEUE
+    )
+
+
+def _countdown(seconds):
+    """Cap a task countdown below the broker's visibility timeout"""
+    return min(seconds, settings.TASK_MAX_COUNTDOWN_SECONDS)
+
+
+def _throttle_countdown(attempt):
+    """
+    Countdown before retrying a throttled send
+
+    Exponential backoff with jitter, so deferred sends from many workers
+    don't all come back at the same moment.
+    """
+    backoff = min(
+        settings.SES_THROTTLE_MAX_BACKOFF_SECONDS,
+        settings.SES_THROTTLE_BACKOFF_SECONDS * 2 ** attempt
+    )
+    return random.uniform(backoff / 2, backoff)
+
+
+def _rate_countdown(wait):
+    """Countdown of a send held back by the local rate limiter, jittered so workers don't all return at once"""
+    return wait * random.uniform(1.0, 1.5)
+
+
+def _send_batch_individual(campaign, email_logs, ses, templates):
+    """
+    Send one SES SendEmail call per email log
+
+    Stops at the first throttled send, the rest of the batch is reported
+    as throttled too instead of hammering SES.
+    """
+    results = []
+
+    for email_log in email_logs:
+        template_data = _build_template_data(email_log.contact)
+
+        # Send email via SES
+        result = ses.send_email(
+            to_email=email_log.to_email,
+            from_email=campaign.from_email,
+            from_name=campaign.from_name,
+            subject=email_log.subject,
+            html_content=templates.html.render(template_data),
+            plain_text_content=templates.text.render(template_data)
+        )
+        results.append(result)
+
+        if result.get('throttled'):
+            results.extend([result] * (len(email_logs) - len(results)))
+            break
+
+    return results
+
+
+def _send_batch_bulk_template(campaign, email_logs, ses, templates):
+    """
+    Send the batch through an SES stored template, 50 recipients per call
+
+    Every campaign has one SES template, updated when its content changes
+    and deleted by delete_finished_ses_templates_task once it is done.
+    """
+    template_name = f"campaign-{campaign.id}"
+    sync = ses.ensure_template(
+        template_name,
+        campaign.subject,
+        campaign.template.html_content,
+        campaign.template.plain_text_content
+    )
+    if not sync['success']:
+        return [
+            {'success': False, 'message_id': None, 'error': sync['error']}
+            for _ in email_logs
+        ]
+
+    # Variables a contact has no value for render as-is, like render_template
+    variables = templates.variables
+
+    return ses.send_bulk_templated_email(
+        from_email=campaign.from_email,
+        from_name=campaign.from_name,
+        template_name=template_name,
+        destinations=[
+            (email_log.to_email, _build_template_data(email_log.contact))
+            for email_log in email_logs
+        ],
+        default_template_data={name: f"${name}" for name in variables}
+    )
+
+
+def _send_campaign_email(campaign, contact, ses, attempt=1):
+    """
+    Render, log and send one campaign email
+
+    Each (campaign, contact, attempt) is sent at most once: the send is
+    claimed in Redis and its email log is unique, a duplicate is skipped.
+
+    Returns:
+        bool: False if the contact was skipped, True otherwise
+    """
+    from django.db import IntegrityError
+
+    from apps.analytics.models import EmailLog
+    from apps.campaigns.models import CampaignRecipient
+    from apps.core.services import campaign_counters, retry_queue, send_keys
+    from apps.core.services.template_cache import get_campaign_templates
+
+    # Check if contact is still valid
+    if not contact.is_subscribed or contact.is_suppressed:
+        logger.info(f"Skipping contact {contact.email} - unsubscribed or suppressed")
+        return False
+
+    if not send_keys.claim(campaign.id, contact.id, attempt):
+        logger.info(f"Attempt {attempt} to {contact.email} for campaign {campaign.id} already sent, skipping")
+        return False
+
+    # Prepare template data
+    template_data = _build_template_data(contact)
+
+    # Render template
+    subject, html_content, plain_text = get_campaign_templates(campaign).render(template_data)
+
+    # Create email log
+    try:
+        email_log = EmailLog.objects.create(
+            campaign=campaign,
+            contact=contact,
+            attempt=attempt,
+            # Will be updated after sending
+            message_id=send_keys.placeholder_message_id(campaign.id, contact.id, attempt),
+            subject=subject,
+            from_email=campaign.from_email,
+            to_email=contact.email,
+            status='sending'
+        )
+    except IntegrityError:
+        # Redis lost the claim, the log shows the attempt was made
+        logger.info(f"Attempt {attempt} to {contact.email} for campaign {campaign.id} already logged, skipping")
+        return False
+    except Exception:
+        send_keys.release(campaign.id, [contact.id], attempt)
+        raise
+
+    # Send email via SES
+    result = ses.send_email(
+        to_email=contact.email,
+        from_email=campaign.from_email,
+        from_name=campaign.from_name,
+        subject=subject,
+        html_content=html_content,
+        plain_text_content=plain_text
+    )
+
+    if result.get('throttled'):
+        # Not sent, the retry claims the attempt again and creates a new log
+        email_log.delete()
+        send_keys.release(campaign.id, [contact.id], attempt)
+        raise SendThrottled(result['error'], result.get('retry_after'))
+
+    # Update email log based on result
+    if result['success']:
+        email_log.message_id = result['message_id']
+        email_log.status = 'sent'
+        email_log.sent_at = timezone.now()
+        email_log.save()
+
+        # Update campaign sent count
+        campaign_counters.increment(campaign.id, 'sent_count')
+
+        # A retry that went through takes its recipient out of the failed ones
+        if attempt > 1:
+            recovered = CampaignRecipient.objects.filter(
+                campaign=campaign,
+                contact=contact,
+                state=CampaignRecipient.STATE_FAILED
+            ).update(state=CampaignRecipient.STATE_SENT)
+            campaign_counters.increment(campaign.id, 'failed_count', -recovered)
+
+        logger.info(f"Email sent to {contact.email} for campaign {campaign.name}")
+
+    else:
+        email_log.status = 'failed'
+        email_log.error_message = result['error']
+        if retry_queue.should_retry(result, attempt):
+            email_log.next_retry_at = retry_queue.retry_at(attempt)
+        email_log.save()
+
+        if email_log.next_retry_at:
+            retry_queue.push([email_log])
+
+        logger.error(f"Failed to send email to {contact.email}: {result['error']}")
+
+    return True
@@ -57,6 +57,38 @@ def check_scheduled_campaigns_task():
     return f"Processed {sent_count} scheduled campaigns"
 
 
+@shared_task
+def refresh_ses_quota_task():
+    """
+    Refresh the SES send quota and adaptive send rate of every sender shard (runs every minute)
+    """
+    from apps.core.services import sender_pool
+    from apps.core.services.ses_service import SESService
+
+    rates = {}
+    for shard in sender_pool.get_shards():
+        rate = SESService(shard=shard).refresh_send_rate()
+        if rate is not None:
+            rates[shard.name] = rate
+
+    if not rates:
+        return "Send rate unchanged"
+
+    return "Send rate set to " + ", ".join(f"{rate:.2f}/s ({name})" for name, rate in rates.items())
+
+
+@shared_task
+def flush_campaign_counters_task():
+    """
+    Write buffered campaign counters to the database (runs every few seconds)
+    """
+    from apps.core.services import campaign_counters
+
+    flushed = campaign_counters.flush()
+
+    return f"Flushed counters of {flushed} campaigns"
+
+
 @shared_task
 def cleanup_old_logs_task():
     """
@@ -78,6 +110,40 @@ def cleanup_old_logs_task():
     return f"Deleted {deleted_events[0]} events and {deleted_logs[0]} logs"
 
 
+@shared_task
+def delete_finished_ses_templates_task():
+    """
+    Delete the SES templates of campaigns that are done (runs hourly)
+    SES caps the templates of an account and every bulk_template campaign has one
+    """
+    from apps.campaigns.models import Campaign
+    from apps.core.services import sender_pool
+    from apps.core.services.ses_service import SESService
+
+    deleted = 0
+
+    for shard in sender_pool.get_shards():
+        ses = SESService(shard=shard, transport='ses')
+        campaign_ids = {
+            name: int(name.rsplit('-', 1)[1])
+            for name in ses.synced_templates()
+            if name.startswith('campaign-') and name.rsplit('-', 1)[1].isdigit()
+        }
+        active = set(
+            Campaign.objects
+            .filter(id__in=campaign_ids.values(), status__in=('scheduled', 'sending', 'paused'))
+            .values_list('id', flat=True)
+        )
+
+        for name, campaign_id in campaign_ids.items():
+            if campaign_id not in active and ses.delete_template(name)['success']:
+                deleted += 1
+
+    if deleted:
+        logger.info(f"Deleted {deleted} SES templates of finished campaigns")
+    return f"Deleted {deleted} SES templates"
+
+
 @shared_task
 def sync_suppression_list_task():
     """
@@ -17,6 +17,7 @@ export interface Campaign {
   completed_at: string | null
   total_recipients: number
   sent_count: number
+  failed_count: number
   delivered_count: number
   bounce_count: number
   complaint_count: number